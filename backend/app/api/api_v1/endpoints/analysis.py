@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional, List
 from pydantic import BaseModel
+from app.core import metrics
+from app.core.config import settings
+from app.models.batch import BatchJob
+from app.models.upload_job import UploadJob
 from app.models.user import User
 from app.services.ai_service import AIService
 from app.services.ocr_service import OCRService
-from app.services.speech_service import SpeechService
 from app.services.storage_service import StorageService
-from app.services import history_service
-from app.models.history import AnalysisHistoryCreate
+from app.services import admission, analysis_cache, batch_jobs, history_service, history_writer, ocr_cache, screenshot_merge, transcript_cache, upload_analysis, upload_jobs
 from app.api.deps import get_current_user
+import asyncio
 import json
 import logging
 import uuid
+from contextlib import ExitStack
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -23,6 +28,15 @@ class TextAnalysisRequest(BaseModel):
     additional_prompt: Optional[str] = None
     preset_id: Optional[str] = None
     temperature: Optional[float] = None
+    bypass_cache: bool = False
+
+class BatchAnalysisRequest(BaseModel):
+    texts: List[str]
+    additional_prompt: Optional[str] = None
+    preset_id: Optional[str] = None
+    temperature: Optional[float] = None
+    bypass_cache: bool = False
+    save_history: bool = True
 
 class ChatMessageRequest(BaseModel):
     message: str
@@ -43,87 +57,217 @@ async def analyze_text(
             text=request.text, 
             additional_prompt=request.additional_prompt,
             preset_id=request.preset_id,
-            temperature=request.temperature
+            temperature=request.temperature,
+            bypass_cache=request.bypass_cache
         )
         
         # Create history entry
         result = analysis_result["result"]
         
         # Save analysis to history
-        history_data = AnalysisHistoryCreate(
-            user_id=current_user.id,
-            title=f"Анализ текста {datetime.now().strftime('%d.%m.%Y')}",
-            file_type="text",
-            file_name="text_input.txt",
-            analysis_results=result,
-            dominant_emotion=result.get("emotionTimeline", {}).get("dominantEmotion", "Не определено"),
-            overall_score=result.get("aiJudgeScore", {}).get("overallScore", 0),
-            message_count=result.get("summary", {}).get("messageCount", 0),
-            participants=result.get("summary", {}).get("participants", 0)
+        history_data = history_service.history_entry_from_result(
+            current_user.id, f"Анализ текста {datetime.now().strftime('%d.%m.%Y')}", "text", "text_input.txt", result
         )
-        await history_service.save_analysis_history(history_data)
+        history_id = await history_writer.enqueue(history_data)
         
         # Явно возвращаем с полем result для совместимости
-        return {"result": result}
+        return {"result": result, "history_id": history_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/text/stream")
+async def analyze_text_stream(
+    request: TextAnalysisRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Analyze text and stream each result card as a Server-Sent Event"""
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    async def event_stream():
+        try:
+            result = {}
+            async for event in AIService.analyze_text_stream(
+                text=request.text,
+                additional_prompt=request.additional_prompt,
+                preset_id=request.preset_id,
+                temperature=request.temperature,
+                bypass_cache=request.bypass_cache
+            ):
+                if event["event"] == "card":
+                    yield sse("card", {"key": event["key"], "value": event["value"]})
+                elif event["event"] == "result":
+                    result = event["result"]
+            
+            # Save analysis to history
+            history_data = history_service.history_entry_from_result(
+                current_user.id, f"Анализ текста {datetime.now().strftime('%d.%m.%Y')}", "text", "text_input.txt", result
+            )
+            history_id = await history_writer.enqueue(history_data)
+            
+            yield sse("done", {"result": result, "history_id": history_id})
+        except Exception as e:
+            logger.error(f"Error in streaming text analysis: {str(e)}")
+            yield sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/batch", status_code=status.HTTP_202_ACCEPTED)
+async def create_batch_analysis(
+    request: BatchAnalysisRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Analyze many conversations in the background; returns the job id immediately"""
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="Список текстов пуст")
+    if len(request.texts) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Максимальное количество текстов в пакете: {settings.BATCH_MAX_ITEMS}")
+    if any(not text.strip() for text in request.texts):
+        raise HTTPException(status_code=400, detail="Пакет содержит пустой текст")
+    
+    job_id = await batch_jobs.submit(str(current_user.id), request.texts, {
+        "additional_prompt": request.additional_prompt,
+        "preset_id": request.preset_id,
+        "temperature": request.temperature,
+        "bypass_cache": request.bypass_cache,
+        "save_history": request.save_history
+    })
+    return {"job_id": job_id, "status": "pending", "total": len(request.texts)}
+
+@router.get("/batch/{job_id}", response_model=BatchJob)
+async def get_batch_analysis(
+    job_id: str,
+    include_results: bool = Query(True, description="Include analysis results of finished items"),
+    current_user: User = Depends(get_current_user)
+):
+    """Status of a batch job and of each of its items"""
+    job = await batch_jobs.get_job(job_id, str(current_user.id), include_results)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job
+
+@router.get("/batch/{job_id}/stream")
+async def stream_batch_analysis(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream finished batch items as Server-Sent Events until the job is done"""
+    user_id = str(current_user.id)
+    if not await batch_jobs.get_job(job_id, user_id, include_results=False):
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    async def event_stream():
+        sent = set()
+        while True:
+            # Poll statuses only; results are read once, for the items that just finished
+            job = await batch_jobs.get_job(job_id, user_id, include_results=False)
+            if not job:
+                yield sse("error", {"detail": "Batch job not found"})
+                return
+            finished = [
+                item.index for item in job.items
+                if item.index not in sent and item.status in ("done", "failed")
+            ]
+            if finished:
+                for item in await batch_jobs.get_items(job_id, finished):
+                    sent.add(item.index)
+                    yield sse("item", item.dict())
+            if batch_jobs.is_finished(job):
+                yield sse("done", json.loads(job.json(exclude={"items"})))
+                return
+            # The worker running the job died; fail it and report its items on the next poll
+            if batch_jobs.is_stale(job) and await batch_jobs.fail_stale(job_id):
+                continue
+            await asyncio.sleep(settings.BATCH_STREAM_POLL_SECONDS)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def public_demo_result(text: str) -> dict:
+    """Canned analysis served by the demo endpoint when Gemini is unavailable or busy"""
+    return {
+        "result": {
+            "summary": {
+                "overview": "Демо-анализ показал, что в разговоре преобладают позитивные эмоции. Участники демонстрируют хорошие коммуникативные навыки.",
+                "participants": 2,
+                "messageCount": len(text.split()),
+                "duration": "5 минут",
+                "mainTopics": ["Общение", "Эмоции", "Взаимопонимание"]
+            },
+            "emotionTimeline": {
+                "emotions": [
+                    { "time": "00:00", "emotion": "Радость", "intensity": 0.8, "color": "#10b981" },
+                    { "time": "00:02", "emotion": "Интерес", "intensity": 0.7, "color": "#3b82f6" },
+                    { "time": "00:04", "emotion": "Счастье", "intensity": 0.9, "color": "#f59e0b" }
+                ],
+                "dominantEmotion": "Счастье",
+                "emotionalShifts": 3
+            },
+            "aiJudgeScore": {
+                "overallScore": 85,
+                "breakdown": {
+                    "clarity": 90,
+                    "empathy": 85,
+                    "professionalism": 80,
+                    "resolution": 85
+                },
+                "verdict": "Отличное общение",
+                "recommendation": "Продолжайте в том же духе!"
+            },
+            "subtleties": [
+                {
+                    "type": "Эмоция",
+                    "message": "Обнаружены признаки искренней заинтересованности",
+                    "confidence": 0.9,
+                    "context": "Использование эмодзи и позитивных слов"
+                }
+            ]
+        }
+    }
+
 @router.post("/text/public")
-async def analyze_text_public(request: TextAnalysisRequest):
+async def analyze_text_public(request: TextAnalysisRequest, http_request: Request, response: Response):
     """Public text analysis endpoint for demo purposes (no authentication required)"""
-    try:
-        analysis_result = await AIService.analyze_text(
-            text=request.text, 
-            additional_prompt=request.additional_prompt,
-            preset_id=request.preset_id,
-            temperature=request.temperature
+    retry_after = admission.check_public_rate(http_request)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов. Попробуйте позже.",
+            headers={"Retry-After": str(retry_after)}
         )
+    
+    try:
+        async with admission.admit_public():
+            analysis_result = await AIService.analyze_text(
+                text=request.text, 
+                additional_prompt=request.additional_prompt,
+                preset_id=request.preset_id,
+                temperature=request.temperature,
+                bypass_cache=request.bypass_cache
+            )
         
         # Return result without saving to history
         result = analysis_result["result"]
         return {"result": result}
+    except admission.LoadShed as e:
+        # Over the public budget: answer right away instead of queueing behind Gemini
+        logger.warning(f"Public analysis shed ({e.reason})")
+        response.headers["Retry-After"] = str(e.retry_after)
+        return public_demo_result(request.text)
     except Exception as e:
         logger.error(f"Error in public text analysis: {str(e)}")
         # Return fallback analysis for demo
-        return {
-            "result": {
-                "summary": {
-                    "overview": "Демо-анализ показал, что в разговоре преобладают позитивные эмоции. Участники демонстрируют хорошие коммуникативные навыки.",
-                    "participants": 2,
-                    "messageCount": len(request.text.split()),
-                    "duration": "5 минут",
-                    "mainTopics": ["Общение", "Эмоции", "Взаимопонимание"]
-                },
-                "emotionTimeline": {
-                    "emotions": [
-                        { "time": "00:00", "emotion": "Радость", "intensity": 0.8, "color": "#10b981" },
-                        { "time": "00:02", "emotion": "Интерес", "intensity": 0.7, "color": "#3b82f6" },
-                        { "time": "00:04", "emotion": "Счастье", "intensity": 0.9, "color": "#f59e0b" }
-                    ],
-                    "dominantEmotion": "Счастье",
-                    "emotionalShifts": 3
-                },
-                "aiJudgeScore": {
-                    "overallScore": 85,
-                    "breakdown": {
-                        "clarity": 90,
-                        "empathy": 85,
-                        "professionalism": 80,
-                        "resolution": 85
-                    },
-                    "verdict": "Отличное общение",
-                    "recommendation": "Продолжайте в том же духе!"
-                },
-                "subtleties": [
-                    {
-                        "type": "Эмоция",
-                        "message": "Обнаружены признаки искренней заинтересованности",
-                        "confidence": 0.9,
-                        "context": "Использование эмодзи и позитивных слов"
-                    }
-                ]
-            }
-        }
+        return public_demo_result(request.text)
 
 @router.post("/upload")
 async def analyze_file(
@@ -131,82 +275,73 @@ async def analyze_file(
     additional_prompt: Optional[str] = Form(None),
     preset_id: Optional[str] = Form(None),
     temperature: Optional[float] = Form(None),
+    bypass_cache: bool = Form(False),
+    async_mode: bool = Query(False, alias="async", description="Queue the file and return 202 with a job id"),
     current_user: User = Depends(get_current_user)
 ):
     """Analyze uploaded file (text, image, or audio)"""
     try:
-        # Determine file type and process accordingly
-        file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
-        content_type = file.content_type or ""
-        
-        logger.info(f"Processing file: {file.filename}, extension: {file_extension}, content_type: {content_type}")
+        logger.info(f"Processing file: {file.filename}, content_type: {file.content_type}")
         
-        if file_extension in ["txt", "md", "doc", "docx"] or content_type.startswith("text/"):
-            # Text file
-            content = await file.read()
-            text = content.decode("utf-8")
-            logger.info(f"Extracted text from file: {len(text)} characters")
-            analysis_result = await AIService.analyze_text(text, additional_prompt, preset_id, temperature)
-        elif file_extension in ["jpg", "jpeg", "png", "gif", "bmp", "webp"] or content_type.startswith("image/"):
-            # Image file - use OCR
-            content = await file.read()
-            logger.info(f"Processing image file: {len(content)} bytes")
-            text = await OCRService.extract_text(content)
-            logger.info(f"Extracted text from image: {len(text)} characters")
-            
-            # Check if OCR failed
-            if not text or text.strip() == "" or text.startswith("Google Vision API не активирован") or text.startswith("Ошибка доступа"):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Ошибка OCR: {text}. Убедитесь, что Google Vision API активирован в проекте."
+        with ExitStack() as buffers:
+            with metrics.stage("file_read"):
+                # Determine file type from its content and check its size before reading it
+                try:
+                    file_type = upload_analysis.detect_file_type(file.filename, await upload_analysis.read_head(file))
+                    upload_analysis.check_size(file_type, file.size)
+                except upload_analysis.UploadError as e:
+                    raise HTTPException(status_code=e.status_code, detail=str(e))
+                
+                # The upload is already spooled; work on a view of it instead of reading it into memory
+                content = buffers.enter_context(upload_analysis.upload_buffer(file.file, file.size))
+            if async_mode:
+                job_id, deduplicated = await upload_jobs.submit(str(current_user.id), file.filename, file_type, content, {
+                    "additional_prompt": additional_prompt,
+                    "preset_id": preset_id,
+                    "temperature": temperature,
+                    "bypass_cache": bypass_cache
+                })
+                job = await upload_jobs.get_job(job_id, str(current_user.id))
+                return JSONResponse(
+                    status_code=status.HTTP_202_ACCEPTED,
+                    content={"job_id": job_id, "status": job.status, "stage": job.stage, "deduplicated": deduplicated},
+                    headers={"Location": f"{settings.API_V1_STR}/analysis/jobs/{job_id}"}
                 )
             
-            analysis_result = await AIService.analyze_text(text, additional_prompt, preset_id, temperature)
-        elif file_extension in ["mp3", "wav", "m4a", "ogg", "aac"] or content_type.startswith("audio/"):
-            # Audio file - use speech-to-text
-            content = await file.read()
-            logger.info(f"Processing audio file: {len(content)} bytes")
-            text = await SpeechService.transcribe_audio(content)
-            logger.info(f"Transcribed audio: {len(text)} characters")
-            analysis_result = await AIService.analyze_text(text, additional_prompt, preset_id, temperature)
-        elif file_extension == "pdf":
-            # PDF file - for now, treat as unsupported
-            raise HTTPException(status_code=400, detail="PDF файлы пока не поддерживаются. Пожалуйста, конвертируйте в изображение или текст.")
-        else:
-            raise HTTPException(status_code=400, detail=f"Неподдерживаемый тип файла: {file_extension}. Поддерживаются: изображения (jpg, png, gif, bmp), аудио (mp3, wav, m4a, ogg), текст (txt, md)")
+            try:
+                text = await upload_analysis.extract_text(file_type, content)
+            except upload_analysis.UploadError as e:
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+        analysis_result = await AIService.analyze_text(text, additional_prompt, preset_id, temperature, bypass_cache)
         
         # Create history entry
         result = analysis_result["result"]
         
-        # Determine file type from content type
-        file_type = "text"
-        if content_type.startswith("image/"):
-            file_type = "image"
-        elif content_type.startswith("audio/"):
-            file_type = "audio"
-            
         # Save analysis to history
-        history_data = AnalysisHistoryCreate(
-            user_id=current_user.id,
-            title=f"Анализ файла {file.filename}",
-            file_type=file_type,
-            file_name=file.filename,
-            analysis_results=result,
-            dominant_emotion=result.get("emotionTimeline", {}).get("dominantEmotion", "Не определено"),
-            overall_score=result.get("aiJudgeScore", {}).get("overallScore", 0),
-            message_count=result.get("summary", {}).get("messageCount", 0),
-            participants=result.get("summary", {}).get("participants", 0)
+        history_data = history_service.history_entry_from_result(
+            current_user.id, f"Анализ файла {file.filename}", file_type, file.filename, result
         )
-        await history_service.save_analysis_history(history_data)
+        history_id = await history_writer.enqueue(history_data)
         
         # Явно возвращаем с полем result для совместимости
-        return {"result": result}
+        return {"result": result, "history_id": history_id}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке файла: {str(e)}")
 
+@router.get("/jobs/{job_id}", response_model=UploadJob)
+async def get_upload_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Progress (queued -> ocr / transcription -> analysis -> saved) and result of an asynchronous upload"""
+    job = await upload_jobs.get_job(job_id, str(current_user.id))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @router.post("/upload-multiple")
 async def analyze_multiple_files(
     files: List[UploadFile] = File(...),
@@ -214,12 +349,13 @@ async def analyze_multiple_files(
     additional_prompt: Optional[str] = Form(None),
     preset_id: Optional[str] = Form(None),
     temperature: Optional[float] = Form(None),
+    bypass_cache: bool = Form(False),
     current_user: User = Depends(get_current_user)
 ):
     """Analyze multiple uploaded files (images) in order"""
     try:
-        if len(files) > 4:
-            raise HTTPException(status_code=400, detail="Максимальное количество файлов: 4")
+        if len(files) > settings.UPLOAD_MAX_IMAGES:
+            raise HTTPException(status_code=400, detail=f"Максимальное количество файлов: {settings.UPLOAD_MAX_IMAGES}")
         
         if len(files) == 0:
             raise HTTPException(status_code=400, detail="Не загружено ни одного файла")
@@ -230,63 +366,72 @@ async def analyze_multiple_files(
         file_order_ints = [int(order) for order in file_order]
         sorted_files = [files[i] for i in file_order_ints]
         
-        # Extract text from all images
-        all_texts = []
-        for i, file in enumerate(sorted_files):
-            file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
-            content_type = file.content_type or ""
-            
-            logger.info(f"Processing file {i+1}/{len(sorted_files)}: {file.filename}")
-            
-            if file_extension in ["jpg", "jpeg", "png", "gif", "bmp", "webp"] or content_type.startswith("image/"):
-                content = await file.read()
-                logger.info(f"Processing image file {i+1}: {len(content)} bytes")
-                text = await OCRService.extract_text(content)
-                logger.info(f"Extracted text from image {i+1}: {len(text)} characters")
-                
-                # Check if OCR failed
-                if not text or text.strip() == "" or text.startswith("Google Vision API не активирован") or text.startswith("Ошибка доступа"):
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Ошибка OCR в файле {i+1}: {text}. Убедитесь, что Google Vision API активирован в проекте."
-                    )
+        with ExitStack() as buffers:
+            with metrics.stage("file_read"):
+                # Validate all file types and sizes before doing any OCR work
+                for i, file in enumerate(sorted_files):
+                    if upload_analysis.sniff_file_type(await upload_analysis.read_head(file)) != "image":
+                        file_extension = file.filename.split(".")[-1].lower() if file.filename else ""
+                        raise HTTPException(status_code=400, detail=f"Неподдерживаемый тип файла {i+1}: {file_extension}. Поддерживаются только изображения.")
+                    try:
+                        upload_analysis.check_size("image", file.size)
+                    except upload_analysis.UploadError as e:
+                        raise HTTPException(status_code=e.status_code, detail=f"Файл {i+1}: {str(e)}")
                 
-                all_texts.append(text)
-            else:
-                raise HTTPException(status_code=400, detail=f"Неподдерживаемый тип файла {i+1}: {file_extension}. Поддерживаются только изображения.")
+                # Views of the spooled uploads, not copies
+                contents = [buffers.enter_context(upload_analysis.upload_buffer(file.file, file.size)) for file in sorted_files]
+            
+            # OCR all images in one batched request, keeping file_order
+            logger.info(f"Processing {len(contents)} image files: {[len(content) for content in contents]} bytes")
+            ocr_results = await OCRService.extract_text_from_images(contents)
+        all_texts = OCRService.texts_from_results(ocr_results)
+        
+        # Fail on the first image whose OCR failed or found no text
+        for i, (text, ocr_result) in enumerate(zip(all_texts, ocr_results)):
+            logger.info(f"Extracted text from image {i+1}: {len(text)} characters")
+            if OCRService.is_failed(ocr_result):
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Ошибка OCR в файле {i+1}: {text.strip() or 'Не удалось извлечь текст из изображения'}. Убедитесь, что Google Vision API активирован в проекте."
+                )
         
-        # Combine all texts with separators
-        combined_text = "\n\n--- НОВАЯ ЧАСТЬ РАЗГОВОРА ---\n\n".join(all_texts)
-        logger.info(f"Combined text from {len(all_texts)} files: {len(combined_text)} characters")
+        # The same screenshot uploaded twice adds nothing to the conversation
+        all_texts = [
+            text for text, ocr_result in zip(all_texts, ocr_results)
+            if ocr_result.get("preprocessing", {}).get("duplicate_of") is None
+        ]
+        
+        # Stitch consecutive screenshots into one transcript; parts that do not overlap get a separator
+        combined_text, dropped_lines = screenshot_merge.merge_screenshot_texts(all_texts)
+        logger.info(f"Combined text from {len(all_texts)} files: {len(combined_text)} characters, {dropped_lines} overlapping lines dropped")
         
         # Analyze combined text
-        analysis_result = await AIService.analyze_text(combined_text, additional_prompt, preset_id, temperature)
+        analysis_result = await AIService.analyze_text(combined_text, additional_prompt, preset_id, temperature, bypass_cache)
         
         # Create history entry
         result = analysis_result["result"]
         
         # Save analysis to history
-        history_data = AnalysisHistoryCreate(
-            user_id=current_user.id,
-            title=f"Анализ {len(files)} изображений",
-            file_type="multi-image",
-            file_name=f"{len(files)} files",
-            analysis_results=result,
-            dominant_emotion=result.get("emotionTimeline", {}).get("dominantEmotion", "Не определено"),
-            overall_score=result.get("aiJudgeScore", {}).get("overallScore", 0),
-            message_count=result.get("summary", {}).get("messageCount", 0),
-            participants=result.get("summary", {}).get("participants", 0)
+        history_data = history_service.history_entry_from_result(
+            current_user.id, f"Анализ {len(files)} изображений", "multi-image", f"{len(files)} files", result
         )
-        await history_service.save_analysis_history(history_data)
+        history_id = await history_writer.enqueue(history_data)
         
         # Явно возвращаем с полем result для совместимости
-        return {"result": result}
+        return {"result": result, "history_id": history_id}
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing multiple files: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке файлов: {str(e)}")
 
+@router.get("/cache/stats")
+async def get_analysis_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """Hit/miss counters of the analysis result, OCR and transcript caches for this worker"""
+    return {**analysis_cache.stats(), "ocr": ocr_cache.stats(), "transcripts": transcript_cache.stats()}
+
 @router.post("/chat")
 async def chat_with_ai(
     request: ChatMessageRequest,
@@ -1,21 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Response
+from typing import List, Dict, Any, Optional
 from uuid import UUID
 
 from app.models.history import AnalysisHistoryItem, AnalysisHistory
-from app.services import history_service
+from app.services import history_service, history_writer
 from app.api.deps import get_current_user
 from app.models.user import User
 
 router = APIRouter()
 
+# Page size when a cursor is given without a limit
+DEFAULT_PAGE_SIZE = 50
+
 @router.get("/", response_model=List[AnalysisHistoryItem])
 async def get_history(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Maximum number of items to return"),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    include_total: bool = Query(False, description="Return the total item count in X-Total-Count"),
     current_user: User = Depends(get_current_user),
 ):
-    """Get analysis history for the current user"""
-    history = await history_service.get_user_analysis_history(current_user.id)
-    return history
+    """Get analysis history for the current user, newest first.
+
+    The body stays a plain list; pagination metadata is returned in the
+    X-Next-Cursor and X-Total-Count headers. Without limit and cursor the whole
+    history is returned, as older clients expect.
+    """
+    if limit is None and cursor:
+        limit = DEFAULT_PAGE_SIZE
+    try:
+        page = await history_service.get_user_analysis_history(
+            current_user.id, limit=limit, cursor=cursor, include_total=include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
+    return page.items
 
 @router.get("/{history_id}", response_model=AnalysisHistory)
 async def get_analysis_detail(
@@ -23,7 +47,10 @@ async def get_analysis_detail(
     current_user: User = Depends(get_current_user),
 ):
     """Get detailed analysis by id"""
-    analysis = await history_service.get_analysis_detail(history_id, current_user.id)
+    # Entries queued in this worker may not have reached the database yet
+    analysis = history_writer.get_pending(str(history_id), str(current_user.id))
+    if not analysis:
+        analysis = await history_service.get_analysis_detail(history_id, current_user.id)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     return analysis
@@ -2,8 +2,10 @@ from typing import Generator, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from app.core import metrics
 from app.db.supabase import get_supabase_client, get_supabase_admin_client
 from app.models.user import User
+from app.services import user_cache
 import logging
 import json
 
@@ -12,6 +14,11 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     """Get the current authenticated user"""
+    with metrics.stage("auth"):
+        return await resolve_user(token)
+
+async def resolve_user(token: str) -> User:
+    """Resolve the user behind a Supabase access token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -41,6 +48,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
             
             logger.info(f"User ID from JWT: {user_id}")
             
+            # Skip the users table lookup when this token was resolved recently
+            token_exp = decoded.get('exp')
+            cached_user = user_cache.get_cached_user(user_id, token_exp)
+            if cached_user is not None:
+                return cached_user
+            
             # Get user data from database using admin client to bypass RLS
             supabase_admin = get_supabase_admin_client()
             response = supabase_admin.table("users").select("*").eq("id", user_id).execute()
@@ -65,7 +78,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
                     supabase_admin.table("users").insert(user_data_dict).execute()
                     logger.info("User profile created successfully")
                     
-                    return User(**user_data_dict)
+                    user = User(**user_data_dict)
+                    user_cache.cache_user(user_id, token_exp, user)
+                    return user
                     
                 except Exception as create_error:
                     logger.error(f"Failed to create user profile: {create_error}")
@@ -74,7 +89,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
             user_data = response.data[0]
             logger.info(f"User data: {user_data}")
             
-            return User(**user_data)
+            user = User(**user_data)
+            user_cache.cache_user(user_id, token_exp, user)
+            return user
             
         except JWTError as jwt_error:
             logger.error(f"JWT decode error: {jwt_error}")
@@ -22,12 +22,117 @@ class Settings(BaseSettings):
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     SUPABASE_SERVICE_ROLE_KEY: Optional[str] = None
+    SUPABASE_POOL_MAX_CONNECTIONS: int = 20
+    SUPABASE_POOL_MAX_KEEPALIVE: int = 10
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = 60.0
+    
+    # Authenticated-user cache (per worker)
+    AUTH_USER_CACHE_TTL_SECONDS: int = 300
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
     
     # Google Cloud Configuration
     GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = None
     VERTEX_AI_PROJECT: str
     VERTEX_AI_LOCATION: str = "us-central1"
-    
+
+    VERTEX_AI_MODEL: str = "gemini-2.5-pro"
+
+    # LLM execution (per worker)
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_WARMUP_ON_STARTUP: bool = True
+
+    # Pooled Google Vision / Speech gRPC channels
+    GRPC_KEEPALIVE_TIME_MS: int = 30000
+    GRPC_KEEPALIVE_TIMEOUT_MS: int = 10000
+
+    # Node-local storage shared by all workers (caches, queues)
+    LOCAL_DATA_DIR: str = ".local_data"
+    # Local caches are used on the event loop: waiting longer for a lock than this is a miss
+    LOCAL_CACHE_BUSY_TIMEOUT_SECONDS: float = 0.05
+
+    # Analysis result cache
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANALYSIS_CACHE_MEMORY_ENTRIES: int = 256
+    ANALYSIS_CACHE_DISK_ENTRIES: int = 10000
+
+    # Long conversations are analyzed in chunks of this many (estimated) tokens
+    ANALYSIS_CHUNK_TOKEN_BUDGET: int = 8000
+    ANALYSIS_MAX_CHUNKS: int = 16
+
+    # Background (write-behind) history writer
+    HISTORY_WRITER_BATCH_SIZE: int = 50
+    HISTORY_WRITER_FLUSH_INTERVAL_SECONDS: float = 0.5
+    HISTORY_WRITER_MAX_PENDING: int = 5000
+    HISTORY_WRITER_MAX_ATTEMPTS: int = 5
+    HISTORY_WRITER_RETRY_BASE_SECONDS: float = 0.5
+    HISTORY_WRITER_RETRY_MAX_SECONDS: float = 10.0
+    HISTORY_WRITER_SHUTDOWN_TIMEOUT_SECONDS: float = 15.0
+
+    # Batch analysis jobs
+    BATCH_MAX_ITEMS: int = 100
+    BATCH_MAX_CONCURRENCY: int = 4
+    BATCH_JOB_TTL_SECONDS: int = 7 * 24 * 3600
+    BATCH_STREAM_POLL_SECONDS: float = 1.0
+    # A running job not touched for this long lost its worker (crash, OOM kill) and is failed
+    BATCH_JOB_STALE_SECONDS: int = 300
+
+    # Image preparation before OCR (process pool per worker)
+    OCR_PREPROCESS_ENABLED: bool = True
+    OCR_PREPROCESS_PROCESSES: int = 2
+    # Lines of text are scaled down to about this height; Vision reads them well at 16-24 px
+    OCR_TARGET_TEXT_HEIGHT_PX: int = 20
+    OCR_MAX_IMAGE_SIDE_PX: int = 2048
+    # Screenshots whose perceptual hashes differ in at most this many of 256 bits are near-duplicates
+    OCR_NEAR_DUPLICATE_DISTANCE: int = 12
+
+    # OCR result cache keyed by image content (shared by all workers on a node)
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_MAX_ENTRIES: int = 20000
+    OCR_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+
+    # Transcript cache keyed by audio content and recognition config (shared by all workers on a node)
+    TRANSCRIPT_CACHE_ENABLED: bool = True
+    TRANSCRIPT_CACHE_MAX_ENTRIES: int = 5000
+    TRANSCRIPT_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+
+    # Upload size limits per file type (Vision and Speech accept at most 10 MB inline)
+    UPLOAD_MAX_TEXT_BYTES: int = 1024 * 1024
+    UPLOAD_MAX_IMAGE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_MAX_AUDIO_BYTES: int = 10 * 1024 * 1024
+    # Screenshots per multi-image upload; overlapping ones are merged, so more do not repeat messages
+    UPLOAD_MAX_IMAGES: int = 10
+
+    # Durable queue for asynchronous file uploads (?async=true)
+    UPLOAD_JOB_WORKERS: int = 2
+    UPLOAD_JOB_POLL_SECONDS: float = 1.0
+    UPLOAD_JOB_LEASE_SECONDS: float = 600.0
+    UPLOAD_JOB_MAX_ATTEMPTS: int = 3
+    UPLOAD_JOB_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Coalescing of identical in-flight analyses; the cross-worker lock needs fcntl (Linux/macOS)
+    SINGLE_FLIGHT_CROSS_WORKER: bool = False
+    SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS: float = 150.0
+    SINGLE_FLIGHT_LOCK_POLL_SECONDS: float = 0.1
+
+    # Admission control for the unauthenticated demo endpoint (per worker)
+    PUBLIC_RATE_LIMIT_PER_MINUTE: float = 6.0
+    PUBLIC_RATE_LIMIT_BURST: float = 3.0
+    PUBLIC_RATE_LIMIT_MAX_CLIENTS: int = 10000
+    PUBLIC_MAX_CONCURRENCY: int = 2
+    PUBLIC_MAX_WAITING: int = 4
+    PUBLIC_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    PUBLIC_SHED_RETRY_AFTER_SECONDS: int = 10
+    # Proxies in front of the app that append to X-Forwarded-For (1 for the Heroku router)
+    PUBLIC_TRUSTED_PROXY_HOPS: int = 1
+
+    # Chat conversation store: "sqlite" (shared by all workers on a node) or "memory"
+    CHAT_STORE_BACKEND: str = "sqlite"
+    CHAT_CONVERSATION_TTL_SECONDS: int = 24 * 3600
+    CHAT_MAX_CONVERSATIONS: int = 10000
+    CHAT_HISTORY_TOKEN_BUDGET: int = 4000
+
     class Config:
         env_file = ".env"
         case_sensitive = True
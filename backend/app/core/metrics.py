@@ -0,0 +1,215 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.routing import Match
+from app.models.preset import PRESETS_BY_ID
+from app.services.tokens import CHARS_PER_TOKEN
+
+# Latency buckets from a cached lookup up to a slow multi-chunk LLM analysis
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "gossipai_request_duration_seconds",
+    "End-to-end request latency",
+    ["endpoint", "preset_id", "outcome"],
+    buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "gossipai_stage_duration_seconds",
+    "Latency of one pipeline stage within a request",
+    ["endpoint", "stage", "preset_id", "outcome"],
+    buckets=STAGE_BUCKETS
+)
+LLM_PROMPT_CHARS = Counter(
+    "gossipai_llm_prompt_characters_total",
+    "Characters sent to the LLM",
+    ["endpoint", "preset_id"]
+)
+LLM_RESPONSE_CHARS = Counter(
+    "gossipai_llm_response_characters_total",
+    "Characters received from the LLM",
+    ["endpoint", "preset_id"]
+)
+LLM_PROMPT_TOKENS = Counter(
+    "gossipai_llm_prompt_tokens_estimated_total",
+    "Estimated tokens sent to the LLM",
+    ["endpoint", "preset_id"]
+)
+LLM_RESPONSE_TOKENS = Counter(
+    "gossipai_llm_response_tokens_estimated_total",
+    "Estimated tokens received from the LLM",
+    ["endpoint", "preset_id"]
+)
+ANALYSIS_OUTCOMES = Counter(
+    "gossipai_analysis_total",
+    "Analyses by outcome (success, cached, parse_fallback, partial, mock_fallback)",
+    ["endpoint", "preset_id", "outcome"]
+)
+
+LLM_JSON_PARSES = Counter(
+    "gossipai_llm_json_parse_total",
+    "JSON documents parsed from LLM output (clean, repaired, salvaged, invalid, unparseable)",
+    ["kind", "outcome"]
+)
+
+LLM_JSON_DROPPED = Counter(
+    "gossipai_llm_json_dropped_total",
+    "Invalid fields and list items dropped from an LLM JSON document that was kept",
+    ["model", "part"]
+)
+
+OCR_PREPROCESS_SECONDS = Histogram(
+    "gossipai_ocr_preprocess_seconds",
+    "Time to prepare one image for OCR (decode, downscale, grayscale, re-encode)",
+    buckets=STAGE_BUCKETS
+)
+OCR_IMAGE_BYTES = Counter(
+    "gossipai_ocr_image_bytes_total",
+    "Image bytes before (received) and after (sent) OCR preprocessing",
+    ["direction"]
+)
+OCR_CACHE_LOOKUPS = Counter(
+    "gossipai_ocr_cache_lookups_total",
+    "OCR cache lookups by outcome (hit rate = hit / all)",
+    ["outcome"]
+)
+TRANSCRIPT_CACHE_LOOKUPS = Counter(
+    "gossipai_transcript_cache_lookups_total",
+    "Transcript cache lookups by outcome (hit rate = hit / all)",
+    ["outcome"]
+)
+OCR_DUPLICATE_IMAGES = Counter(
+    "gossipai_ocr_duplicate_images_total",
+    "Images that duplicate another image of the same request (exact, near)",
+    ["kind"]
+)
+
+# Labels of the request being served; the dict is shared with the middleware,
+# so values set deep in the pipeline are visible when the request is recorded
+_request_labels: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_labels", default=None)
+
+def _labels() -> Dict[str, Any]:
+    return _request_labels.get() or {"endpoint": "background", "preset_id": "none", "outcome": None}
+
+def _preset_label(preset_id: Optional[str]) -> str:
+    """Known preset ids only, so user input cannot blow up label cardinality"""
+    if not preset_id:
+        return "none"
+    return preset_id if preset_id in PRESETS_BY_ID else "unknown"
+
+def set_preset(preset_id: Optional[str]) -> None:
+    """Attach the analysis preset to the current request's metrics"""
+    _labels()["preset_id"] = _preset_label(preset_id)
+
+def current_outcome() -> Optional[str]:
+    return _labels()["outcome"]
+
+def record_outcome(outcome: str) -> None:
+    """Count an analysis outcome and use it as the request's outcome label"""
+    labels = _labels()
+    labels["outcome"] = outcome
+    ANALYSIS_OUTCOMES.labels(labels["endpoint"], labels["preset_id"], outcome).inc()
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time one pipeline stage of the current request"""
+    labels = _labels()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.labels(labels["endpoint"], name, labels["preset_id"], outcome).observe(
+            time.perf_counter() - started
+        )
+
+def count_llm_io(prompt_chars: int, response_chars: int) -> None:
+    """Count LLM traffic in characters and estimated tokens"""
+    labels = _labels()
+    endpoint, preset_id = labels["endpoint"], labels["preset_id"]
+    LLM_PROMPT_CHARS.labels(endpoint, preset_id).inc(prompt_chars)
+    LLM_RESPONSE_CHARS.labels(endpoint, preset_id).inc(response_chars)
+    LLM_PROMPT_TOKENS.labels(endpoint, preset_id).inc(prompt_chars / CHARS_PER_TOKEN)
+    LLM_RESPONSE_TOKENS.labels(endpoint, preset_id).inc(response_chars / CHARS_PER_TOKEN)
+
+def count_json_parse(kind: str, outcome: str) -> None:
+    """Count how a JSON response of the LLM was parsed (repair rate = repaired / all)"""
+    LLM_JSON_PARSES.labels(kind, outcome).inc()
+
+def count_json_dropped(model: str, part: str, count: int = 1) -> None:
+    """Count fields ("field") or list items ("item") dropped from model output instead of failing it"""
+    LLM_JSON_DROPPED.labels(model, part).inc(count)
+
+def count_ocr_image(bytes_in: int, bytes_out: int, seconds: Optional[float]) -> None:
+    """Record the preprocessing of one image (bytes saved = received - sent)"""
+    OCR_IMAGE_BYTES.labels("received").inc(bytes_in)
+    OCR_IMAGE_BYTES.labels("sent").inc(bytes_out)
+    if seconds is not None:
+        OCR_PREPROCESS_SECONDS.observe(seconds)
+
+def count_ocr_cache(outcome: str) -> None:
+    OCR_CACHE_LOOKUPS.labels(outcome).inc()
+
+def count_transcript_cache(outcome: str) -> None:
+    TRANSCRIPT_CACHE_LOOKUPS.labels(outcome).inc()
+
+def count_duplicate_image(kind: str) -> None:
+    OCR_DUPLICATE_IMAGES.labels(kind).inc()
+
+def _route_template(scope: Dict[str, Any]) -> str:
+    """Path template of the matching route (e.g. /api/v1/history/{history_id})"""
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware that records request latency and sets up per-request labels"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = {"endpoint": _route_template(scope), "preset_id": "none", "outcome": None}
+        token = _request_labels.set(labels)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if status_code >= 400:
+                outcome = f"http_{status_code}"
+            else:
+                outcome = labels["outcome"] or "ok"
+            REQUEST_SECONDS.labels(labels["endpoint"], labels["preset_id"], outcome).observe(
+                time.perf_counter() - started
+            )
+            _request_labels.reset(token)
+
+def render_latest() -> tuple:
+    """Metrics exposition for /metrics; aggregates all workers in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,91 @@
+import json
+from typing import Dict, Optional
+from app.core.config import settings
+
+# Form fields and multipart boundaries around the file content
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+def max_file_bytes(file_type: str) -> int:
+    """Largest accepted upload of a file type ('text', 'image' or 'audio')"""
+    return {
+        "text": settings.UPLOAD_MAX_TEXT_BYTES,
+        "image": settings.UPLOAD_MAX_IMAGE_BYTES,
+        "audio": settings.UPLOAD_MAX_AUDIO_BYTES
+    }[file_type]
+
+def _body_limits() -> Dict[str, int]:
+    single = max(max_file_bytes(file_type) for file_type in ("text", "image", "audio"))
+    return {
+        f"{settings.API_V1_STR}/analysis/upload": single + FORM_OVERHEAD_BYTES,
+        f"{settings.API_V1_STR}/analysis/upload-multiple":
+            settings.UPLOAD_MAX_IMAGES * settings.UPLOAD_MAX_IMAGE_BYTES + FORM_OVERHEAD_BYTES
+    }
+
+class _BodyTooLarge(Exception):
+    pass
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware that rejects oversized upload requests with 413.
+
+    A declared Content-Length over the limit is refused before any of the body
+    is read; a body without one is cut off as soon as it passes the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.limits = _body_limits()
+
+    async def __call__(self, scope, receive, send):
+        limit: Optional[int] = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        too_large = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def send_unless_rejected(message):
+            nonlocal started
+            # The app answers the aborted body with its own parse error; 413 goes out instead
+            if too_large and not started:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_unless_rejected)
+        except Exception:
+            if not too_large or started:
+                raise
+        if too_large and not started:
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = json.dumps(
+            {"detail": f"Слишком большой запрос. Максимум: {limit // (1024 * 1024)} МБ"}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def connect_local_db(name: str, timeout: float = 10) -> sqlite3.Connection:
+    """Open a node-local SQLite database shared by all workers on this machine.
+
+    `timeout` is how long a statement waits for another worker's lock.
+    """
+    os.makedirs(settings.LOCAL_DATA_DIR, exist_ok=True)
+    path = os.path.join(settings.LOCAL_DATA_DIR, f"{name}.sqlite3")
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+    # WAL lets readers in other workers proceed while one worker writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class CacheBusy(Exception):
+    """The cache is locked by another thread or worker"""
+
+def _is_busy(e: Exception) -> bool:
+    if isinstance(e, CacheBusy):
+        return True
+    # Extended result codes (SQLITE_BUSY_SNAPSHOT, ...) keep the primary code in the low byte
+    code = getattr(e, "sqlite_errorcode", None)
+    return (
+        isinstance(e, sqlite3.OperationalError) and code is not None
+        and (code & 0xff) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    )
+
+class SQLiteCache:
+    """Persistent key/value cache with TTL and LRU eviction by entry count.
+
+    Callers run on the event loop, so locks are waited for only briefly
+    (LOCAL_CACHE_BUSY_TIMEOUT_SECONDS): a busy cache is a miss, and a write
+    to it is skipped.
+    """
+
+    # Eviction runs every N writes instead of on every insert
+    EVICT_EVERY = 64
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.busy = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_local_db(self.name, timeout=settings.LOCAL_CACHE_BUSY_TIMEOUT_SECONDS)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+            # Kept only once the schema exists, so a busy first attempt is simply retried
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _locked(self) -> Iterator[sqlite3.Connection]:
+        if not self._lock.acquire(timeout=settings.LOCAL_CACHE_BUSY_TIMEOUT_SECONDS):
+            raise CacheBusy()
+        try:
+            yield self._db()
+        finally:
+            self._lock.release()
+
+    def _failed(self, action: str, e: Exception) -> None:
+        if _is_busy(e):
+            self.busy += 1
+            logger.warning(f"Local cache '{self.name}' busy, {action} skipped")
+        else:
+            logger.error(f"Local cache '{self.name}' {action} failed: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            with self._locked() as db:
+                row = db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] >= now:
+                    try:
+                        db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    except sqlite3.OperationalError as e:
+                        # Another worker is writing; the entry is merely a little older for eviction
+                        if not _is_busy(e):
+                            raise
+                elif row is not None:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except Exception as e:
+            self._failed("read", e)
+            self.misses += 1
+            return None
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            with self._locked() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, now + ttl, now)
+                )
+                self._writes += 1
+                if self._writes % self.EVICT_EVERY == 0:
+                    self._evict(db, now)
+        except Exception as e:
+            self._failed("write", e)
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._locked() as db:
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except Exception as e:
+            self._failed("delete", e)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        db.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "busy": self.busy
+        }
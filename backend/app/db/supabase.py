@@ -1,22 +1,82 @@
-import os
 import logging
+import threading
+from typing import Optional
+import httpx
+from postgrest.utils import SyncClient
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Per-worker client instances, created on first use and reused by every request
+_client: Optional[Client] = None
+_admin_client: Optional[Client] = None
+_lock = threading.Lock()
+
+def _create_pooled_client(key: str) -> Client:
+    """Create a Supabase client whose PostgREST session keeps pooled keep-alive connections"""
+    client = create_client(
+        settings.SUPABASE_URL,
+        key,
+        ClientOptions(persist_session=False, auto_refresh_token=False)
+    )
+
+    # Swap the default PostgREST session for one with explicit pool limits
+    default_session = client.postgrest.session
+    client.postgrest.session = SyncClient(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        timeout=default_session.timeout,
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY
+        )
+    )
+    default_session.close()
+    return client
+
 def get_supabase_client() -> Client:
     """Get Supabase client with anon key"""
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _create_pooled_client(settings.SUPABASE_ANON_KEY)
+    return _client
 
 def get_supabase_admin_client() -> Client:
     """Get Supabase client with service role key for admin operations"""
-    # Use service role key if available, otherwise use anon key
-    service_role_key = settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
-    
-    if settings.SUPABASE_SERVICE_ROLE_KEY:
-        logger.info("Using Service Role Key for admin operations")
-    else:
-        logger.warning("Service Role Key not found, using Anon Key")
-    
-    return create_client(settings.SUPABASE_URL, service_role_key)
+    global _admin_client
+    if _admin_client is None:
+        with _lock:
+            if _admin_client is None:
+                # Use service role key if available, otherwise use anon key
+                service_role_key = settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
+
+                if settings.SUPABASE_SERVICE_ROLE_KEY:
+                    logger.info("Using Service Role Key for admin operations")
+                else:
+                    logger.warning("Service Role Key not found, using Anon Key")
+
+                _admin_client = _create_pooled_client(service_role_key)
+    return _admin_client
+
+def create_supabase_auth_client() -> Client:
+    """Create a short-lived Supabase client for sign-up / sign-in flows.
+
+    The GoTrue client keeps the signed-in session in memory, so auth flows must
+    not share the pooled per-worker clients.
+    """
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY, ClientOptions())
+
+def close_supabase_clients() -> None:
+    """Close pooled HTTP connections (called on shutdown)"""
+    global _client, _admin_client
+    with _lock:
+        for client in (_client, _admin_client):
+            if client is not None:
+                client.postgrest.session.close()
+        _client = None
+        _admin_client = None
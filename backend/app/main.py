@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.api_v1.api import api_router
+from app.core import metrics
 from app.core.config import settings
+from app.core.upload_limits import BodySizeLimitMiddleware
+from app.db.supabase import close_supabase_clients
+from app.services import batch_jobs, google_clients, history_writer, image_preprocessing, upload_jobs, vertex_llm
+from app.services.ai_service import AIService
 
 # Create FastAPI app
 app = FastAPI(
@@ -9,6 +15,9 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
 
+# Oversized uploads are refused before their body is read (added first, so CORS headers wrap the 413)
+app.add_middleware(BodySizeLimitMiddleware)
+
 # Set up CORS with comprehensive origins
 cors_origins = [
     # Development
@@ -40,9 +49,34 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Per-request latency and pipeline stage metrics (exposed at /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Background tasks started with the app (kept referenced until shutdown)
+background_tasks = set()
+
+@app.on_event("startup")
+async def startup():
+    history_writer.start()
+    upload_jobs.start()
+    await batch_jobs.start()
+    # Warm the shared Gemini handles without delaying readiness
+    warm_up_task = asyncio.create_task(AIService.warm_up_models())
+    background_tasks.add(warm_up_task)
+    warm_up_task.add_done_callback(background_tasks.discard)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await upload_jobs.stop()
+    await batch_jobs.stop()
+    await history_writer.stop()
+    google_clients.close()
+    image_preprocessing.close_pool()
+    close_supabase_clients()
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -52,3 +86,18 @@ async def root():
         "version": "0.1.0",
         "cors_origins": cors_origins
     }
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "llm_calls_in_flight": vertex_llm.llm_calls_in_flight(),
+        "history_queue_depth": history_writer.queue_depth(),
+        "upload_queue_depth": await upload_jobs.queue_depth(),
+        "google_clients": await google_clients.probe()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    content, content_type = metrics.render_latest()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,297 @@
+import copy
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, Extra, Field, ValidationError, validator
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# A value the model writes as "~40", "85%" or "7,5"
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+class Number:
+    """Numeric field that keeps floats as they are and reads numbers out of strings"""
+    schema_type = "number"
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        field_schema.update(type=cls.schema_type)
+
+    @classmethod
+    def validate(cls, value: Any) -> Any:
+        if isinstance(value, bool):
+            raise TypeError("boolean is not a number")
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            match = _NUMBER_RE.search(value)
+            if match:
+                number = float(match.group().replace(",", "."))
+                return int(number) if number.is_integer() else number
+        raise TypeError(f"not a number: {value!r}")
+
+class Count(Number):
+    """Number the model is asked to give as an integer"""
+    schema_type = "integer"
+
+def expected(default: Any = None) -> Any:
+    """Field the model is asked for (required in the response schema) but may leave out"""
+    return Field(default, expected=True)
+
+def _drop_path(data: Any, loc: Tuple[Any, ...]) -> bool:
+    for key in loc[:-1]:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return False
+    if isinstance(data, dict) and loc[-1] in data:
+        del data[loc[-1]]
+        return True
+    if isinstance(data, list) and isinstance(loc[-1], int) and loc[-1] < len(data):
+        del data[loc[-1]]
+        return True
+    return False
+
+class ResultModel(BaseModel):
+    """Base for LLM result models: fields the model adds on its own are kept"""
+    class Config:
+        extra = Extra.allow
+
+    @classmethod
+    def parse_lenient(cls, data: Any) -> Tuple["ResultModel", List[str]]:
+        """Validate the document, dropping fields that do not fit instead of rejecting it.
+
+        Returns the model and the paths of dropped fields; raises ValidationError only
+        if the document is still invalid without them (e.g. it is not an object).
+        """
+        dropped: List[str] = []
+        copied = False
+        while True:
+            try:
+                return cls.parse_obj(data), dropped
+            except ValidationError as e:
+                if not isinstance(data, dict):
+                    raise
+                if not copied:
+                    data, copied = copy.deepcopy(data), True
+                # Higher list indexes first, so dropping one does not shift the others
+                locs = sorted(
+                    {error["loc"] for error in e.errors()},
+                    key=lambda loc: tuple(key for key in loc if isinstance(key, int)),
+                    reverse=True
+                )
+                removed = [loc for loc in locs if _drop_path(data, loc)]
+                if not removed:
+                    raise
+                metrics.count_json_dropped(cls.__name__, "field", len(removed))
+                dropped.extend(".".join(str(key) for key in loc) for loc in removed)
+
+def _drop_invalid_items(item_model: Type[ResultModel]):
+    """List validator that drops elements a truncated response left incomplete"""
+    def validate(cls, items: Any) -> Any:
+        if not isinstance(items, list):
+            return items
+        valid = []
+        for item in items:
+            try:
+                result, dropped = item_model.parse_lenient(item)
+            except ValidationError:
+                logger.warning(f"Dropped invalid {item_model.__name__} item from model output")
+                metrics.count_json_dropped(item_model.__name__, "item")
+                continue
+            if dropped:
+                logger.warning(f"Dropped invalid fields from {item_model.__name__} item: {', '.join(dropped)}")
+            valid.append(result)
+        return valid
+    return validate
+
+# Cards every analysis has
+class Summary(ResultModel):
+    overview: Optional[str] = expected()
+    participants: Optional[Count] = expected()
+    messageCount: Optional[Count] = expected()
+    duration: Optional[str] = None
+    mainTopics: List[str] = []
+
+class Emotion(ResultModel):
+    time: str
+    emotion: str
+    intensity: Optional[Number] = expected()
+    color: Optional[str] = None
+
+class EmotionTimeline(ResultModel):
+    emotions: List[Emotion] = []
+    dominantEmotion: Optional[str] = expected()
+    emotionalShifts: Count = 0
+
+    _emotions = validator("emotions", pre=True, allow_reuse=True)(_drop_invalid_items(Emotion))
+
+class ScoreBreakdown(ResultModel):
+    clarity: Optional[Number] = expected()
+    empathy: Optional[Number] = expected()
+    professionalism: Optional[Number] = expected()
+    resolution: Optional[Number] = expected()
+
+class AIJudgeScore(ResultModel):
+    overallScore: Optional[Number] = expected()
+    breakdown: Optional[ScoreBreakdown] = expected()
+    verdict: Optional[str] = expected()
+    recommendation: Optional[str] = None
+
+class Subtlety(ResultModel):
+    type: str
+    message: str
+    confidence: Optional[Number] = expected()
+    context: Optional[str] = None
+
+class AnalysisResult(ResultModel):
+    summary: Optional[Summary] = expected()
+    emotionTimeline: Optional[EmotionTimeline] = expected()
+    aiJudgeScore: Optional[AIJudgeScore] = expected()
+    subtleties: List[Subtlety] = []
+
+    _subtleties = validator("subtleties", pre=True, allow_reuse=True)(_drop_invalid_items(Subtlety))
+
+class PresetValidation(ResultModel):
+    is_valid: Optional[bool] = expected()
+    reason: Optional[str] = None
+
+# Подростковый Навигатор
+class SafetyCheck(ResultModel):
+    bullying_indicators: List[str] = []
+    safety_level: Optional[Number] = expected()
+    recommendations: List[str] = []
+
+class HiddenEmotion(ResultModel):
+    text: str
+    explanation: str
+
+class EmotionDictionary(ResultModel):
+    hidden_emotions: List[HiddenEmotion] = []
+
+    _hidden_emotions = validator("hidden_emotions", pre=True, allow_reuse=True)(_drop_invalid_items(HiddenEmotion))
+
+class SocialCompass(ResultModel):
+    group_dynamics: Optional[str] = expected()
+    inner_circles: List[str] = []
+    navigation_tips: List[str] = []
+
+class TeenNavigatorResult(AnalysisResult):
+    preset_validation: Optional[PresetValidation] = None
+    safety_check: Optional[SafetyCheck] = None
+    emotion_dictionary: Optional[EmotionDictionary] = None
+    social_compass: Optional[SocialCompass] = None
+
+# Семейный Баланс
+class CommunicationCycles(ResultModel):
+    patterns: List[str] = []
+    trigger_points: List[str] = []
+    interruption_techniques: List[str] = []
+
+class NeedsMap(ResultModel):
+    expressed_needs: List[str] = []
+    unexpressed_needs: List[str] = []
+    overlap_areas: List[str] = []
+
+class FamilyRoles(ResultModel):
+    role_distribution: List[str] = []
+    responsibility_balance: Optional[Number] = expected()
+    recommendations: List[str] = []
+
+class FamilyBalanceResult(AnalysisResult):
+    preset_validation: Optional[PresetValidation] = None
+    communication_cycles: Optional[CommunicationCycles] = None
+    needs_map: Optional[NeedsMap] = None
+    family_roles: Optional[FamilyRoles] = None
+
+# Стратегический HR
+class CommunicationMetrics(ResultModel):
+    participation_rate: Optional[Number] = expected()
+    response_time: Optional[str] = expected()
+    engagement_score: Optional[Number] = expected()
+
+class TeamAnalytics(ResultModel):
+    communication_metrics: Optional[CommunicationMetrics] = expected()
+    decision_efficiency: Optional[Number] = expected()
+    goal_achievement: Optional[Number] = expected()
+
+class PsychologicalSafety(ResultModel):
+    safety_level: Optional[Number] = expected()
+    trust_indicators: List[str] = []
+    openness_score: Optional[Number] = expected()
+
+class SkillAnalysis(ResultModel):
+    skill: str
+    current_level: Optional[Number] = expected()
+    development_area: Optional[str] = expected()
+
+class ProfessionalGrowth(ResultModel):
+    skill_analysis: List[SkillAnalysis] = []
+    growth_recommendations: List[str] = []
+
+    _skill_analysis = validator("skill_analysis", pre=True, allow_reuse=True)(_drop_invalid_items(SkillAnalysis))
+
+class StrategicHRResult(AnalysisResult):
+    preset_validation: Optional[PresetValidation] = None
+    team_analytics: Optional[TeamAnalytics] = None
+    psychological_safety: Optional[PsychologicalSafety] = None
+    professional_growth: Optional[ProfessionalGrowth] = None
+
+# Suggested responses
+class Suggestion(ResultModel):
+    text: str
+    reason: Optional[str] = None
+
+class SuggestionsResult(ResultModel):
+    suggestions: List[Suggestion] = []
+
+    _suggestions = validator("suggestions", pre=True, allow_reuse=True)(_drop_invalid_items(Suggestion))
+
+RESULT_MODELS_BY_PRESET: Dict[str, Type[AnalysisResult]] = {
+    "teen_navigator": TeenNavigatorResult,
+    "family_balance": FamilyBalanceResult,
+    "strategic_hr": StrategicHRResult
+}
+
+def get_result_model(preset_id: Optional[str]) -> Type[AnalysisResult]:
+    return RESULT_MODELS_BY_PRESET.get(preset_id or "", AnalysisResult)
+
+# JSON schema keywords understood by Gemini's response_schema (an OpenAPI subset)
+_RESPONSE_SCHEMA_KEYS = ("type", "format", "enum", "items", "properties", "required")
+
+def _to_response_schema(schema: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in schema:
+        return _to_response_schema(definitions[schema["$ref"].split("/")[-1]], definitions)
+    if "allOf" in schema and len(schema["allOf"]) == 1:
+        return _to_response_schema(schema["allOf"][0], definitions)
+    converted: Dict[str, Any] = {}
+    for key in _RESPONSE_SCHEMA_KEYS:
+        if key not in schema:
+            continue
+        if key == "items":
+            converted[key] = _to_response_schema(schema[key], definitions)
+        elif key == "properties":
+            converted[key] = {
+                name: _to_response_schema(field, definitions) for name, field in schema[key].items()
+            }
+            # Fields declared with expected() are asked for, even though parsing tolerates their absence
+            required = schema.get("required", []) + [
+                name for name, field in schema[key].items() if field.get("expected")
+            ]
+            if required:
+                converted["required"] = required
+        elif key == "required":
+            continue
+        else:
+            converted[key] = schema[key]
+    return converted
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Self-contained response schema for a result model (references inlined)"""
+    schema = model.schema()
+    return _to_response_schema(schema, schema.get("definitions", {}))
@@ -0,0 +1,22 @@
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+class BatchItem(BaseModel):
+    index: int
+    status: str  # 'pending', 'running', 'done', 'failed'
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    history_id: Optional[str] = None
+
+class BatchJob(BaseModel):
+    id: str
+    status: str  # 'pending', 'running', 'completed', 'failed'
+    preset_id: Optional[str] = None
+    save_history: bool
+    total: int
+    done: int
+    failed: int
+    created_at: datetime
+    updated_at: datetime
+    items: List[BatchItem] = []
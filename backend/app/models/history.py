@@ -36,3 +36,8 @@ class AnalysisHistoryItem(BaseModel):
     message_count: int
     participants: int
     file_type: str
+
+class AnalysisHistoryPage(BaseModel):
+    items: List[AnalysisHistoryItem]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
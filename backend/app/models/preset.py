@@ -181,12 +181,11 @@ ALL_PRESETS = [
     STRATEGIC_HR_PRESET
 ]
 
+PRESETS_BY_ID = {preset.id: preset for preset in ALL_PRESETS}
+
 # Get preset by ID
 def get_preset_by_id(preset_id: str) -> Optional[Preset]:
-    for preset in ALL_PRESETS:
-        if preset.id == preset_id:
-            return preset
-    return DEFAULT_PRESET
+    return PRESETS_BY_ID.get(preset_id, DEFAULT_PRESET)
 
 # Pydantic models for API requests/responses
 class PresetCreate(BaseModel):
@@ -0,0 +1,16 @@
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+class UploadJob(BaseModel):
+    id: str
+    file_name: Optional[str] = None
+    file_type: str  # 'text', 'image', 'audio'
+    status: str  # 'queued', 'processing', 'completed', 'failed'
+    stage: str  # 'queued', 'reading' / 'ocr' / 'transcription', 'analysis', 'saved'
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    history_id: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
@@ -0,0 +1,127 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from prometheus_client import Counter
+from starlette.requests import Request
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+PUBLIC_REQUESTS = Counter(
+    "gossipai_public_requests_total",
+    "Unauthenticated demo requests by admission outcome (admitted, rate_limited, shed_queue_full, shed_timeout)",
+    ["outcome"]
+)
+
+class LoadShed(Exception):
+    """The request was not admitted; retry_after is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `burst` saved up"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Per-client token buckets (per worker); idle buckets are dropped from the LRU"""
+
+    def __init__(self, per_minute: float, burst: float, max_clients: int):
+        self.rate = per_minute / 60
+        self.burst = burst
+        # An idle bucket refills completely within this time, so forgetting it changes nothing
+        self._buckets = TTLCache(max_clients, math.ceil(burst / self.rate) if self.rate else 3600)
+
+    def check(self, client: str) -> float:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        wait = bucket.take()
+        self._buckets.set(client, bucket)
+        return wait
+
+class AdmissionGate:
+    """Concurrency budget with a bounded wait queue; requests beyond it are shed"""
+
+    def __init__(self, max_concurrency: int, max_waiting: int, wait_timeout: float):
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        if self._semaphore.locked():
+            if self._waiting >= self.max_waiting:
+                raise LoadShed("shed_queue_full", settings.PUBLIC_SHED_RETRY_AFTER_SECONDS)
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise LoadShed("shed_timeout", settings.PUBLIC_SHED_RETRY_AFTER_SECONDS)
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    def waiting(self) -> int:
+        return self._waiting
+
+def client_ip(request: Request) -> str:
+    """Client address, taken from X-Forwarded-For when behind trusted proxies"""
+    hops = settings.PUBLIC_TRUSTED_PROXY_HOPS
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded:
+        # Each trusted proxy appends the address it saw, so count from the right
+        addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+        if addresses:
+            return addresses[-min(hops, len(addresses))]
+    return request.client.host if request.client else "unknown"
+
+_public_limiter = RateLimiter(
+    settings.PUBLIC_RATE_LIMIT_PER_MINUTE, settings.PUBLIC_RATE_LIMIT_BURST, settings.PUBLIC_RATE_LIMIT_MAX_CLIENTS
+)
+_public_gate = AdmissionGate(
+    settings.PUBLIC_MAX_CONCURRENCY, settings.PUBLIC_MAX_WAITING, settings.PUBLIC_QUEUE_TIMEOUT_SECONDS
+)
+
+def check_public_rate(request: Request) -> Optional[int]:
+    """Seconds to wait if the client is over its rate, None if the request may proceed"""
+    wait = _public_limiter.check(client_ip(request))
+    if wait > 0:
+        PUBLIC_REQUESTS.labels("rate_limited").inc()
+        return max(1, math.ceil(wait))
+    return None
+
+@asynccontextmanager
+async def admit_public() -> AsyncIterator[None]:
+    """Hold a slot of the public concurrency budget; raises LoadShed if none frees up in time"""
+    try:
+        async with _public_gate.admit():
+            PUBLIC_REQUESTS.labels("admitted").inc()
+            yield
+    except LoadShed as e:
+        PUBLIC_REQUESTS.labels(e.reason).inc()
+        raise
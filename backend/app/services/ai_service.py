@@ -1,14 +1,25 @@
+import asyncio
 import os
 import logging
 import json
-from typing import Dict, Any, Optional, List
+from typing import AsyncIterator, Dict, Any, Optional, List, Tuple, Type
 import vertexai
-from vertexai.preview.generative_models import GenerativeModel
+from pydantic import ValidationError
+from app.core import metrics
 from app.core.config import settings
+from app.models.analysis_result import ResultModel, SuggestionsResult, response_schema
+from app.services import analysis_cache, chunked_analysis, conversation_store, json_repair, prompt_templates, single_flight, vertex_llm
+from app.services.json_stream import TopLevelJSONStream
+from app.services.tokens import estimate_tokens
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+SUGGESTIONS_SCHEMA = response_schema(SuggestionsResult)
+
+# Concurrent analyses of the same request (same cache key) share one Gemini call
+_analysis_flights = single_flight.SingleFlight("analysis", cross_worker=settings.SINGLE_FLIGHT_CROSS_WORKER)
+
 # Set Google Cloud credentials environment variable
 if settings.GOOGLE_APPLICATION_CREDENTIALS:
     # Check if it's a JSON string or file path
@@ -48,21 +59,243 @@ except Exception as e:
     logger.error(f"Failed to initialize Vertex AI: {e}")
     vertex_ai_initialized = False
 
-# In-memory storage for chat conversations (in production, use database)
-chat_conversations = {}
-
 class AIService:
     """Service for handling AI analysis with Google Vertex AI"""
     
     @staticmethod
-    async def analyze_text(text: str, additional_prompt: Optional[str] = None, preset_id: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
-        """Analyze text using Google Vertex AI (Gemini)"""
+    def build_analysis_prompt(text: str, additional_prompt: Optional[str] = None, preset_id: Optional[str] = None, temperature: Optional[float] = None) -> Tuple[str, float]:
+        """Build the analysis prompt and resolve the model temperature"""
+        template = prompt_templates.get_template(preset_id)
+        if template.preset_id:
+            logger.info(f"Using preset: {template.preset_id} with temperature {template.temperature}")
+        
+        # Override with provided temperature if specified
+        model_temperature = temperature if temperature is not None else template.temperature
+        return template.render(text, additional_prompt), model_temperature
+    
+    @staticmethod
+    def parse_model_json(raw: str, result_model: Type[ResultModel], kind: str) -> Dict[str, Any]:
+        """Parse a JSON response of the model, repairing it if needed, and validate it"""
+        try:
+            data, repaired = json_repair.loads_tolerant(raw)
+        except ValueError:
+            metrics.count_json_parse(kind, "unparseable")
+            raise
+        try:
+            result, dropped = result_model.parse_lenient(data)
+        except ValidationError as e:
+            metrics.count_json_parse(kind, "invalid")
+            raise ValueError(f"Model output does not match {result_model.__name__}: {e}") from e
+        if repaired:
+            logger.warning(f"Repaired malformed {kind} JSON in model output")
+        if dropped:
+            logger.warning(f"Dropped invalid fields from {kind} JSON: {', '.join(dropped)}")
+            metrics.count_json_parse(kind, "salvaged")
+        else:
+            metrics.count_json_parse(kind, "repaired" if repaired else "clean")
+        return result.dict(exclude_unset=True)
+    
+    @staticmethod
+    def analysis_generation_config(template: prompt_templates.AnalysisPromptTemplate, temperature: float):
+        """JSON output against the preset's response schema, if the SDK supports it"""
+        return vertex_llm.json_generation_config(template.result_model.__name__, template.response_schema, temperature)
+    
+    @staticmethod
+    def get_preset_info(preset_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Information about the custom cards that should be shown for a preset"""
+        if not preset_id:
+            return None
+        return prompt_templates.get_template(preset_id).preset_info()
+    
+    @staticmethod
+    def needs_chunking(text: str) -> bool:
+        """Whether the conversation is too long for a single analysis prompt"""
+        return estimate_tokens(text) > settings.ANALYSIS_CHUNK_TOKEN_BUDGET
+    
+    @staticmethod
+    async def analyze_in_chunks(text: str, additional_prompt: Optional[str] = None, preset_id: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
+        """Map-reduce analysis: analyze message-aligned chunks concurrently, then merge the results"""
+        chunks = chunked_analysis.split_conversation(
+            text, settings.ANALYSIS_CHUNK_TOKEN_BUDGET, settings.ANALYSIS_MAX_CHUNKS
+        )
+        logger.info(f"Analyzing long conversation ({len(text)} characters) in {len(chunks)} chunks")
+        template = prompt_templates.get_template(preset_id)
+        
+        async def analyze_chunk(index: int, chunk: str) -> Dict[str, Any]:
+            chunk_text = f"[Часть {index + 1} из {len(chunks)} длинного разговора]\n{chunk}"
+            with metrics.stage("prompt_build"):
+                prompt, model_temperature = AIService.build_analysis_prompt(chunk_text, additional_prompt, preset_id, temperature)
+            model = vertex_llm.get_model(model_temperature)
+            generation_config = AIService.analysis_generation_config(template, model_temperature)
+            response = await vertex_llm.generate_content(model, prompt, generation_config)
+            with metrics.stage("json_extract"):
+                return AIService.parse_model_json(response.text, template.result_model, "analysis")
+        
+        outcomes = await asyncio.gather(
+            *[analyze_chunk(index, chunk) for index, chunk in enumerate(chunks)],
+            return_exceptions=True
+        )
+        
+        results = []
+        weights = []
+        for index, (chunk, outcome) in enumerate(zip(chunks, outcomes)):
+            if isinstance(outcome, Exception) or not isinstance(outcome, dict):
+                logger.warning(f"Chunk {index + 1}/{len(chunks)} analysis failed: {outcome}")
+                continue
+            results.append(outcome)
+            weights.append(len(chunk))
+        
+        if not results:
+            raise ValueError("All chunk analyses failed")
+        return chunked_analysis.merge_analysis_results(results, weights)
+    
+    @staticmethod
+    def _cached_response(cache_key: str) -> Optional[Dict[str, Any]]:
+        cached_result = analysis_cache.lookup(cache_key)
+        if cached_result is None:
+            return None
+        return {
+            "success": True,
+            "result": cached_result,
+            "cached": True
+        }
+    
+    @staticmethod
+    async def _generate_analysis(text: str, additional_prompt: Optional[str], preset_id: Optional[str], temperature: Optional[float], cache_key: str) -> Dict[str, Any]:
+        """Run the analysis on Gemini and cache the result"""
+        if AIService.needs_chunking(text):
+            parsed_result = await AIService.analyze_in_chunks(text, additional_prompt, preset_id, temperature)
+            preset_info = AIService.get_preset_info(preset_id)
+            if preset_info:
+                parsed_result["preset"] = preset_info
+            analysis_cache.store(cache_key, parsed_result)
+            metrics.record_outcome("success")
+            return {
+                "success": True,
+                "result": parsed_result
+            }
+        
+        with metrics.stage("prompt_build"):
+            prompt, model_temperature = AIService.build_analysis_prompt(text, additional_prompt, preset_id, temperature)
+        
+        logger.info(f"Generating content with Gemini using temperature {model_temperature}")
+        logger.info(f"Prompt length: {len(prompt)} characters")
+        logger.info(f"Text to analyze: {text[:100]}...")
+        
+        # Generate response from Gemini with specified temperature
+        template = prompt_templates.get_template(preset_id)
+        model = vertex_llm.get_model(model_temperature)
+        generation_config = AIService.analysis_generation_config(template, model_temperature)
+        response = await vertex_llm.generate_content(model, prompt, generation_config)
+        
+        # Parse the response to extract the JSON
+        result = response.text
+        logger.info(f"Successfully generated analysis, response length: {len(result)} characters")
+        logger.info(f"Response preview: {result[:200]}...")
+        
+        # Parse (and if needed repair) the JSON document in the response
+        try:
+            with metrics.stage("json_extract"):
+                parsed_result = AIService.parse_model_json(result, template.result_model, "analysis")
+            
+            # Add preset-specific data to the result if preset is provided
+            preset_info = AIService.get_preset_info(preset_id)
+            if preset_info:
+                parsed_result["preset"] = preset_info
+            
+            analysis_cache.store(cache_key, parsed_result)
+            metrics.record_outcome("success")
+            
+            return {
+                "success": True,
+                "result": parsed_result
+            }
+        except ValueError as e:
+            logger.warning(f"Failed to parse JSON from response: {e}")
+            logger.warning(f"Raw response: {result}")
+            metrics.record_outcome("parse_fallback")
+            # Try to create a basic analysis from the raw text
+            try:
+                # Create a basic analysis structure from the raw response
+                basic_analysis = {
+                    "summary": {
+                        "overview": "Анализ на основе извлеченного текста",
+                        "participants": 1,
+                        "messageCount": len(text.split()),
+                        "duration": "Краткий",
+                        "mainTopics": ["Анализ текста"]
+                    },
+                    "emotionTimeline": {
+                        "emotions": [
+                            {
+                                "time": "00:00",
+                                "emotion": "Нейтральный",
+                                "intensity": 50,
+                                "color": "#6b7280"
+                            }
+                        ],
+                        "dominantEmotion": "Нейтральный",
+                        "emotionalShifts": 1
+                    },
+                    "aiJudgeScore": {
+                        "overallScore": 70,
+                        "breakdown": {
+                            "clarity": 75,
+                            "empathy": 70,
+                            "professionalism": 65,
+                            "resolution": 70
+                        },
+                        "verdict": "Анализ выполнен",
+                        "recommendation": "Текст успешно обработан и проанализирован"
+                    },
+                    "subtleties": [
+                        {
+                            "type": "Обработка",
+                            "message": "Текст извлечен и проанализирован",
+                            "confidence": 80,
+                            "context": "OCR и AI анализ"
+                        }
+                    ]
+                }
+                return {
+                    "success": True,
+                    "result": basic_analysis,
+                    "fallback": True
+                }
+            except Exception as fallback_error:
+                logger.error(f"Fallback analysis also failed: {fallback_error}")
+                return {
+                    "success": True,
+                    "result": result,
+                    "fallback": True
+                }
+    
+    @staticmethod
+    async def analyze_text(text: str, additional_prompt: Optional[str] = None, preset_id: Optional[str] = None, temperature: Optional[float] = None, bypass_cache: bool = False, strict: bool = False) -> Dict[str, Any]:
+        """Analyze text using Google Vertex AI (Gemini).
+
+        Interactive callers get a mock or placeholder analysis when Gemini fails;
+        with strict=True the failure is raised instead, so background jobs do not
+        store fake results.
+        """
         try:
             logger.info("Starting text analysis with Vertex AI")
+            metrics.set_preset(preset_id)
+            
+            # Serve repeated submissions of the same conversation from cache
+            cache_key = analysis_cache.make_key(text, additional_prompt, preset_id, temperature)
+            if not bypass_cache:
+                cached_response = AIService._cached_response(cache_key)
+                if cached_response is not None:
+                    metrics.record_outcome("cached")
+                    return cached_response
             
             # Check if Vertex AI is initialized
             if not vertex_ai_initialized:
+                if strict:
+                    raise RuntimeError("Vertex AI не инициализирован")
                 logger.warning("Vertex AI not initialized, using mock analysis")
+                metrics.record_outcome("mock_fallback")
                 return await AIService.mock_analysis_result(preset_id)
             
             # Check if credentials are set
@@ -78,344 +311,113 @@ class AIService:
                     logger.info("Attempting to use credentials from environment variable...")
                     # Try to continue without file - credentials might be set via environment
             
-            logger.info("Initializing Gemini model")
-            # Use the correct Gemini model for Vertex AI
-            model = GenerativeModel("gemini-2.5-pro")
-            
-            # Apply preset-specific instructions if preset_id is provided
-            preset_instructions = ""
-            preset_specific_data = ""
-            model_temperature = 0.7  # Default temperature
-            
-            if preset_id:
-                from app.models.preset import get_preset_by_id
-                preset = get_preset_by_id(preset_id)
-                if preset:
-                    logger.info(f"Using preset: {preset.name} with temperature {preset.temperature}")
-                    preset_instructions = f"""
-                    Анализируй разговор согласно следующему пресету: "{preset.name}".
-                    Целевая аудитория: {preset.target_audience}
-                    
-                    Стиль отчета:
-                    {', '.join(preset.report_style)}
-                    
-                    Фокус анализа:
-                    {', '.join(preset.focus_analysis)}
-                    """
-                    model_temperature = preset.temperature
-                    
-                    # Add preset-specific data generation instructions
-                    if preset.id == "teen_navigator":
-                        preset_specific_data = """
-                        
-                        ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа подростковой коммуникации. 
-                        Ищи признаки: возраст участников (подростки, школьники), школьная тематика, 
-                        групповое общение, социальные сети, подростковые интересы.
-                        
-                        Если диалог НЕ подходит для подросткового анализа, установи:
-                        "preset_validation": {{
-                            "is_valid": false,
-                            "reason": "Диалог не содержит признаков подростковой коммуникации"
-                        }}
-                        
-                        Если диалог подходит, установи:
-                        "preset_validation": {{
-                            "is_valid": true,
-                            "reason": "Диалог подходит для подросткового анализа"
-                        }}
-                        
-                        ДОПОЛНИТЕЛЬНО для пресета "Подростковый Навигатор" добавь следующие данные:
-                        
-                        "safety_check": {{
-                            "bullying_indicators": ["индикатор1", "индикатор2", "индикатор3"],
-                            "safety_level": число_от_0_до_100,
-                            "recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
-                        }},
-                        "emotion_dictionary": {{
-                            "hidden_emotions": [
-                                {{
-                                    "text": "фраза из разговора",
-                                    "explanation": "что на самом деле означает эта фраза"
-                                }}
-                            ]
-                        }},
-                        "social_compass": {{
-                            "group_dynamics": "описание групповой динамики",
-                            "inner_circles": ["круг1", "круг2", "круг3"],
-                            "navigation_tips": ["совет1", "совет2", "совет3"]
-                        }}
-                        """
-                    elif preset.id == "family_balance":
-                        preset_specific_data = """
-                        
-                        ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа семейной коммуникации. 
-                        Ищи признаки: семейные отношения (родители-дети, супруги, родственники), 
-                        домашние дела, семейные планы, воспитание, семейные конфликты.
-                        
-                        Если диалог НЕ подходит для семейного анализа, установи:
-                        "preset_validation": {{
-                            "is_valid": false,
-                            "reason": "Диалог не содержит признаков семейной коммуникации"
-                        }}
-                        
-                        Если диалог подходит, установи:
-                        "preset_validation": {{
-                            "is_valid": true,
-                            "reason": "Диалог подходит для семейного анализа"
-                        }}
-                        
-                        ДОПОЛНИТЕЛЬНО для пресета "Семейный Баланс" добавь следующие данные:
-                        
-                        "communication_cycles": {{
-                            "patterns": ["паттерн1", "паттерн2", "паттерн3"],
-                            "trigger_points": ["триггер1", "триггер2", "триггер3"],
-                            "interruption_techniques": ["техника1", "техника2", "техника3"]
-                        }},
-                        "needs_map": {{
-                            "expressed_needs": ["потребность1", "потребность2"],
-                            "unexpressed_needs": ["скрытая_потребность1", "скрытая_потребность2"],
-                            "overlap_areas": ["зона_пересечения1", "зона_пересечения2"]
-                        }},
-                        "family_roles": {{
-                            "role_distribution": ["роль1", "роль2", "роль3"],
-                            "responsibility_balance": число_от_0_до_100,
-                            "recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
-                        }}
-                        ПРАВИЛА ОФОРМЛЕНИЯ:
-                        1. КОЛИЧЕСТВО СЛОВ КАЖДОГО ТРИГЕРА НЕ ДОЛЖНЫ ПРЕВЫШАТЬ 4-5 СЛОВ
-                        2. ВСЕ РЕКОМЕНДАЦИИ ДОЛЖНЫ БЫТЬ НЕ ДЛИННЫМИ И ПРАКТИЧНЫМИ
-                        """
-                    elif preset.id == "strategic_hr":
-                        preset_specific_data = """
-                        
-                        ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа деловой/рабочей коммуникации. 
-                        Ищи признаки: рабочие отношения, проекты, задачи, совещания, 
-                        профессиональные обсуждения, командная работа, деловые решения.
-                        
-                        Если диалог НЕ подходит для HR анализа, установи:
-                        "preset_validation": {{
-                            "is_valid": false,
-                            "reason": "Диалог не содержит признаков деловой/рабочей коммуникации"
-                        }}
-                        
-                        Если диалог подходит, установи:
-                        "preset_validation": {{
-                            "is_valid": true,
-                            "reason": "Диалог подходит для HR анализа"
-                        }}
-                        
-                        ДОПОЛНИТЕЛЬНО для пресета "Стратегический HR" добавь следующие данные:
-                        
-                        "team_analytics": {{
-                            "communication_metrics": {{
-                                "participation_rate": число_от_0_до_100,
-                                "response_time": "среднее_время_ответа",
-                                "engagement_score": число_от_0_до_100
-                            }},
-                            "decision_efficiency": число_от_0_до_100,
-                            "goal_achievement": число_от_0_до_100
-                        }},
-                        "psychological_safety": {{
-                            "safety_level": число_от_0_до_100,
-                            "trust_indicators": ["индикатор1", "индикатор2", "индикатор3"],
-                            "openness_score": число_от_0_до_100
-                        }},
-                        "professional_growth": {{
-                            "skill_analysis": [
-                                {{
-                                    "skill": "навык",
-                                    "current_level": число_от_1_до_5,
-                                    "development_area": "область_развития"
-                                }}
-                            ],
-                            "growth_recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
-                        }}
-                        """
-            
-            # Override with provided temperature if specified
-            if temperature is not None:
-                model_temperature = temperature
-            
-            # Create the prompt for analysis
-            prompt = f"""
-            Проанализируй следующий разговор и предоставь детальный анализ эмоций и качества общения. 
-            Отвечай строго на русском языке.
-
-            Разговор:
-            {text}
-
-            {preset_instructions}
-            
-            ВАЖНО: Если текст короткий или содержит мало информации, все равно проведи анализ на основе доступных данных.
-            Даже короткие фразы могут содержать эмоциональную информацию.
-            
-            {f"Дополнительные инструкции: {additional_prompt}" if additional_prompt else ""}
-
-            Предоставь анализ в следующем JSON формате (give answers in russian):
-
-            {{
-                "summary": {{
-                    "overview": "Краткое описание разговора",
-                    "participants": количество_участников,
-                    "messageCount": количество_сообщений,
-                    "duration": "примерная длительность",
-                    "mainTopics": ["тема1", "тема2", "тема3"]
-                }},
-                "emotionTimeline": {{
-                    "emotions": [
-                        {{
-                            "time": "время",
-                            "emotion": "эмоция с эмоджи",
-                            "intensity": интенсивность_от_0_до_100,
-                            "color": "hex_цвет"
-                        }}
-                    ],
-                    "dominantEmotion": "доминирующая эмоция с эмоджи",
-                    "emotionalShifts": количество_эмоциональных_переходов
-                }},
-                "aiJudgeScore": {{
-                    "overallScore": общий_балл_от_0_до_100,
-                    "breakdown": {{
-                        "clarity": балл_ясности_от_0_до_100,
-                        "empathy": балл_эмпатии_от_0_до_100,
-                        "professionalism": балл_профессионализма_от_0_до_100,
-                        "resolution": балл_решения_от_0_до_100
-                    }},
-                    "verdict": "КРАТКИЙ ВЕРДИКТ ИЗ 4-5 СЛОВ МАКСИМУМ",
-                    "recommendation": "подробная рекомендация"
-                }},
-                "subtleties": [
-                    {{
-                        "type": "тип тонкости",
-                        "message": "описание",
-                        "confidence": уверенность_от_0_до_100,
-                        "context": "контекст"
-                    }}
-                ]{preset_specific_data}
-            }}
-
-            ВАЖНО:
-            1. Вердикт (verdict) должен быть КРАТКИМ - максимум 4-5 слов
-            2. К каждой эмоции в emotionTimeline.emotions добавляй подходящий эмоджи
-            3. К dominantEmotion тоже добавляй эмоджи
-            4. Все ответы строго на русском языке
-            """
-            
-            # Add additional prompt if provided
-            if additional_prompt:
-                prompt += f"\n\nAdditional analysis instructions: {additional_prompt}"
-            
-            logger.info(f"Generating content with Gemini using temperature {model_temperature}")
-            logger.info(f"Prompt length: {len(prompt)} characters")
-            logger.info(f"Text to analyze: {text[:100]}...")
-            
-            # Generate response from Gemini with specified temperature
-            response = model.generate_content(prompt, generation_config={"temperature": model_temperature})
-            
-            # Parse the response to extract the JSON
-            result = response.text
-            logger.info(f"Successfully generated analysis, response length: {len(result)} characters")
-            logger.info(f"Response preview: {result[:200]}...")
-            
-            # Try to parse JSON from the response
-            try:
-                # Extract JSON from the response (it might be wrapped in markdown)
-                if "```json" in result:
-                    json_start = result.find("```json") + 7
-                    json_end = result.find("```", json_start)
-                    json_str = result[json_start:json_end].strip()
-                elif "```" in result:
-                    # Handle other markdown code blocks
-                    json_start = result.find("```") + 3
-                    json_end = result.find("```", json_start)
-                    json_str = result[json_start:json_end].strip()
-                else:
-                    json_str = result.strip()
-                
-                logger.info(f"Attempting to parse JSON: {json_str[:200]}...")
-                parsed_result = json.loads(json_str)
-                
-                # Add preset-specific data to the result if preset is provided
-                if preset_id:
-                    from app.models.preset import get_preset_by_id
-                    preset = get_preset_by_id(preset_id)
-                    if preset and hasattr(preset, 'custom_cards') and preset.custom_cards:
-                        # Add information about custom cards that should be shown for this preset
-                        parsed_result["preset"] = {
-                            "id": preset.id,
-                            "name": preset.name,
-                            "custom_cards": [card.dict() for card in preset.custom_cards]
-                        }
-                
-                return {
-                    "success": True,
-                    "result": parsed_result
-                }
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse JSON from response: {e}")
-                logger.warning(f"Raw response: {result}")
-                # Try to create a basic analysis from the raw text
-                try:
-                    # Create a basic analysis structure from the raw response
-                    basic_analysis = {
-                        "summary": {
-                            "overview": "Анализ на основе извлеченного текста",
-                            "participants": 1,
-                            "messageCount": len(text.split()),
-                            "duration": "Краткий",
-                            "mainTopics": ["Анализ текста"]
-                        },
-                        "emotionTimeline": {
-                            "emotions": [
-                                {
-                                    "time": "00:00",
-                                    "emotion": "Нейтральный",
-                                    "intensity": 50,
-                                    "color": "#6b7280"
-                                }
-                            ],
-                            "dominantEmotion": "Нейтральный",
-                            "emotionalShifts": 1
-                        },
-                        "aiJudgeScore": {
-                            "overallScore": 70,
-                            "breakdown": {
-                                "clarity": 75,
-                                "empathy": 70,
-                                "professionalism": 65,
-                                "resolution": 70
-                            },
-                            "verdict": "Анализ выполнен",
-                            "recommendation": "Текст успешно обработан и проанализирован"
-                        },
-                        "subtleties": [
-                            {
-                                "type": "Обработка",
-                                "message": "Текст извлечен и проанализирован",
-                                "confidence": 80,
-                                "context": "OCR и AI анализ"
-                            }
-                        ]
-                    }
-                    return {
-                        "success": True,
-                        "result": basic_analysis
-                    }
-                except Exception as fallback_error:
-                    logger.error(f"Fallback analysis also failed: {fallback_error}")
-                    return {
-                        "success": True,
-                        "result": result
-                    }
+            # Identical requests already in flight share that call instead of making their own
+            recheck = None if bypass_cache else lambda: AIService._cached_response(cache_key)
+            result = await _analysis_flights.run(
+                cache_key,
+                lambda: AIService._generate_analysis(text, additional_prompt, preset_id, temperature, cache_key),
+                recheck
+            )
+            if not metrics.current_outcome():
+                metrics.record_outcome("cached" if result.get("cached") else "coalesced")
+            if strict and result.get("fallback"):
+                raise ValueError("Не удалось разобрать ответ модели")
+            return result
             
         except Exception as e:
+            if strict:
+                logger.error(f"Error in text analysis: {str(e)}")
+                raise
             logger.error(f"Error in text analysis: {str(e)}")
             logger.error(f"Text length: {len(text)} characters")
             logger.error(f"Text preview: {text[:200]}...")
             # Fallback to mock analysis
             logger.warning("Falling back to mock analysis due to error")
+            metrics.record_outcome("mock_fallback")
             return await AIService.mock_analysis_result(preset_id)
     
+    @staticmethod
+    async def analyze_text_stream(text: str, additional_prompt: Optional[str] = None, preset_id: Optional[str] = None, temperature: Optional[float] = None, bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Analyze text with streaming generation, yielding each top-level card as soon as it is complete"""
+        logger.info("Starting streaming text analysis with Vertex AI")
+        metrics.set_preset(preset_id)
+        
+        preset_info = AIService.get_preset_info(preset_id)
+        if preset_info:
+            yield {"event": "card", "key": "preset", "value": preset_info}
+        
+        cache_key = analysis_cache.make_key(text, additional_prompt, preset_id, temperature)
+        cached_result = None if bypass_cache else analysis_cache.lookup(cache_key)
+        if cached_result is not None:
+            metrics.record_outcome("cached")
+            for key, value in cached_result.items():
+                if key != "preset":
+                    yield {"event": "card", "key": key, "value": value}
+            yield {"event": "result", "result": cached_result, "cached": True}
+            return
+        
+        cards: Dict[str, Any] = {}
+        raw_response = ""
+        try:
+            if not vertex_ai_initialized:
+                raise RuntimeError("Vertex AI not initialized")
+            
+            if AIService.needs_chunking(text):
+                # Chunk results are only meaningful after the merge, so cards are sent at the end
+                result = await AIService.analyze_in_chunks(text, additional_prompt, preset_id, temperature)
+            else:
+                with metrics.stage("prompt_build"):
+                    prompt, model_temperature = AIService.build_analysis_prompt(text, additional_prompt, preset_id, temperature)
+                logger.info(f"Streaming content with Gemini using temperature {model_temperature}")
+                logger.info(f"Prompt length: {len(prompt)} characters")
+                
+                template = prompt_templates.get_template(preset_id)
+                model = vertex_llm.get_model(model_temperature)
+                generation_config = AIService.analysis_generation_config(template, model_temperature)
+                parser = TopLevelJSONStream()
+                async for chunk in vertex_llm.stream_content(model, prompt, generation_config):
+                    raw_response += chunk
+                    for key, value in parser.feed(chunk):
+                        cards[key] = value
+                        yield {"event": "card", "key": key, "value": value}
+                
+                logger.info(f"Streaming analysis finished, response length: {len(raw_response)} characters")
+                try:
+                    with metrics.stage("json_extract"):
+                        result = AIService.parse_model_json(raw_response, template.result_model, "analysis")
+                except ValueError as e:
+                    # Keep whatever cards were complete before the document broke
+                    logger.warning(f"Failed to parse streamed JSON, using {len(cards)} complete cards: {e}")
+                    metrics.record_outcome("parse_fallback")
+                    result = dict(cards)
+            if not result:
+                raise ValueError("No analysis cards in model response")
+            if preset_info:
+                result["preset"] = preset_info
+            # Emit members the incremental scanner could not split out
+            for key, value in result.items():
+                if key not in cards and key != "preset":
+                    yield {"event": "card", "key": key, "value": value}
+            analysis_cache.store(cache_key, result)
+            if not metrics.current_outcome():
+                metrics.record_outcome("success")
+        except Exception as e:
+            logger.error(f"Error in streaming text analysis: {str(e)}")
+            if cards:
+                metrics.record_outcome("partial")
+                result = dict(cards)
+                if preset_info:
+                    result["preset"] = preset_info
+            else:
+                logger.warning("Falling back to mock analysis due to error")
+                metrics.record_outcome("mock_fallback")
+                result = (await AIService.mock_analysis_result(preset_id))["result"]
+                for key, value in result.items():
+                    if key != "preset":
+                        yield {"event": "card", "key": key, "value": value}
+        
+        yield {"event": "result", "result": result}
+    
     @staticmethod
     async def chat_with_ai(message: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """Chat with AI about the analyzed conversation"""
@@ -427,12 +429,8 @@ class AIService:
                 logger.warning("Vertex AI not initialized, using mock chat")
                 return await AIService.mock_chat_response()
             
-            # Get conversation history
-            conversation_history = chat_conversations.get(conversation_id, [])
-            
-            # Keep only last 10 messages
-            if len(conversation_history) > 10:
-                conversation_history = conversation_history[-10:]
+            # Get conversation history trimmed to the prompt token budget
+            conversation_history = await conversation_store.get_history(conversation_id)
             
             # Create context from conversation history
             context = ""
@@ -456,24 +454,13 @@ class AIService:
             """
             
             logger.info("Generating chat response with Gemini")
-            model = GenerativeModel("gemini-2.5-pro")
-            response = model.generate_content(chat_prompt)
+            model = vertex_llm.get_model()
+            response = await vertex_llm.generate_content(model, chat_prompt)
             
             ai_response = response.text.strip()
             
             # Store the conversation
-            if conversation_id:
-                if conversation_id not in chat_conversations:
-                    chat_conversations[conversation_id] = []
-                
-                chat_conversations[conversation_id].append({
-                    "user": message,
-                    "ai": ai_response
-                })
-                
-                # Keep only last 10 messages
-                if len(chat_conversations[conversation_id]) > 10:
-                    chat_conversations[conversation_id] = chat_conversations[conversation_id][-10:]
+            await conversation_store.append_turn(conversation_id, message, ai_response)
             
             return {
                 "success": True,
@@ -531,26 +518,20 @@ class AIService:
             """
             
             logger.info("Generating suggested responses with Gemini")
-            model = GenerativeModel("gemini-2.5-pro")
-            response = model.generate_content(prompt)
+            model = vertex_llm.get_model()
+            generation_config = vertex_llm.json_generation_config("suggestions", SUGGESTIONS_SCHEMA)
+            response = await vertex_llm.generate_content(model, prompt, generation_config)
             
             result = response.text
             
-            # Try to parse JSON from the response
+            # Parse (and if needed repair) the JSON document in the response
             try:
-                if "```json" in result:
-                    json_start = result.find("```json") + 7
-                    json_end = result.find("```", json_start)
-                    json_str = result[json_start:json_end].strip()
-                else:
-                    json_str = result.strip()
-                
-                parsed_result = json.loads(json_str)
+                parsed_result = AIService.parse_model_json(result, SuggestionsResult, "suggestions")
                 return {
                     "success": True,
                     "suggestions": parsed_result.get("suggestions", [])
                 }
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 logger.warning(f"Failed to parse JSON from response: {e}")
                 # Return mock suggestions if parsing fails
                 return await AIService.mock_suggested_responses()
@@ -559,6 +540,16 @@ class AIService:
             logger.error(f"Error in getting suggested responses: {str(e)}")
             return await AIService.mock_suggested_responses()
     
+    @staticmethod
+    async def warm_up_models() -> None:
+        """Create and warm the shared Gemini model handles at startup"""
+        if not vertex_ai_initialized or not settings.LLM_WARMUP_ON_STARTUP:
+            return
+        from app.models.preset import ALL_PRESETS
+        # Default temperature plus the one of every preset
+        temperatures = list(dict.fromkeys([None, 0.7] + [preset.temperature for preset in ALL_PRESETS]))
+        await vertex_llm.warm_up(temperatures)
+    
     @staticmethod
     async def mock_analysis_result(preset_id: Optional[str] = None) -> Dict[str, Any]:
         """Mock analysis result for testing"""
@@ -604,18 +595,13 @@ class AIService:
         
         # Add preset-specific data if preset_id is provided
         if preset_id:
-            from app.models.preset import get_preset_by_id
-            preset = get_preset_by_id(preset_id)
-            if preset and hasattr(preset, 'custom_cards') and preset.custom_cards:
+            preset_info = AIService.get_preset_info(preset_id)
+            if preset_info:
                 # Add mock data for preset-specific custom cards
-                result["result"]["preset"] = {
-                    "id": preset.id,
-                    "name": preset.name,
-                    "custom_cards": [card.dict() for card in preset.custom_cards]
-                }
+                result["result"]["preset"] = preset_info
                 
                 # Add mock data for teen navigator preset
-                if preset.id == "teen_navigator":
+                if preset_info["id"] == "teen_navigator":
                     # Mock validation - this would normally be determined by LLM
                     result["result"]["preset_validation"] = {
                         "is_valid": False,
@@ -639,7 +625,7 @@ class AIService:
                     }
                 
                 # Add mock data for family balance preset
-                elif preset.id == "family_balance":
+                elif preset_info["id"] == "family_balance":
                     # Mock validation - this would normally be determined by LLM
                     result["result"]["preset_validation"] = {
                         "is_valid": False,
@@ -662,7 +648,7 @@ class AIService:
                     }
                 
                 # Add mock data for strategic HR preset
-                elif preset.id == "strategic_hr":
+                elif preset_info["id"] == "strategic_hr":
                     # Mock validation - this would normally be determined by LLM
                     result["result"]["preset_validation"] = {
                         "is_valid": False,
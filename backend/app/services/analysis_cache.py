@@ -0,0 +1,69 @@
+import copy
+import hashlib
+import json
+import logging
+import unicodedata
+from typing import Any, Dict, Optional
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.local_store import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Bump when the analysis prompt changes so stale results are not served
+PROMPT_VERSION = "2"
+
+_memory = TTLCache(settings.ANALYSIS_CACHE_MEMORY_ENTRIES, settings.ANALYSIS_CACHE_TTL_SECONDS)
+_disk = SQLiteCache("analysis_cache", settings.ANALYSIS_CACHE_DISK_ENTRIES, settings.ANALYSIS_CACHE_TTL_SECONDS)
+
+def normalize_text(text: str) -> str:
+    """Normalize conversation text so trivial whitespace differences share a cache entry"""
+    text = unicodedata.normalize("NFC", text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def make_key(
+    text: str,
+    additional_prompt: Optional[str] = None,
+    preset_id: Optional[str] = None,
+    temperature: Optional[float] = None
+) -> str:
+    """Content address of an analysis request"""
+    payload = json.dumps({
+        "text": normalize_text(text),
+        "additional_prompt": (additional_prompt or "").strip(),
+        "preset_id": preset_id or "",
+        "temperature": temperature,
+        "model": settings.VERTEX_AI_MODEL,
+        "prompt_version": PROMPT_VERSION
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached analysis result (memory first, then the local disk tier)"""
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    result = _memory.get(key)
+    if result is None:
+        result = _disk.get(key)
+        if result is None:
+            return None
+        _memory.set(key, result)
+    logger.info(f"Analysis cache hit: {key[:12]}")
+    return copy.deepcopy(result)
+
+def store(key: str, result: Dict[str, Any]) -> None:
+    """Store an analysis result in both cache tiers"""
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return
+    result = copy.deepcopy(result)
+    _memory.set(key, result)
+    _disk.set(key, result)
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters of both tiers for this worker"""
+    return {
+        "enabled": settings.ANALYSIS_CACHE_ENABLED,
+        "memory": _memory.stats(),
+        "disk": _disk.stats()
+    }
@@ -1,8 +1,9 @@
 from typing import Optional, Dict, Any
 import logging
-from app.db.supabase import get_supabase_client, get_supabase_admin_client
+from app.db.supabase import get_supabase_client, get_supabase_admin_client, create_supabase_auth_client
 from app.models.user import UserCreate, UserLogin, User, UserInDB
 from app.services.preset_service import PresetService
+from app.services import user_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,7 +18,7 @@ class AuthService:
         logger.info(f"Attempting to register user: {user_data.email}")
         
         try:
-            supabase = get_supabase_client()
+            supabase = create_supabase_auth_client()
             supabase_admin = get_supabase_admin_client()
             logger.info("Supabase clients created successfully")
             
@@ -80,6 +81,8 @@ class AuthService:
                 try:
                     supabase_admin.table("users").insert(user_data_dict).execute()
                     logger.info("User data inserted successfully")
+                    # Profile changed: drop cached copies (other workers expire theirs by TTL)
+                    user_cache.invalidate_user(user_id)
                 except Exception as db_error:
                     logger.error(f"Database insertion error: {db_error}")
                     # If user already exists in database, try to get existing user
@@ -132,7 +135,7 @@ class AuthService:
     @staticmethod
     async def login(credentials: UserLogin) -> Dict[str, Any]:
         """Login a user with Supabase Auth"""
-        supabase = get_supabase_client()
+        supabase = create_supabase_auth_client()
         
         try:
             # Login with Supabase Auth (using sign_in for version 0.7.1)
@@ -171,7 +174,7 @@ class AuthService:
     @staticmethod
     async def logout(jwt: str) -> Dict[str, Any]:
         """Logout a user with Supabase Auth"""
-        supabase = get_supabase_client()
+        supabase = create_supabase_auth_client()
         
         try:
             # Logout with Supabase Auth
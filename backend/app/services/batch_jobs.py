@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.db.local_store import connect_local_db
+from app.models.batch import BatchItem, BatchJob
+from app.services import history_service, history_writer
+from app.services.ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+class BatchJobStore:
+    """Batch jobs and their items in a node-local SQLite database.
+
+    The job runs in the worker that accepted it, but its status is readable
+    from every worker on the node, so polling can land anywhere.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_local_db(self.name)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS batch_jobs ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, params TEXT NOT NULL, "
+                "status TEXT NOT NULL, total INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS batch_items ("
+                "job_id TEXT NOT NULL, idx INTEGER NOT NULL, text TEXT NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, history_id TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (job_id, idx))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_batch_jobs_created_at ON batch_jobs (created_at)")
+        return self._conn
+
+    def create(self, user_id: str, texts: List[str], params: Dict[str, Any]) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            self._purge(db, now)
+            db.execute("BEGIN")
+            try:
+                db.execute(
+                    "INSERT INTO batch_jobs (id, user_id, params, status, total, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                    (job_id, user_id, json.dumps(params, ensure_ascii=False), len(texts), now, now)
+                )
+                db.executemany(
+                    "INSERT INTO batch_items (job_id, idx, text, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                    [(job_id, index, text, now) for index, text in enumerate(texts)]
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def params(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._db().execute("SELECT params FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def pending_items(self, job_id: str) -> List[tuple]:
+        with self._lock:
+            return self._db().execute(
+                "SELECT idx, text FROM batch_items WHERE job_id = ? AND status IN ('pending', 'running') ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+
+    def set_job_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._db().execute(
+                "UPDATE batch_jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id)
+            )
+
+    def touch(self, job_id: str) -> None:
+        """Show that the worker running a job is alive"""
+        with self._lock:
+            self._db().execute(
+                "UPDATE batch_jobs SET updated_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id)
+            )
+
+    def fail_stale(self, stale_before: float, job_id: Optional[str] = None) -> int:
+        """Fail unfinished jobs not updated since `stale_before` (or just `job_id`); returns how many"""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                query = "SELECT id FROM batch_jobs WHERE status IN ('pending', 'running') AND updated_at < ?"
+                args: List[Any] = [stale_before]
+                if job_id:
+                    query += " AND id = ?"
+                    args.append(job_id)
+                stale = [row[0] for row in db.execute(query, args).fetchall()]
+                for stale_id in stale:
+                    db.execute(
+                        "UPDATE batch_items SET status = 'failed', error = ?, updated_at = ? "
+                        "WHERE job_id = ? AND status IN ('pending', 'running')",
+                        ("Обработка прервана: воркер, выполнявший пакет, остановился", now, stale_id)
+                    )
+                    db.execute("UPDATE batch_jobs SET status = 'failed', updated_at = ? WHERE id = ?", (now, stale_id))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return len(stale)
+
+    def set_item(self, job_id: str, index: int, status: str, result: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None, history_id: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE batch_items SET status = ?, result = ?, error = ?, history_id = ?, updated_at = ? "
+                "WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, history_id, now, job_id, index)
+            )
+            db.execute("UPDATE batch_jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def get(self, job_id: str, user_id: str, include_results: bool = True) -> Optional[BatchJob]:
+        """A job of the user with its items"""
+        with self._lock:
+            db = self._db()
+            job = db.execute(
+                "SELECT id, params, status, total, created_at, updated_at FROM batch_jobs WHERE id = ? AND user_id = ?",
+                (job_id, user_id)
+            ).fetchone()
+            if job is None:
+                return None
+            # Results are the bulk of a job; status polls leave them in the database
+            items = db.execute(
+                f"SELECT idx, status, {'result' if include_results else 'NULL'}, error, history_id "
+                "FROM batch_items WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+
+        params = json.loads(job[1])
+        batch_items = [
+            BatchItem(
+                index=index,
+                status=status,
+                result=json.loads(result) if result and include_results else None,
+                error=error,
+                history_id=history_id
+            )
+            for index, status, result, error, history_id in items
+        ]
+        return BatchJob(
+            id=job[0],
+            status=job[2],
+            preset_id=params.get("preset_id"),
+            save_history=params.get("save_history", True),
+            total=job[3],
+            done=sum(1 for item in batch_items if item.status == "done"),
+            failed=sum(1 for item in batch_items if item.status == "failed"),
+            created_at=datetime.fromtimestamp(job[4], timezone.utc),
+            updated_at=datetime.fromtimestamp(job[5], timezone.utc),
+            items=batch_items
+        )
+
+    def items(self, job_id: str, indexes: List[int]) -> List[BatchItem]:
+        """Items of a job with their results"""
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT idx, status, result, error, history_id FROM batch_items "
+                f"WHERE job_id = ? AND idx IN ({', '.join('?' * len(indexes))}) ORDER BY idx",
+                (job_id, *indexes)
+            ).fetchall()
+        return [
+            BatchItem(
+                index=index,
+                status=status,
+                result=json.loads(result) if result else None,
+                error=error,
+                history_id=history_id
+            )
+            for index, status, result, error, history_id in rows
+        ]
+
+    def _purge(self, db, now: float) -> None:
+        cutoff = now - settings.BATCH_JOB_TTL_SECONDS
+        db.execute("DELETE FROM batch_items WHERE job_id IN (SELECT id FROM batch_jobs WHERE created_at < ?)", (cutoff,))
+        db.execute("DELETE FROM batch_jobs WHERE created_at < ?", (cutoff,))
+
+_store = BatchJobStore("batch_jobs")
+
+# Shared by all batch jobs of this worker, so one big batch cannot take every LLM slot
+_item_semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+_tasks: Dict[str, asyncio.Task] = {}
+
+async def _process_item(job_id: str, user_id: str, index: int, total: int, text: str, params: Dict[str, Any]) -> bool:
+    async with _item_semaphore:
+        await asyncio.to_thread(_store.set_item, job_id, index, "running")
+        try:
+            analysis_result = await AIService.analyze_text(
+                text,
+                params.get("additional_prompt"),
+                params.get("preset_id"),
+                params.get("temperature"),
+                params.get("bypass_cache", False),
+                strict=True
+            )
+            result = analysis_result["result"]
+            history_id = None
+            if params.get("save_history", True):
+                history_data = history_service.history_entry_from_result(
+                    user_id,
+                    f"Пакетный анализ {index + 1}/{total} {datetime.now().strftime('%d.%m.%Y')}",
+                    "text",
+                    f"batch_{job_id[:8]}_{index + 1}.txt",
+                    result
+                )
+                history_id = await history_writer.enqueue(history_data)
+            await asyncio.to_thread(_store.set_item, job_id, index, "done", result=result, history_id=history_id)
+            return True
+        except Exception as e:
+            logger.error(f"Batch {job_id} item {index + 1}/{total} failed: {str(e)}")
+            await asyncio.to_thread(_store.set_item, job_id, index, "failed", error=str(e))
+            return False
+
+async def _heartbeat(job_id: str) -> None:
+    # Items can wait long for the semaphore; the job must not look abandoned meanwhile
+    while True:
+        await asyncio.sleep(settings.BATCH_JOB_STALE_SECONDS / 4)
+        try:
+            await asyncio.to_thread(_store.touch, job_id)
+        except Exception as e:
+            logger.warning(f"Batch {job_id} heartbeat failed: {e}")
+
+async def _run(job_id: str, user_id: str) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        params = await asyncio.to_thread(_store.params, job_id)
+        items = await asyncio.to_thread(_store.pending_items, job_id)
+        total = len(items)
+        logger.info(f"Batch {job_id}: analyzing {total} conversations")
+        await asyncio.to_thread(_store.set_job_status, job_id, "running")
+        outcomes = await asyncio.gather(
+            *[_process_item(job_id, user_id, index, total, text, params) for index, text in items]
+        )
+        await asyncio.to_thread(_store.set_job_status, job_id, "completed" if any(outcomes) or not outcomes else "failed")
+        logger.info(f"Batch {job_id} finished: {sum(outcomes)}/{total} succeeded")
+    finally:
+        heartbeat.cancel()
+        _tasks.pop(job_id, None)
+
+async def submit(user_id: str, texts: List[str], params: Dict[str, Any]) -> str:
+    """Create a batch job and start processing it in the background; returns the job id"""
+    # The store is shared by all workers on the node; its lock waits must not stall the event loop
+    job_id = await asyncio.to_thread(_store.create, user_id, texts, params)
+    _tasks[job_id] = asyncio.create_task(_run(job_id, user_id))
+    return job_id
+
+async def get_job(job_id: str, user_id: str, include_results: bool = True) -> Optional[BatchJob]:
+    return await asyncio.to_thread(_store.get, job_id, user_id, include_results)
+
+async def get_items(job_id: str, indexes: List[int]) -> List[BatchItem]:
+    """Finished items of a job with their results"""
+    return await asyncio.to_thread(_store.items, job_id, indexes)
+
+def is_finished(job: BatchJob) -> bool:
+    return job.status in ("completed", "failed")
+
+def is_stale(job: BatchJob) -> bool:
+    """Whether an unfinished job has not been touched within BATCH_JOB_STALE_SECONDS"""
+    return not is_finished(job) and time.time() - job.updated_at.timestamp() > settings.BATCH_JOB_STALE_SECONDS
+
+async def fail_stale(job_id: Optional[str] = None) -> int:
+    """Fail jobs abandoned by a worker that died without stopping them (all, or just `job_id`)"""
+    return await asyncio.to_thread(_store.fail_stale, time.time() - settings.BATCH_JOB_STALE_SECONDS, job_id)
+
+async def start() -> None:
+    """Fail jobs left running by a crashed worker"""
+    try:
+        failed = await fail_stale()
+    except Exception as e:
+        logger.error(f"Batch job store unavailable: {e}")
+        return
+    if failed:
+        logger.warning(f"Failed {failed} abandoned batch jobs")
+
+async def stop() -> None:
+    """Cancel running jobs of this worker; their unfinished items are marked failed"""
+    for job_id, task in list(_tasks.items()):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        for index, _ in await asyncio.to_thread(_store.pending_items, job_id):
+            await asyncio.to_thread(
+                _store.set_item, job_id, index, "failed", error="Обработка прервана перезапуском сервера"
+            )
+        await asyncio.to_thread(_store.set_job_status, job_id, "failed")
+    _tasks.clear()
@@ -0,0 +1,156 @@
+import json
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from app.services.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+MAX_MAIN_TOPICS = 5
+MAX_SUBTLETIES = 10
+
+def split_conversation(text: str, max_tokens: int, max_chunks: int) -> List[str]:
+    """Split a conversation into chunks of whole messages (lines) that fit the token budget.
+
+    If the text would need more than max_chunks chunks, the chunks grow instead.
+    """
+    budget = max(max_tokens, math.ceil(estimate_tokens(text) / max_chunks))
+    max_chars = budget * CHARS_PER_TOKEN
+
+    messages: List[str] = []
+    for line in text.splitlines():
+        # A single message longer than the budget is cut on word boundaries
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            messages.append(line[:cut])
+            line = line[cut:].lstrip()
+        messages.append(line)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for message in messages:
+        if current and current_len + len(message) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, current_len = [], 0
+        current.append(message)
+        current_len += len(message) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _weighted_mean(values: List[Any], weights: List[float]) -> Any:
+    mean = sum(v * w for v, w in zip(values, weights)) / sum(weights)
+    return round(mean) if all(isinstance(v, int) for v in values) else round(mean, 2)
+
+def _heaviest(values: List[Any], weights: List[float]) -> Any:
+    """Value from the largest chunk (the earliest one on ties)"""
+    return values[weights.index(max(weights))]
+
+def _merge_values(values: List[Any], weights: List[float]) -> Any:
+    """Generic deterministic merge of one field across chunk results"""
+    if all(_is_number(v) for v in values):
+        return _weighted_mean(values, weights)
+    if all(isinstance(v, dict) for v in values):
+        merged = {}
+        for key in dict.fromkeys(k for v in values for k in v):
+            present = [(v[key], w) for v, w in zip(values, weights) if key in v]
+            merged[key] = _merge_values([p[0] for p in present], [p[1] for p in present])
+        return merged
+    if all(isinstance(v, list) for v in values):
+        seen = set()
+        merged = []
+        for item in (item for v in values for item in v):
+            marker = json.dumps(item, ensure_ascii=False, sort_keys=True)
+            if marker not in seen:
+                seen.add(marker)
+                merged.append(item)
+        return merged
+    return _heaviest(values, weights)
+
+def _merge_summary(summaries: List[Dict[str, Any]], weights: List[float]) -> Dict[str, Any]:
+    topic_counts = Counter(t for s in summaries for t in dict.fromkeys(s.get("mainTopics") or []))
+    # Most frequent topics first; Counter keeps first-seen order on ties
+    topics = [topic for topic, _ in topic_counts.most_common(MAX_MAIN_TOPICS)]
+    participants = [s["participants"] for s in summaries if _is_number(s.get("participants"))]
+    message_counts = [s["messageCount"] for s in summaries if _is_number(s.get("messageCount"))]
+    merged = _merge_values(summaries, weights)
+    merged.update({
+        "overview": " ".join(s["overview"] for s in summaries if s.get("overview")),
+        "participants": max(participants) if participants else merged.get("participants"),
+        "messageCount": sum(message_counts) if message_counts else merged.get("messageCount"),
+        "mainTopics": topics
+    })
+    return merged
+
+def _merge_emotion_timeline(timelines: List[Dict[str, Any]], weights: List[float]) -> Dict[str, Any]:
+    emotions = [e for t in timelines for e in (t.get("emotions") or [])]
+    dominant_votes: Dict[str, float] = {}
+    for timeline, weight in zip(timelines, weights):
+        dominant = timeline.get("dominantEmotion")
+        if dominant:
+            dominant_votes[dominant] = dominant_votes.get(dominant, 0) + weight
+    shifts = sum(t["emotionalShifts"] for t in timelines if _is_number(t.get("emotionalShifts")))
+    # A change of emotion across a chunk boundary is a shift no chunk could see
+    for previous, following in zip(timelines, timelines[1:]):
+        if previous.get("emotions") and following.get("emotions"):
+            if previous["emotions"][-1].get("emotion") != following["emotions"][0].get("emotion"):
+                shifts += 1
+    return {
+        "emotions": emotions,
+        "dominantEmotion": max(dominant_votes, key=dominant_votes.get) if dominant_votes else None,
+        "emotionalShifts": shifts
+    }
+
+def _merge_judge_score(scores: List[Dict[str, Any]], weights: List[float]) -> Dict[str, Any]:
+    merged = _merge_values(scores, weights)
+    overall = merged.get("overallScore")
+    # Verdict and recommendation come from the chunk whose score is closest to the merged one
+    if _is_number(overall):
+        distances = [
+            abs(s["overallScore"] - overall) if _is_number(s.get("overallScore")) else math.inf
+            for s in scores
+        ]
+        representative = scores[distances.index(min(distances))]
+    else:
+        representative = _heaviest(scores, weights)
+    for key in ("verdict", "recommendation"):
+        if key in representative:
+            merged[key] = representative[key]
+    return merged
+
+def _merge_subtleties(subtleties: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    best: Dict[tuple, Dict[str, Any]] = {}
+    for item in (item for items in subtleties for item in items if isinstance(item, dict)):
+        key = (item.get("type"), item.get("message"))
+        if key not in best or (item.get("confidence") or 0) > (best[key].get("confidence") or 0):
+            best[key] = item
+    # sorted() is stable, so equal confidences keep chunk order
+    ranked = sorted(best.values(), key=lambda item: -(item.get("confidence") or 0))
+    return ranked[:MAX_SUBTLETIES]
+
+def merge_analysis_results(results: List[Dict[str, Any]], weights: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Deterministically combine per-chunk analyses (in conversation order) into one result"""
+    if len(results) == 1:
+        return results[0]
+    weights = weights or [1.0] * len(results)
+
+    merged: Dict[str, Any] = {}
+    for key in dict.fromkeys(k for r in results for k in r):
+        present = [(r[key], w) for r, w in zip(results, weights) if key in r]
+        values = [p[0] for p in present]
+        value_weights = [p[1] for p in present]
+        if key == "summary" and all(isinstance(v, dict) for v in values):
+            merged[key] = _merge_summary(values, value_weights)
+        elif key == "emotionTimeline" and all(isinstance(v, dict) for v in values):
+            merged[key] = _merge_emotion_timeline(values, value_weights)
+        elif key == "aiJudgeScore" and all(isinstance(v, dict) for v in values):
+            merged[key] = _merge_judge_score(values, value_weights)
+        elif key == "subtleties" and all(isinstance(v, list) for v in values):
+            merged[key] = _merge_subtleties(values)
+        else:
+            merged[key] = _merge_values(values, value_weights)
+    return merged
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.local_store import connect_local_db
+from app.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on turns kept per conversation, whatever the token budget
+MAX_STORED_TURNS = 50
+
+def trim_to_token_budget(turns: List[Dict[str, str]], budget: int) -> List[Dict[str, str]]:
+    """Keep the most recent turns whose combined size fits the token budget"""
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn["user"]) + estimate_tokens(turn["ai"])
+        if used + cost > budget:
+            break
+        kept.append(turn)
+        used += cost
+    kept.reverse()
+    return kept
+
+class MemoryConversationStore:
+    """Per-worker LRU of conversations; each conversation expires after TTL without activity"""
+
+    def __init__(self, max_conversations: int, ttl_seconds: float):
+        self._conversations = TTLCache(max_conversations, ttl_seconds)
+        self._lock = threading.Lock()
+
+    def get_turns(self, conversation_id: str) -> List[Dict[str, str]]:
+        return list(self._conversations.get(conversation_id) or [])
+
+    def append_turn(self, conversation_id: str, user: str, ai: str) -> None:
+        with self._lock:
+            turns = self._conversations.get(conversation_id) or []
+            turns = (turns + [{"user": user, "ai": ai}])[-MAX_STORED_TURNS:]
+            # Re-setting refreshes the TTL, so active conversations stay alive
+            self._conversations.set(conversation_id, turns)
+
+class SQLiteConversationStore:
+    """Conversations in a node-local SQLite database shared by all workers.
+
+    Every turn is a separate row, so appends from different workers never
+    overwrite each other.
+    """
+
+    # Expired and least recently active conversations are purged every N appends
+    EVICT_EVERY = 64
+
+    def __init__(self, name: str, max_conversations: int, ttl_seconds: float):
+        self.name = name
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_local_db(self.name)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_turns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, "
+                "user_message TEXT NOT NULL, ai_message TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_turns_conversation ON chat_turns (conversation_id, id)"
+            )
+        return self._conn
+
+    def get_turns(self, conversation_id: str) -> List[Dict[str, str]]:
+        try:
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT user_message, ai_message, created_at FROM chat_turns "
+                    "WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+                    (conversation_id, MAX_STORED_TURNS)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Conversation store read failed: {e}")
+            return []
+        # The conversation expires as a whole once its latest turn is older than the TTL
+        if not rows or rows[0][2] < time.time() - self.ttl_seconds:
+            return []
+        return [{"user": user, "ai": ai} for user, ai, _ in reversed(rows)]
+
+    def append_turn(self, conversation_id: str, user: str, ai: str) -> None:
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT INTO chat_turns (conversation_id, user_message, ai_message, created_at) VALUES (?, ?, ?, ?)",
+                    (conversation_id, user, ai, now)
+                )
+                db.execute(
+                    "DELETE FROM chat_turns WHERE conversation_id = ? AND id NOT IN ("
+                    "SELECT id FROM chat_turns WHERE conversation_id = ? ORDER BY id DESC LIMIT ?)",
+                    (conversation_id, conversation_id, MAX_STORED_TURNS)
+                )
+                self._writes += 1
+                if self._writes % self.EVICT_EVERY == 0:
+                    self._evict(db, now)
+        except Exception as e:
+            logger.error(f"Conversation store write failed: {e}")
+
+    def _evict(self, db, now: float) -> None:
+        db.execute(
+            "DELETE FROM chat_turns WHERE conversation_id IN ("
+            "SELECT conversation_id FROM chat_turns GROUP BY conversation_id HAVING MAX(created_at) < ?)",
+            (now - self.ttl_seconds,)
+        )
+        db.execute(
+            "DELETE FROM chat_turns WHERE conversation_id IN ("
+            "SELECT conversation_id FROM chat_turns GROUP BY conversation_id "
+            "ORDER BY MAX(created_at) DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversations,)
+        )
+
+def _create_store():
+    if settings.CHAT_STORE_BACKEND == "memory":
+        return MemoryConversationStore(settings.CHAT_MAX_CONVERSATIONS, settings.CHAT_CONVERSATION_TTL_SECONDS)
+    if settings.CHAT_STORE_BACKEND != "sqlite":
+        logger.warning(f"Unknown CHAT_STORE_BACKEND '{settings.CHAT_STORE_BACKEND}', using sqlite")
+    return SQLiteConversationStore("chat_conversations", settings.CHAT_MAX_CONVERSATIONS, settings.CHAT_CONVERSATION_TTL_SECONDS)
+
+_store = _create_store()
+
+# The SQLite store waits for other workers' locks, so it is used from a thread, never on the event loop
+
+async def get_history(conversation_id: Optional[str], token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """Recent turns of a conversation that fit the prompt token budget"""
+    if not conversation_id:
+        return []
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    return trim_to_token_budget(await asyncio.to_thread(_store.get_turns, conversation_id), budget)
+
+async def append_turn(conversation_id: Optional[str], user: str, ai: str) -> None:
+    """Record one user/AI exchange"""
+    if conversation_id:
+        await asyncio.to_thread(_store.append_turn, conversation_id, user, ai)
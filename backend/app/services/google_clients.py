@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional
+import grpc
+from google.cloud import speech, vision
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _channel_options():
+    return [
+        ("grpc.max_send_message_length", -1),
+        ("grpc.max_receive_message_length", -1),
+        # Keep idle channels warm between requests instead of reconnecting
+        ("grpc.keepalive_time_ms", settings.GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", settings.GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+class _PooledClient:
+    """Lazily created Google API client shared by the whole worker"""
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._client = None
+        self._channel: Optional[grpc.Channel] = None
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    logger.info(f"Creating pooled {self.name} client")
+                    try:
+                        self._client, self._channel = self._factory()
+                        self.last_error = None
+                    except Exception as e:
+                        self.last_error = str(e)
+                        raise
+        return self._client
+
+    def probe(self, timeout: float) -> Dict[str, Any]:
+        status = {"initialized": self._client is not None, "ready": None, "error": self.last_error}
+        if self._channel is not None:
+            try:
+                grpc.channel_ready_future(self._channel).result(timeout=timeout)
+                status["ready"] = True
+            except grpc.FutureTimeoutError:
+                status["ready"] = False
+        return status
+
+    def close(self) -> None:
+        with self._lock:
+            if self._channel is not None:
+                self._channel.close()
+            self._client = None
+            self._channel = None
+
+def _create_vision_client():
+    channel = ImageAnnotatorGrpcTransport.create_channel(
+        f"{ImageAnnotatorGrpcTransport.DEFAULT_HOST}:443", options=_channel_options()
+    )
+    transport = ImageAnnotatorGrpcTransport(channel=channel)
+    return vision.ImageAnnotatorClient(transport=transport), channel
+
+def _create_speech_client():
+    channel = SpeechGrpcTransport.create_channel(
+        f"{SpeechGrpcTransport.DEFAULT_HOST}:443", options=_channel_options()
+    )
+    transport = SpeechGrpcTransport(channel=channel)
+    return speech.SpeechClient(transport=transport), channel
+
+_vision = _PooledClient("vision", _create_vision_client)
+_speech = _PooledClient("speech", _create_speech_client)
+
+def get_vision_client() -> vision.ImageAnnotatorClient:
+    """Shared Vision client (created on first use)"""
+    return _vision.get()
+
+def get_speech_client() -> speech.SpeechClient:
+    """Shared Speech-to-Text client (created on first use)"""
+    return _speech.get()
+
+async def probe(timeout: float = 2.0) -> Dict[str, Any]:
+    """Health of the pooled clients; channels that were never used are not opened"""
+    vision_status, speech_status = await asyncio.gather(
+        asyncio.to_thread(_vision.probe, timeout),
+        asyncio.to_thread(_speech.probe, timeout)
+    )
+    return {"vision": vision_status, "speech": speech_status}
+
+def close() -> None:
+    """Close the pooled channels (called on shutdown)"""
+    _vision.close()
+    _speech.close()
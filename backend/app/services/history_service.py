@@ -1,68 +1,161 @@
+import base64
+import json
 import logging
+from datetime import datetime
 from uuid import UUID
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
+from postgrest.types import ReturnMethod
+from app.core import metrics
 from app.db.supabase import get_supabase_client, get_supabase_admin_client
-from app.models.history import AnalysisHistoryCreate, AnalysisHistoryItem, AnalysisHistory
+from app.models.history import AnalysisHistoryCreate, AnalysisHistoryItem, AnalysisHistory, AnalysisHistoryPage
 
 logger = logging.getLogger(__name__)
 
-async def save_analysis_history(analysis_data: AnalysisHistoryCreate) -> Dict[str, Any]:
+def _summary_count(value: Any) -> int:
+    """Integer for a summary column; fields the model left out or null count as 0"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return round(value)
+    return 0
+
+def history_entry_from_result(user_id: Any, title: str, file_type: str, file_name: str, result: Dict[str, Any]) -> AnalysisHistoryCreate:
+    """History entry for an analysis result, with the summary fields the list view shows"""
+    summary = result.get("summary") or {}
+    timeline = result.get("emotionTimeline") or {}
+    judge = result.get("aiJudgeScore") or {}
+    return AnalysisHistoryCreate(
+        user_id=user_id,
+        title=title,
+        file_type=file_type,
+        file_name=file_name,
+        analysis_results=result,
+        dominant_emotion=timeline.get("dominantEmotion") or "Не определено",
+        overall_score=_summary_count(judge.get("overallScore")),
+        message_count=_summary_count(summary.get("messageCount")),
+        participants=_summary_count(summary.get("participants"))
+    )
+
+def build_history_row(analysis_data: AnalysisHistoryCreate, history_id: Optional[str] = None, date: Optional[datetime] = None) -> Dict[str, Any]:
+    """Row for the analysis_history table; id and date are set when the row is written later"""
+    row = {
+        "user_id": str(analysis_data.user_id),
+        "title": analysis_data.title,
+        "file_type": analysis_data.file_type,
+        "file_name": analysis_data.file_name,
+        "file_url": analysis_data.file_url,
+        "analysis_results": analysis_data.analysis_results,
+        "dominant_emotion": analysis_data.dominant_emotion,
+        "overall_score": analysis_data.overall_score,
+        "message_count": analysis_data.message_count,
+        "participants": analysis_data.participants
+    }
+    if history_id:
+        row["id"] = history_id
+    if date:
+        row["date"] = date.isoformat()
+        row["created_at"] = date.isoformat()
+    return row
+
+async def save_analysis_history(analysis_data: AnalysisHistoryCreate, history_id: Optional[str] = None) -> Dict[str, Any]:
     """Save analysis result to history"""
     # Use admin client to bypass RLS policies
     client = get_supabase_admin_client()
     
     try:
         # Insert data into the analysis_history table
-        response = client.table('analysis_history').insert({
-            "user_id": str(analysis_data.user_id),
-            "title": analysis_data.title,
-            "file_type": analysis_data.file_type,
-            "file_name": analysis_data.file_name,
-            "file_url": analysis_data.file_url,
-            "analysis_results": analysis_data.analysis_results,
-            "dominant_emotion": analysis_data.dominant_emotion,
-            "overall_score": analysis_data.overall_score,
-            "message_count": analysis_data.message_count,
-            "participants": analysis_data.participants
-        }).execute()
-        
-        if "error" in response:
-            logger.error(f"Failed to save analysis history: {response['error']}")
-            return {"success": False, "error": response["error"]}
+        with metrics.stage("history_save"):
+            response = client.table('analysis_history').insert(
+                build_history_row(analysis_data, history_id)
+            ).execute()
         
         return {"success": True, "data": response.data[0]}
     except Exception as e:
         logger.error(f"Error saving analysis history: {str(e)}")
         return {"success": False, "error": str(e)}
 
-async def get_user_analysis_history(user_id: UUID) -> List[AnalysisHistoryItem]:
-    """Get analysis history for a specific user"""
-    logger.info(f"Getting analysis history for user {user_id}")
+def insert_history_rows(rows: List[Dict[str, Any]]) -> None:
+    """Bulk-insert prepared rows (blocking); raises on failure.
+
+    Rows that already exist are skipped, so a batch can be retried safely after
+    a timeout that hid a successful write.
+    """
+    client = get_supabase_admin_client()
+    with metrics.stage("history_save"):
+        client.table('analysis_history').upsert(
+            rows, returning=ReturnMethod.minimal, ignore_duplicates=True
+        ).execute()
+
+def encode_history_cursor(date: str, history_id: str) -> str:
+    """Opaque cursor pointing after the (date, id) of the last returned row"""
+    payload = json.dumps({"d": date, "i": history_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_history_cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(payload["d"]), str(UUID(payload["i"]))
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {e}")
+
+async def get_user_analysis_history(
+    user_id: UUID,
+    limit: Optional[int] = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = False
+) -> AnalysisHistoryPage:
+    """Get one page of analysis history for a specific user, newest first.
+
+    Pages are keyset-paginated on (date, id) so every page is an index range scan
+    on idx_analysis_history_user_date_id, however deep the user scrolls. With no
+    limit the rest of the history is returned as a single page.
+    """
+    logger.info(f"Getting analysis history for user {user_id} (limit={limit}, cursor={'yes' if cursor else 'no'})")
+    
+    # Decode before touching the database so a bad cursor surfaces as ValueError
+    after = decode_history_cursor(cursor) if cursor else None
     
     # Use admin client to ensure we can bypass RLS if needed
     client = get_supabase_admin_client()
     
     try:
         query = client.table('analysis_history').select(
-            "id, title, date, dominant_emotion, overall_score, message_count, participants, file_type"
-        ).eq('user_id', str(user_id)).order('date', desc=True)
+            "id, title, date, dominant_emotion, overall_score, message_count, participants, file_type",
+            count="exact" if include_total else None
+        ).eq('user_id', str(user_id))
         
-        logger.info(f"Executing query: {query}")
+        if after:
+            after_date, after_id = after
+            # Rows strictly after the cursor in (date desc, id desc) order
+            query.params = query.params.add(
+                "or", f'(date.lt."{after_date}",and(date.eq."{after_date}",id.lt.{after_id}))'
+            )
+        
+        # order() appends a separate "order" param per call; PostgREST needs both keys in one
+        query.params = query.params.add("order", "date.desc,id.desc")
+        
+        # Fetch one extra row to know whether another page exists
+        if limit is not None:
+            query = query.limit(limit + 1)
         response = query.execute()
         
-        if "error" in response:
-            logger.error(f"Failed to get analysis history: {response['error']}")
-            return []
+        rows = response.data
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_history_cursor(rows[-1]["date"], rows[-1]["id"])
         
-        logger.info(f"Found {len(response.data)} history items for user {user_id}")
-        logger.info(f"Data: {response.data}")
+        logger.info(f"Found {len(rows)} history items for user {user_id}")
         
-        result = [AnalysisHistoryItem(**item) for item in response.data]
-        return result
+        return AnalysisHistoryPage(
+            items=[AnalysisHistoryItem(**item) for item in rows],
+            next_cursor=next_cursor,
+            total=response.count if include_total else None
+        )
     except Exception as e:
         logger.error(f"Error getting analysis history: {str(e)}")
-        return []
+        return AnalysisHistoryPage(items=[])
 
 async def get_analysis_detail(history_id: UUID, user_id: UUID) -> Optional[AnalysisHistory]:
     """Get detailed analysis by id"""
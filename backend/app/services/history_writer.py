@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from prometheus_client import Counter, Gauge
+from app.core.config import settings
+from app.models.history import AnalysisHistory, AnalysisHistoryCreate
+from app.services import history_service
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge(
+    "gossipai_history_queue_depth",
+    "History rows waiting to be written",
+    multiprocess_mode="livesum"
+)
+ROWS_WRITTEN = Counter(
+    "gossipai_history_rows_written_total",
+    "History rows written by the background writer",
+    ["outcome"]
+)
+
+class HistoryWriter:
+    """Write-behind queue for analysis history.
+
+    Endpoints get a pre-generated id back immediately; a background task
+    bulk-inserts pending rows in batches and retries failed batches with
+    exponential backoff. Pending rows live in this worker's memory until written.
+    """
+
+    def __init__(self):
+        # history id -> row, in arrival order
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("History writer started")
+
+    async def enqueue(self, analysis_data: AnalysisHistoryCreate) -> Optional[str]:
+        """Queue a history entry and return its id (None if an inline write failed)"""
+        history_id = str(uuid.uuid4())
+        row = history_service.build_history_row(analysis_data, history_id, datetime.now(timezone.utc))
+
+        if self._task is None or len(self._pending) >= settings.HISTORY_WRITER_MAX_PENDING:
+            # Not running (e.g. scripts) or backlog full: write on the request path as before
+            logger.warning(f"History writer unavailable or full ({len(self._pending)} pending), writing inline")
+            try:
+                await asyncio.to_thread(history_service.insert_history_rows, [row])
+            except Exception as e:
+                logger.error(f"Error saving analysis history: {str(e)}")
+                return None
+            return history_id
+
+        self._pending[history_id] = row
+        QUEUE_DEPTH.set(len(self._pending))
+        if len(self._pending) >= settings.HISTORY_WRITER_BATCH_SIZE:
+            self._wakeup.set()
+        return history_id
+
+    def get_pending(self, history_id: str, user_id: str) -> Optional[AnalysisHistory]:
+        """A queued entry that has not reached the database yet"""
+        row = self._pending.get(history_id)
+        if row is None or row["user_id"] != user_id:
+            return None
+        return AnalysisHistory(**row)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.HISTORY_WRITER_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        """Write everything pending, one batch at a time"""
+        while self._pending:
+            batch = list(self._pending.items())[:settings.HISTORY_WRITER_BATCH_SIZE]
+            if not await self._write_batch([row for _, row in batch]):
+                if len(batch) == 1:
+                    logger.error(f"Dropping history entry {batch[0][0]} after {settings.HISTORY_WRITER_MAX_ATTEMPTS} attempts")
+                    ROWS_WRITTEN.labels("dropped").inc()
+                    self._pending.pop(batch[0][0], None)
+                    continue
+                # Write rows one by one so a single bad row does not block the rest
+                for history_id, row in batch:
+                    if await self._write_batch([row]):
+                        ROWS_WRITTEN.labels("written").inc()
+                    else:
+                        logger.error(f"Dropping history entry {history_id} after {settings.HISTORY_WRITER_MAX_ATTEMPTS} attempts")
+                        ROWS_WRITTEN.labels("dropped").inc()
+                    self._pending.pop(history_id, None)
+            else:
+                ROWS_WRITTEN.labels("written").inc(len(batch))
+                for history_id, _ in batch:
+                    self._pending.pop(history_id, None)
+            QUEUE_DEPTH.set(len(self._pending))
+
+    async def _write_batch(self, rows: List[Dict[str, Any]]) -> bool:
+        delay = settings.HISTORY_WRITER_RETRY_BASE_SECONDS
+        for attempt in range(1, settings.HISTORY_WRITER_MAX_ATTEMPTS + 1):
+            try:
+                await asyncio.to_thread(history_service.insert_history_rows, rows)
+                return True
+            except Exception as e:
+                logger.warning(f"History batch of {len(rows)} failed (attempt {attempt}): {e}")
+                if attempt < settings.HISTORY_WRITER_MAX_ATTEMPTS:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, settings.HISTORY_WRITER_RETRY_MAX_SECONDS)
+        return False
+
+    async def stop(self) -> None:
+        """Stop the background task and flush what is still pending"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            # The loop flushes once more before it exits
+            await asyncio.wait_for(self._task, timeout=settings.HISTORY_WRITER_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(f"History writer shutdown timed out, {len(self._pending)} entries not written")
+        self._task = None
+        logger.info("History writer stopped")
+
+_writer = HistoryWriter()
+
+def start() -> None:
+    _writer.start()
+
+async def stop() -> None:
+    await _writer.stop()
+
+async def enqueue(analysis_data: AnalysisHistoryCreate) -> Optional[str]:
+    """Queue a history entry for writing and return its id"""
+    return await _writer.enqueue(analysis_data)
+
+def get_pending(history_id: str, user_id: str) -> Optional[AnalysisHistory]:
+    return _writer.get_pending(history_id, user_id)
+
+def queue_depth() -> int:
+    return _writer.depth()
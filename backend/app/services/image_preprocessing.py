@@ -0,0 +1,139 @@
+"""Image preparation for OCR, run in a process pool.
+
+Only the standard library and Pillow are imported here: the pool's processes
+are spawned and import this module, not the app.
+"""
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from statistics import median
+from typing import Optional
+from PIL import Image, ImageFilter, ImageOps
+
+# Pixel is an edge above this gradient; a row with this share of edges holds text
+EDGE_THRESHOLD = 40
+TEXT_ROW_EDGE_SHARE = 0.02
+# Shorter runs are rules, borders and noise rather than text
+MIN_TEXT_HEIGHT = 4
+# Never shrink more than this, whatever the text height estimate says
+MIN_SCALE = 0.25
+# Side of the difference hash grid: 16 gives 256 bits, fine enough to tell chat screenshots apart
+HASH_SIZE = 16
+
+@dataclass
+class PreparedImage:
+    # None when the original is to be sent: it is not copied back from the pool process
+    content: Optional[bytes]
+    bytes_in: int
+    bytes_out: int
+    width: int
+    height: int
+    scale: float
+    dhash: int
+    seconds: float
+    error: Optional[str] = None
+
+def dhash(image: Image.Image) -> int:
+    """Difference hash of a grayscale image; near-identical pictures differ in few bits"""
+    small = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = row * (HASH_SIZE + 1) + column
+            value = (value << 1) | (pixels[left] > pixels[left + 1])
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def estimate_text_height(image: Image.Image) -> Optional[int]:
+    """Median height in pixels of the text lines of a grayscale image, None if none are found.
+
+    Text rows are dense in edges, while flat backgrounds and message bubbles are
+    not, so runs of edge-dense rows are the lines of text.
+    """
+    edges = image.filter(ImageFilter.FIND_EDGES).point(lambda value: 255 if value > EDGE_THRESHOLD else 0)
+    # Squeezing to one column averages each row: 255 * share of edge pixels
+    rows = list(edges.resize((1, image.height), Image.BOX).getdata())
+    runs = []
+    run = 0
+    for value in rows:
+        if value > TEXT_ROW_EDGE_SHARE * 255:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    if run:
+        runs.append(run)
+    runs = [run for run in runs if run >= MIN_TEXT_HEIGHT]
+    return int(median(runs)) if runs else None
+
+def prepare(image_data: bytes, target_text_height: int, max_side: int) -> PreparedImage:
+    """Downscale to the target text height, convert to grayscale and re-encode without metadata.
+
+    The original is kept when it cannot be decoded or the result is not smaller.
+    """
+    started = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(image_data)) as opened:
+            source_format = opened.format
+            # Photos carry their rotation in EXIF, which is dropped below
+            image = ImageOps.exif_transpose(opened).convert("L")
+
+        width, height = image.width, image.height
+        scale = 1.0
+        text_height = estimate_text_height(image)
+        if text_height and text_height > target_text_height:
+            scale = max(MIN_SCALE, target_text_height / text_height)
+        scale = min(scale, max_side / max(image.width, image.height))
+        if scale < 1.0:
+            image = image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS
+            )
+        else:
+            scale = 1.0
+
+        output = io.BytesIO()
+        if source_format == "JPEG":
+            # Camera photos stay JPEG; screenshots compress far better as PNG
+            image.save(output, format="JPEG", quality=85, optimize=True)
+        else:
+            image.save(output, format="PNG")
+        content = output.getvalue()
+        bytes_out = len(content)
+        if bytes_out < len(image_data):
+            width, height = image.width, image.height
+        else:
+            # Vision gets the original, so report it as sent
+            content = None
+            bytes_out = len(image_data)
+            scale = 1.0
+        return PreparedImage(
+            content=content, bytes_in=len(image_data), bytes_out=bytes_out,
+            width=width, height=height, scale=round(scale, 3),
+            dhash=dhash(image), seconds=time.perf_counter() - started
+        )
+    except Exception as e:
+        return PreparedImage(
+            content=None, bytes_in=len(image_data), bytes_out=len(image_data),
+            width=0, height=0, scale=1.0, dhash=0, seconds=time.perf_counter() - started, error=str(e)
+        )
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pool(processes: int) -> ProcessPoolExecutor:
+    """Process pool of this worker, created on first use"""
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the worker has gRPC threads that must not be copied into children
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
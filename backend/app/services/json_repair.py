@@ -0,0 +1,105 @@
+import json
+from typing import Any, List, Tuple
+
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder(strict=False)
+
+def _document_start(text: str) -> str:
+    """Strip a markdown fence or prose around the JSON document"""
+    fence = text.find("```")
+    if fence != -1:
+        body_start = text.find("\n", fence)
+        body_end = text.find("```", fence + 3)
+        if body_start != -1 and (body_end == -1 or body_start < body_end):
+            # An unclosed fence means the response was cut off inside it
+            text = text[body_start + 1:body_end] if body_end != -1 else text[body_start + 1:]
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    return text[min(starts):] if starts else text.strip()
+
+def _repair(text: str) -> str:
+    """Close a truncated or slightly broken JSON document.
+
+    Trailing commas are removed and, if the text ends early, it is cut back to
+    the last complete member or element before the open brackets are closed, so
+    partially written fields are dropped instead of guessed.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    # Previous structural character outside strings; tells keys from values
+    last_sig = ""
+    safe_len = 0
+    safe_stack: Tuple[str, ...] = ()
+
+    def strip_trailing_comma() -> None:
+        while out and out[-1] in " \t\r\n":
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+                is_key = stack and stack[-1] == "{" and last_sig in "{,"
+                last_sig = '"'
+                if not is_key:
+                    safe_len, safe_stack = len(out), tuple(stack)
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+            last_sig = char
+            safe_len, safe_stack = len(out), tuple(stack)
+        elif char in "}]":
+            if not stack:
+                break
+            strip_trailing_comma()
+            out.append(_CLOSERS[stack.pop()])
+            last_sig = char
+            safe_len, safe_stack = len(out), tuple(stack)
+            if not stack:
+                break
+        elif char == ",":
+            strip_trailing_comma()
+            safe_len, safe_stack = len(out), tuple(stack)
+            out.append(char)
+            last_sig = char
+        else:
+            if char == ":":
+                last_sig = char
+            out.append(char)
+
+    if stack or in_string:
+        del out[safe_len:]
+        strip_trailing_comma()
+        out.extend(_CLOSERS[opener] for opener in reversed(safe_stack))
+    return "".join(out)
+
+def loads_tolerant(text: str) -> Tuple[Any, bool]:
+    """Parse model output as JSON, repairing it if needed.
+
+    Returns the parsed value and whether a repair was necessary; raises
+    ValueError if the output cannot be turned into JSON at all.
+    """
+    document = _document_start(text)
+    try:
+        # raw_decode ignores whatever the model wrote after the document
+        return _decoder.raw_decode(document)[0], False
+    except json.JSONDecodeError:
+        pass
+    repaired = _repair(document)
+    try:
+        return _decoder.raw_decode(repaired)[0], True
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Unrepairable JSON in model output: {e}") from e
@@ -0,0 +1,69 @@
+import json
+import logging
+from typing import Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TopLevelJSONStream:
+    """Incremental scanner that yields top-level members of a streamed JSON object.
+
+    The model output arrives in arbitrary chunks and may be wrapped in a markdown
+    code fence. Each member ("summary": {...}) is returned as soon as the scanner
+    sees the comma or closing brace that ends it.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = -1
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add a chunk of model output and return the members it completed"""
+        self._buffer += chunk
+        members = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer) and not self.done:
+            char = buffer[pos]
+            if self._depth == 0:
+                # Skip everything before the opening brace (markdown fence, prose)
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = pos + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._member_start:pos], members)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                self._emit(buffer[self._member_start:pos], members)
+                self._member_start = pos + 1
+            pos += 1
+        self._pos = pos
+        return members
+
+    @staticmethod
+    def _emit(member_text: str, members: List[Tuple[str, Any]]) -> None:
+        if not member_text.strip():
+            return
+        try:
+            member = json.loads("{" + member_text + "}")
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping unparsable streamed member: {e}")
+            return
+        members.extend(member.items())
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+from app.core import metrics
+from app.core.config import settings
+from app.db.local_store import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Shared by all workers on the node; least recently used entries are evicted first
+_disk = SQLiteCache("ocr_cache", settings.OCR_CACHE_MAX_ENTRIES, settings.OCR_CACHE_TTL_SECONDS)
+
+def make_key(image_digest: str, language_hints: List[str], cleaner_version: str) -> str:
+    """Content address of an OCR result: the image bytes and everything that shapes the text"""
+    payload = json.dumps({
+        "image": image_digest,
+        "language_hints": language_hints,
+        "cleaner_version": cleaner_version,
+        # Preprocessing changes what Vision sees, so it is part of the key too
+        "preprocess": [
+            settings.OCR_PREPROCESS_ENABLED, settings.OCR_TARGET_TEXT_HEIGHT_PX, settings.OCR_MAX_IMAGE_SIDE_PX
+        ]
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """A cached OCR result, or None"""
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+    result = _disk.get(key)
+    metrics.count_ocr_cache("hit" if result is not None else "miss")
+    if result is not None:
+        logger.info(f"OCR cache hit: {key[:12]}")
+    return result
+
+def store(key: str, result: Dict[str, Any]) -> None:
+    """Store a successful OCR result (failures and fallbacks are not cached)"""
+    if not settings.OCR_CACHE_ENABLED or not result.get("success") or not result.get("text"):
+        return
+    _disk.set(key, {name: value for name, value in result.items() if name != "preprocessing"})
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters of this worker"""
+    return {"enabled": settings.OCR_CACHE_ENABLED, **_disk.stats()}
@@ -1,16 +1,58 @@
 import os
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
 from google.cloud import vision
+from app.core import metrics
 from app.core.config import settings
+from app.services import image_preprocessing, ocr_cache
+from app.services.google_clients import get_vision_client
+from app.services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Vision API accepts at most 16 images in one synchronous batch request
+VISION_BATCH_SIZE = 16
+OCR_LANGUAGE_HINTS = ["ru", "en"]  # Prioritize Russian, fallback to English
+
+# Bump when clean_extracted_text changes so cached texts are not served
+CLEANER_VERSION = "1"
+
+# The same screenshot uploaded concurrently is recognized once
+_ocr_flights = SingleFlight("ocr", cross_worker=settings.SINGLE_FLIGHT_CROSS_WORKER)
+
+# Uploads arrive as views of the spooled file; the Vision request itself needs bytes
+ImageData = Union[bytes, memoryview]
+
+def _image_key(images: List[ImageData]) -> str:
+    digest = hashlib.sha256()
+    for image_data in images:
+        digest.update(hashlib.sha256(image_data).digest())
+    return digest.hexdigest()
+
+def _cache_key(image_data: ImageData) -> str:
+    return ocr_cache.make_key(hashlib.sha256(image_data).hexdigest(), OCR_LANGUAGE_HINTS, CLEANER_VERSION)
+
+def _image_report(bytes_in: int, bytes_out: int = 0, seconds: float = 0.0, scale: float = 1.0,
+                  cached: bool = False, duplicate_of: Optional[int] = None) -> Dict[str, Any]:
+    """What happened to one image before OCR (reported in the result as "preprocessing")"""
+    return {
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+        "seconds": seconds,
+        "scale": scale,
+        "cached": cached,
+        "duplicate_of": duplicate_of,
+        "near_duplicate_of": None
+    }
+
 class OCRService:
     """Service for handling OCR with Google Vision API"""
     
     @staticmethod
-    async def extract_text(image_data: bytes) -> str:
+    async def extract_text(image_data: ImageData) -> str:
         """Extract text from image - wrapper method for compatibility"""
         try:
             result = await OCRService.extract_text_from_image(image_data)
@@ -24,8 +66,191 @@ class OCRService:
             return "Ошибка при обработке изображения"
 
     @staticmethod
-    async def extract_text_from_image(image_data: bytes) -> Dict[str, Any]:
-        """Extract text from image using Google Vision API"""
+    async def extract_texts(images: List[ImageData]) -> List[str]:
+        """Extract text from several images in order - wrapper method for compatibility"""
+        return OCRService.texts_from_results(await OCRService.extract_text_from_images(images))
+
+    @staticmethod
+    def texts_from_results(results: List[Dict[str, Any]]) -> List[str]:
+        """Text of each OCR result, or the failure message"""
+        texts = []
+        for i, result in enumerate(results):
+            if result["success"]:
+                texts.append(result["text"])
+            else:
+                logger.error(f"OCR extraction failed for image {i+1}")
+                texts.append(result["text"] or "Не удалось извлечь текст из изображения")
+        return texts
+
+    @staticmethod
+    def is_failed(result: Dict[str, Any]) -> bool:
+        """Whether an OCR result is an error or found no text"""
+        return not result["success"] or not result["text"].strip()
+
+    @staticmethod
+    async def extract_text_from_images(images: List[ImageData]) -> List[Dict[str, Any]]:
+        """Extract text from several images with batched Google Vision API requests.
+
+        Results keep the order of the input images. Batches run concurrently, so the
+        total latency is close to that of a single request. Images recognized
+        before are served from the OCR cache and not sent again.
+        """
+        return await _ocr_flights.run(
+            "batch:" + _image_key(images), lambda: OCRService._annotate_images(images)
+        )
+
+    @staticmethod
+    async def prepare_images(images: List[ImageData]) -> Tuple[List[ImageData], List[Dict[str, Any]]]:
+        """Shrink images for Vision and spot near-duplicates among them.
+
+        Returns the content to send for each image (the prepared copy, or the
+        original view) and a report per image: bytes in and out, preparation time
+        and the index of an earlier image it nearly duplicates (near_duplicate_of).
+        """
+        prepared: List[Optional[image_preprocessing.PreparedImage]] = [None] * len(images)
+        if settings.OCR_PREPROCESS_ENABLED:
+            try:
+                # Decoding and resizing is CPU-bound: keep it off the event loop and the GIL
+                loop = asyncio.get_running_loop()
+                pool = image_preprocessing.get_pool(settings.OCR_PREPROCESS_PROCESSES)
+                with metrics.stage("ocr_preprocess"):
+                    prepared = await asyncio.gather(*[
+                        # The pool process needs its own copy; it lives only while the image is prepared
+                        loop.run_in_executor(
+                            pool, image_preprocessing.prepare, bytes(image_data),
+                            settings.OCR_TARGET_TEXT_HEIGHT_PX, settings.OCR_MAX_IMAGE_SIDE_PX
+                        )
+                        for image_data in images
+                    ])
+            except Exception as e:
+                # A broken pool must not break OCR; the originals are sent and the pool recreated
+                logger.warning(f"Image preprocessing unavailable, sending originals: {str(e)}")
+                image_preprocessing.close_pool()
+
+        contents = []
+        reports = []
+        for i, (image_data, image) in enumerate(zip(images, prepared)):
+            if image is None:
+                report = _image_report(len(image_data), len(image_data))
+            else:
+                report = _image_report(len(image_data), image.bytes_out, round(image.seconds, 4), image.scale)
+                if image.error:
+                    logger.warning(f"Image {i+1} not preprocessed: {image.error}")
+                else:
+                    for j in range(i):
+                        other = prepared[j]
+                        if other and not other.error and \
+                                image_preprocessing.hamming(image.dhash, other.dhash) <= settings.OCR_NEAR_DUPLICATE_DISTANCE:
+                            report["near_duplicate_of"] = j
+                            metrics.count_duplicate_image("near")
+                            break
+            metrics.count_ocr_image(report["bytes_in"], report["bytes_out"], image.seconds if image else None)
+            logger.info(
+                f"Image {i+1}: {report['bytes_in']} -> {report['bytes_out']} bytes "
+                f"(saved {report['bytes_saved']}, scale {report['scale']}) in {report['seconds'] * 1000:.0f} ms"
+                + (f", near-duplicate of image {report['near_duplicate_of']+1}" if report["near_duplicate_of"] is not None else "")
+            )
+            contents.append(image.content if image and image.content is not None else image_data)
+            reports.append(report)
+        return contents, reports
+
+    @staticmethod
+    def _cached_result(key: str, size: int) -> Optional[Dict[str, Any]]:
+        result = ocr_cache.lookup(key)
+        if result is None:
+            return None
+        # Nothing was prepared or sent for this image
+        metrics.count_ocr_image(size, 0, None)
+        result["preprocessing"] = _image_report(size, cached=True)
+        return result
+
+    @staticmethod
+    async def _annotate_images(images: List[ImageData]) -> List[Dict[str, Any]]:
+        try:
+            logger.info(f"Starting batched OCR for {len(images)} images")
+            
+            # Exact duplicates share the result of the first copy; cached images skip Vision
+            keys = [_cache_key(image_data) for image_data in images]
+            results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+            reports: List[Optional[Dict[str, Any]]] = [None] * len(images)
+            first_index: Dict[str, int] = {}
+            pending = []
+            for i, key in enumerate(keys):
+                first = first_index.setdefault(key, i)
+                if first != i:
+                    reports[i] = _image_report(len(images[i]), duplicate_of=first)
+                    metrics.count_duplicate_image("exact")
+                    metrics.count_ocr_image(len(images[i]), 0, None)
+                    continue
+                results[i] = OCRService._cached_result(key, len(images[i]))
+                if results[i] is None:
+                    pending.append(i)
+            
+            if pending:
+                contents, prepared_reports = await OCRService.prepare_images([images[i] for i in pending])
+                
+                client = get_vision_client()
+                image_context = vision.ImageContext(language_hints=OCR_LANGUAGE_HINTS)
+                features = [vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+                requests = [
+                    vision.AnnotateImageRequest(
+                        # The only copy of an image not shrunk by preprocessing
+                        image=vision.Image(content=bytes(content)),
+                        features=features,
+                        image_context=image_context
+                    )
+                    for content in contents
+                ]
+                batches = [requests[i:i + VISION_BATCH_SIZE] for i in range(0, len(requests), VISION_BATCH_SIZE)]
+                
+                # The client is synchronous, so each batch RPC runs in a worker thread
+                with metrics.stage("ocr"):
+                    batch_responses = await asyncio.gather(*[
+                        asyncio.to_thread(client.batch_annotate_images, requests=batch)
+                        for batch in batches
+                    ])
+                
+                responses = [response for batch_response in batch_responses for response in batch_response.responses]
+                for i, report, response in zip(pending, prepared_reports, responses):
+                    if report["near_duplicate_of"] is not None:
+                        report["near_duplicate_of"] = pending[report["near_duplicate_of"]]
+                    reports[i] = report
+                    if response.error.message:
+                        logger.error(f"Vision API error for image {i+1}: {response.error.message}")
+                        results[i] = OCRService.vision_error_result(response.error.message)
+                    else:
+                        results[i] = OCRService.result_from_annotations(response.text_annotations)
+                        ocr_cache.store(keys[i], results[i])
+            
+            for i, report in enumerate(reports):
+                if report is None:
+                    continue
+                if report["duplicate_of"] is not None:
+                    results[i] = dict(results[report["duplicate_of"]])
+                results[i]["preprocessing"] = report
+            return results
+        
+        except Exception as e:
+            logger.error(f"Error in batched OCR: {str(e)}")
+            # Each image failed: sample text copied to all of them would pass for a real conversation
+            error_result = await OCRService.error_result(e, fallback=False)
+            return [dict(error_result) for _ in images]
+
+    @staticmethod
+    async def extract_text_from_image(image_data: ImageData) -> Dict[str, Any]:
+        """Extract text from image using Google Vision API (or the OCR cache)"""
+        key = _cache_key(image_data)
+        cached = OCRService._cached_result(key, len(image_data))
+        if cached is not None:
+            return cached
+        # A worker that waited for another one recognizing the same image finds it in the cache
+        return await _ocr_flights.run(
+            key, lambda: OCRService._detect_text(image_data, key),
+            recheck=lambda: OCRService._cached_result(key, len(image_data))
+        )
+
+    @staticmethod
+    async def _detect_text(image_data: ImageData, key: str) -> Dict[str, Any]:
         try:
             logger.info("Starting OCR with Google Vision API")
             
@@ -43,74 +268,100 @@ class OCRService:
                     logger.info("Attempting to use credentials from environment variable...")
                     # Try to continue without file - credentials might be set via environment
             
-            # Initialize Vision client
-            client = vision.ImageAnnotatorClient()
+            # Shared Vision client
+            client = get_vision_client()
             
-            # Create image object
-            image = vision.Image(content=image_data)
+            # Create image object from the downscaled, grayscale copy
+            contents, reports = await OCRService.prepare_images([image_data])
+            image = vision.Image(content=bytes(contents[0]))
             
-            # Perform text detection with language hints for Russian
-            response = client.text_detection(
-                image=image,
-                image_context=vision.ImageContext(
-                    language_hints=["ru", "en"]  # Prioritize Russian, fallback to English
+            # Perform text detection with language hints for Russian (blocking RPC, run in a thread)
+            with metrics.stage("ocr"):
+                response = await asyncio.to_thread(
+                    client.text_detection,
+                    image=image,
+                    image_context=vision.ImageContext(
+                        language_hints=OCR_LANGUAGE_HINTS
+                    )
                 )
-            )
             
             if response.error.message:
                 logger.error(f"Vision API error: {response.error.message}")
-                return await OCRService.mock_ocr_result()
-            
-            texts = response.text_annotations
+                return OCRService.vision_error_result(response.error.message)
             
-            # Extract text
-            if texts and len(texts) > 0:
-                extracted_text = texts[0].description
-                logger.info(f"Successfully extracted text: {len(extracted_text)} characters")
-                
-                # Clean up the text
-                cleaned_text = OCRService.clean_extracted_text(extracted_text)
-                
-                return {
-                    "success": True,
-                    "text": cleaned_text,
-                    "confidence": 0.95,
-                    "language": "ru"
-                }
-            else:
-                logger.warning("No text found in image")
-                return {
-                    "success": False,
-                    "text": "",
-                    "confidence": 0.0,
-                    "language": "unknown"
-                }
+            result = OCRService.result_from_annotations(response.text_annotations)
+            ocr_cache.store(key, result)
+            result["preprocessing"] = reports[0]
+            return result
                 
         except Exception as e:
             logger.error(f"Error in OCR: {str(e)}")
+            return await OCRService.error_result(e)
+    
+    @staticmethod
+    def result_from_annotations(texts) -> Dict[str, Any]:
+        """Build an OCR result from Vision text annotations"""
+        # Extract text
+        if texts and len(texts) > 0:
+            extracted_text = texts[0].description
+            logger.info(f"Successfully extracted text: {len(extracted_text)} characters")
             
-            # Check for specific Google Vision API errors
-            if "SERVICE_DISABLED" in str(e) or "Cloud Vision API has not been used" in str(e):
-                logger.error("Google Vision API is not enabled. Please enable it in Google Cloud Console.")
-                logger.error("Visit: https://console.cloud.google.com/apis/api/vision.googleapis.com/overview")
-                return {
-                    "success": False,
-                    "text": "Google Vision API не активирован. Пожалуйста, активируйте его в Google Cloud Console.",
-                    "confidence": 0.0,
-                    "language": "unknown"
-                }
-            elif "403" in str(e):
-                logger.error("Access denied to Google Vision API. Check credentials and permissions.")
-                return {
-                    "success": False,
-                    "text": "Ошибка доступа к Google Vision API. Проверьте учетные данные.",
-                    "confidence": 0.0,
-                    "language": "unknown"
-                }
+            # Clean up the text
+            cleaned_text = OCRService.clean_extracted_text(extracted_text)
             
-            # Fallback to mock result for other errors
-            logger.warning("Falling back to mock OCR due to error")
-            return await OCRService.mock_ocr_result()
+            return {
+                "success": True,
+                "text": cleaned_text,
+                "confidence": 0.95,
+                "language": "ru"
+            }
+        else:
+            logger.warning("No text found in image")
+            return {
+                "success": False,
+                "text": "",
+                "confidence": 0.0,
+                "language": "unknown"
+            }
+    
+    @staticmethod
+    def vision_error_result(message: str) -> Dict[str, Any]:
+        """OCR result of an image Vision could not process"""
+        return {
+            "success": False,
+            "text": f"Ошибка Vision API: {message}",
+            "confidence": 0.0,
+            "language": "unknown"
+        }
+
+    @staticmethod
+    async def error_result(e: Exception, fallback: bool = True) -> Dict[str, Any]:
+        """Map a Vision API exception to an OCR result (sample text unless `fallback` is off)"""
+        # Check for specific Google Vision API errors
+        if "SERVICE_DISABLED" in str(e) or "Cloud Vision API has not been used" in str(e):
+            logger.error("Google Vision API is not enabled. Please enable it in Google Cloud Console.")
+            logger.error("Visit: https://console.cloud.google.com/apis/api/vision.googleapis.com/overview")
+            return {
+                "success": False,
+                "text": "Google Vision API не активирован. Пожалуйста, активируйте его в Google Cloud Console.",
+                "confidence": 0.0,
+                "language": "unknown"
+            }
+        elif "403" in str(e):
+            logger.error("Access denied to Google Vision API. Check credentials and permissions.")
+            return {
+                "success": False,
+                "text": "Ошибка доступа к Google Vision API. Проверьте учетные данные.",
+                "confidence": 0.0,
+                "language": "unknown"
+            }
+        
+        if not fallback:
+            return OCRService.vision_error_result(str(e))
+        
+        # Fallback to mock result for other errors
+        logger.warning("Falling back to mock OCR due to error")
+        return await OCRService.mock_ocr_result()
     
     @staticmethod
     async def mock_ocr_result() -> Dict[str, Any]:
@@ -128,7 +379,9 @@ class OCRService:
 Вау! Это очень полезно для бизнеса.
 Да, особенно для поддержки клиентов и продаж.""",
             "confidence": 0.85,
-            "language": "ru"
+            "language": "ru",
+            # Sample text, not the image's: durable jobs must not analyze it
+            "fallback": True
         }
 
     @staticmethod
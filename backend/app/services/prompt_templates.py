@@ -0,0 +1,278 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Type
+from app.models.analysis_result import AnalysisResult, get_result_model, response_schema
+from app.models.preset import DEFAULT_PRESET, PRESETS_BY_ID, Preset
+
+# Temperature used when the request names no preset
+DEFAULT_TEMPERATURE = 0.7
+
+# Extra JSON sections requested by presets with custom cards
+PRESET_SPECIFIC_DATA: Dict[str, str] = {
+    "teen_navigator": """
+                    
+                    ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа подростковой коммуникации. 
+                    Ищи признаки: возраст участников (подростки, школьники), школьная тематика, 
+                    групповое общение, социальные сети, подростковые интересы.
+                    
+                    Если диалог НЕ подходит для подросткового анализа, установи:
+                    "preset_validation": {{
+                        "is_valid": false,
+                        "reason": "Диалог не содержит признаков подростковой коммуникации"
+                    }}
+                    
+                    Если диалог подходит, установи:
+                    "preset_validation": {{
+                        "is_valid": true,
+                        "reason": "Диалог подходит для подросткового анализа"
+                    }}
+                    
+                    ДОПОЛНИТЕЛЬНО для пресета "Подростковый Навигатор" добавь следующие данные:
+                    
+                    "safety_check": {{
+                        "bullying_indicators": ["индикатор1", "индикатор2", "индикатор3"],
+                        "safety_level": число_от_0_до_100,
+                        "recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
+                    }},
+                    "emotion_dictionary": {{
+                        "hidden_emotions": [
+                            {{
+                                "text": "фраза из разговора",
+                                "explanation": "что на самом деле означает эта фраза"
+                            }}
+                        ]
+                    }},
+                    "social_compass": {{
+                        "group_dynamics": "описание групповой динамики",
+                        "inner_circles": ["круг1", "круг2", "круг3"],
+                        "navigation_tips": ["совет1", "совет2", "совет3"]
+                    }}
+                    """,
+    "family_balance": """
+                    
+                    ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа семейной коммуникации. 
+                    Ищи признаки: семейные отношения (родители-дети, супруги, родственники), 
+                    домашние дела, семейные планы, воспитание, семейные конфликты.
+                    
+                    Если диалог НЕ подходит для семейного анализа, установи:
+                    "preset_validation": {{
+                        "is_valid": false,
+                        "reason": "Диалог не содержит признаков семейной коммуникации"
+                    }}
+                    
+                    Если диалог подходит, установи:
+                    "preset_validation": {{
+                        "is_valid": true,
+                        "reason": "Диалог подходит для семейного анализа"
+                    }}
+                    
+                    ДОПОЛНИТЕЛЬНО для пресета "Семейный Баланс" добавь следующие данные:
+                    
+                    "communication_cycles": {{
+                        "patterns": ["паттерн1", "паттерн2", "паттерн3"],
+                        "trigger_points": ["триггер1", "триггер2", "триггер3"],
+                        "interruption_techniques": ["техника1", "техника2", "техника3"]
+                    }},
+                    "needs_map": {{
+                        "expressed_needs": ["потребность1", "потребность2"],
+                        "unexpressed_needs": ["скрытая_потребность1", "скрытая_потребность2"],
+                        "overlap_areas": ["зона_пересечения1", "зона_пересечения2"]
+                    }},
+                    "family_roles": {{
+                        "role_distribution": ["роль1", "роль2", "роль3"],
+                        "responsibility_balance": число_от_0_до_100,
+                        "recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
+                    }}
+                    ПРАВИЛА ОФОРМЛЕНИЯ:
+                    1. КОЛИЧЕСТВО СЛОВ КАЖДОГО ТРИГЕРА НЕ ДОЛЖНЫ ПРЕВЫШАТЬ 4-5 СЛОВ
+                    2. ВСЕ РЕКОМЕНДАЦИИ ДОЛЖНЫ БЫТЬ НЕ ДЛИННЫМИ И ПРАКТИЧНЫМИ
+                    """,
+    "strategic_hr": """
+                    
+                    ВАЖНО: Сначала проверь, подходит ли этот диалог для анализа деловой/рабочей коммуникации. 
+                    Ищи признаки: рабочие отношения, проекты, задачи, совещания, 
+                    профессиональные обсуждения, командная работа, деловые решения.
+                    
+                    Если диалог НЕ подходит для HR анализа, установи:
+                    "preset_validation": {{
+                        "is_valid": false,
+                        "reason": "Диалог не содержит признаков деловой/рабочей коммуникации"
+                    }}
+                    
+                    Если диалог подходит, установи:
+                    "preset_validation": {{
+                        "is_valid": true,
+                        "reason": "Диалог подходит для HR анализа"
+                    }}
+                    
+                    ДОПОЛНИТЕЛЬНО для пресета "Стратегический HR" добавь следующие данные:
+                    
+                    "team_analytics": {{
+                        "communication_metrics": {{
+                            "participation_rate": число_от_0_до_100,
+                            "response_time": "среднее_время_ответа",
+                            "engagement_score": число_от_0_до_100
+                        }},
+                        "decision_efficiency": число_от_0_до_100,
+                        "goal_achievement": число_от_0_до_100
+                    }},
+                    "psychological_safety": {{
+                        "safety_level": число_от_0_до_100,
+                        "trust_indicators": ["индикатор1", "индикатор2", "индикатор3"],
+                        "openness_score": число_от_0_до_100
+                    }},
+                    "professional_growth": {{
+                        "skill_analysis": [
+                            {{
+                                "skill": "навык",
+                                "current_level": число_от_1_до_5,
+                                "development_area": "область_развития"
+                            }}
+                        ],
+                        "growth_recommendations": ["рекомендация1", "рекомендация2", "рекомендация3"]
+                    }}
+                    """
+}
+
+def _preset_instructions(preset: Preset) -> str:
+    return f"""
+                Анализируй разговор согласно следующему пресету: "{preset.name}".
+                Целевая аудитория: {preset.target_audience}
+                
+                Стиль отчета:
+                {', '.join(preset.report_style)}
+                
+                Фокус анализа:
+                {', '.join(preset.focus_analysis)}
+                """
+
+def _render_prompt(text: str, preset_instructions: str, additional_instructions: str, preset_specific_data: str) -> str:
+    return f"""
+        Проанализируй следующий разговор и предоставь детальный анализ эмоций и качества общения. 
+        Отвечай строго на русском языке.
+
+        Разговор:
+        {text}
+
+        {preset_instructions}
+        
+        ВАЖНО: Если текст короткий или содержит мало информации, все равно проведи анализ на основе доступных данных.
+        Даже короткие фразы могут содержать эмоциональную информацию.
+        
+        {additional_instructions}
+
+        Предоставь анализ в следующем JSON формате (give answers in russian):
+
+        {{
+            "summary": {{
+                "overview": "Краткое описание разговора",
+                "participants": количество_участников,
+                "messageCount": количество_сообщений,
+                "duration": "примерная длительность",
+                "mainTopics": ["тема1", "тема2", "тема3"]
+            }},
+            "emotionTimeline": {{
+                "emotions": [
+                    {{
+                        "time": "время",
+                        "emotion": "эмоция с эмоджи",
+                        "intensity": интенсивность_от_0_до_100,
+                        "color": "hex_цвет"
+                    }}
+                ],
+                "dominantEmotion": "доминирующая эмоция с эмоджи",
+                "emotionalShifts": количество_эмоциональных_переходов
+            }},
+            "aiJudgeScore": {{
+                "overallScore": общий_балл_от_0_до_100,
+                "breakdown": {{
+                    "clarity": балл_ясности_от_0_до_100,
+                    "empathy": балл_эмпатии_от_0_до_100,
+                    "professionalism": балл_профессионализма_от_0_до_100,
+                    "resolution": балл_решения_от_0_до_100
+                }},
+                "verdict": "КРАТКИЙ ВЕРДИКТ ИЗ 4-5 СЛОВ МАКСИМУМ",
+                "recommendation": "подробная рекомендация"
+            }},
+            "subtleties": [
+                {{
+                    "type": "тип тонкости",
+                    "message": "описание",
+                    "confidence": уверенность_от_0_до_100,
+                    "context": "контекст"
+                }}
+            ]{preset_specific_data}
+        }}
+
+        ВАЖНО:
+        1. Вердикт (verdict) должен быть КРАТКИМ - максимум 4-5 слов
+        2. К каждой эмоции в emotionTimeline.emotions добавляй подходящий эмоджи
+        3. К dominantEmotion тоже добавляй эмоджи
+        4. Все ответы строго на русском языке
+        """
+
+# Stand-ins for the per-request parts; the rendered prompt is split around them
+_TEXT_SLOT = "\x00text\x00"
+_ADDITIONAL_SLOT = "\x00additional\x00"
+
+@dataclass(frozen=True)
+class AnalysisPromptTemplate:
+    """Analysis prompt of one preset, rendered once; only the conversation and extra instructions are filled per request"""
+    preset_id: Optional[str]
+    temperature: float
+    head: str
+    middle: str
+    tail: str
+    preset_info_json: Optional[str]
+    result_model: Type[AnalysisResult]
+    response_schema: Dict[str, Any]
+
+    def render(self, text: str, additional_prompt: Optional[str] = None) -> str:
+        if additional_prompt:
+            return "".join((
+                self.head, text, self.middle, f"Дополнительные инструкции: {additional_prompt}", self.tail,
+                f"\n\nAdditional analysis instructions: {additional_prompt}"
+            ))
+        return "".join((self.head, text, self.middle, self.tail))
+
+    def preset_info(self) -> Optional[dict]:
+        """Fresh copy of the preset/custom-cards payload attached to results"""
+        return json.loads(self.preset_info_json) if self.preset_info_json else None
+
+def _compile(preset: Optional[Preset]) -> AnalysisPromptTemplate:
+    instructions = _preset_instructions(preset) if preset else ""
+    specific_data = PRESET_SPECIFIC_DATA.get(preset.id, "") if preset else ""
+    rendered = _render_prompt(_TEXT_SLOT, instructions, _ADDITIONAL_SLOT, specific_data)
+    head, rest = rendered.split(_TEXT_SLOT)
+    middle, tail = rest.split(_ADDITIONAL_SLOT)
+
+    preset_info_json = None
+    if preset and preset.custom_cards:
+        preset_info_json = json.dumps({
+            "id": preset.id,
+            "name": preset.name,
+            "custom_cards": [card.dict() for card in preset.custom_cards]
+        }, ensure_ascii=False)
+
+    result_model = get_result_model(preset.id if preset else None)
+    return AnalysisPromptTemplate(
+        preset_id=preset.id if preset else None,
+        temperature=preset.temperature if preset else DEFAULT_TEMPERATURE,
+        head=head,
+        middle=middle,
+        tail=tail,
+        preset_info_json=preset_info_json,
+        result_model=result_model,
+        response_schema=response_schema(result_model)
+    )
+
+_NO_PRESET_TEMPLATE = _compile(None)
+TEMPLATES_BY_ID: Dict[str, AnalysisPromptTemplate] = {
+    preset_id: _compile(preset) for preset_id, preset in PRESETS_BY_ID.items()
+}
+
+def get_template(preset_id: Optional[str]) -> AnalysisPromptTemplate:
+    """Compiled template for a preset id; unknown ids use the default preset"""
+    if not preset_id:
+        return _NO_PRESET_TEMPLATE
+    return TEMPLATES_BY_ID.get(preset_id) or TEMPLATES_BY_ID[DEFAULT_PRESET.id]
@@ -0,0 +1,105 @@
+import difflib
+from typing import Dict, List, Optional, Tuple
+
+# Between parts that do not overlap; the conversation may skip messages there
+PART_SEPARATOR = "\n\n--- НОВАЯ ЧАСТЬ РАЗГОВОРА ---\n\n"
+# Lines at least this similar are the same message read twice by OCR
+LINE_SIMILARITY = 0.8
+# Lines of app chrome (status bar, chat header, input box) allowed around the overlap
+MAX_CHROME_LINES = 3
+# A shorter overlap is as likely a coincidence ("Ок", "Да") as the same messages
+MIN_OVERLAP_CHARS = 12
+
+def _normalize(line: str) -> str:
+    return " ".join(line.lower().split())
+
+class _Similarity:
+    """Memoized comparison of the lines of two screenshots (exact when threshold is 1)"""
+
+    def __init__(self, previous: List[str], following: List[str], threshold: float):
+        self.previous = previous
+        self.following = following
+        self.threshold = threshold
+        self._known: Dict[Tuple[int, int], bool] = {}
+
+    def __call__(self, i: int, j: int) -> bool:
+        known = self._known.get((i, j))
+        if known is None:
+            a, b = self.previous[i], self.following[j]
+            known = a == b
+            if not known and self.threshold < 1:
+                matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+                known = (
+                    matcher.real_quick_ratio() >= self.threshold
+                    and matcher.quick_ratio() >= self.threshold
+                    and matcher.ratio() >= self.threshold
+                )
+            self._known[(i, j)] = known
+        return known
+
+def find_overlap(previous: List[str], following: List[str]) -> Optional[Tuple[int, int, int]]:
+    """Longest run of lines that ends `previous` and starts `following`.
+
+    A few lines of app chrome may follow the run in `previous` or precede it in
+    `following`, and one line in four may be garbled beyond recognition. Lines
+    are first compared exactly and only then fuzzily: with fuzzy matching alone,
+    similar-looking messages ("Ок", timestamps) would stretch the run. Returns
+    (run length, chrome lines after it in previous, chrome lines before it in
+    following), or None if the screenshots do not overlap.
+    """
+    # Only the end of the transcript so far can overlap the next screenshot
+    previous = [_normalize(line) for line in previous[-(len(following) + MAX_CHROME_LINES):]]
+    following = [_normalize(line) for line in following]
+    for threshold in (1.0, LINE_SIMILARITY):
+        overlap = _longest_run(previous, following, _Similarity(previous, following, threshold))
+        if overlap:
+            return overlap
+    return None
+
+def _longest_run(previous: List[str], following: List[str], similar: _Similarity) -> Optional[Tuple[int, int, int]]:
+    best = None
+    for tail in range(min(MAX_CHROME_LINES, len(previous) - 1) + 1):
+        end = len(previous) - tail
+        for head in range(min(MAX_CHROME_LINES, len(following) - 1) + 1):
+            for length in range(min(end, len(following) - head), 0, -1):
+                if best and length <= best[0]:
+                    break
+                start = end - length
+                # The run is anchored by its first and last lines
+                if not (similar(start, head) and similar(end - 1, head + length - 1)):
+                    continue
+                misses = sum(1 for k in range(length) if not similar(start + k, head + k))
+                if misses > length // 4:
+                    continue
+                matched_chars = sum(
+                    len(following[head + k]) for k in range(length) if similar(start + k, head + k)
+                )
+                # Skipping chrome on a single matching line is too easy to get wrong
+                if matched_chars >= MIN_OVERLAP_CHARS and (length >= 2 or not (tail or head)):
+                    best = (length, tail, head)
+                break
+    return best
+
+def merge_screenshot_texts(texts: List[str]) -> Tuple[str, int]:
+    """One transcript from the OCR texts of consecutive screenshots.
+
+    Messages repeated at the seam of two screenshots are kept once. Returns the
+    transcript and the number of lines dropped.
+    """
+    parts: List[List[str]] = []
+    current: List[str] = []
+    dropped = 0
+    for text in texts:
+        lines = text.splitlines()
+        overlap = find_overlap(current, lines) if current and lines else None
+        if overlap is None:
+            if current:
+                parts.append(current)
+            current = lines
+            continue
+        length, tail, head = overlap
+        current = current[:len(current) - tail] + lines[head + length:]
+        dropped += length + tail + head
+    if current:
+        parts.append(current)
+    return PART_SEPARATOR.join("\n".join(part) for part in parts), dropped
@@ -0,0 +1,115 @@
+import asyncio
+import copy
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from prometheus_client import Counter
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-worker lock, in-worker coalescing still works
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CALLS = Counter(
+    "gossipai_single_flight_total",
+    "Upstream calls by single-flight outcome (leader = made the call, coalesced = joined one in this worker, "
+    "cross_worker = served from the shared cache after another worker's call)",
+    ["kind", "outcome"]
+)
+
+@asynccontextmanager
+async def _node_lock(kind: str, key: str) -> AsyncIterator[bool]:
+    """Exclusive per-key file lock shared by all workers on the node; yields whether we had to wait"""
+    directory = os.path.join(settings.LOCAL_DATA_DIR, "locks", kind)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}.lock")
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_LOCK_TIMEOUT_SECONDS
+    waited = False
+    fd = None
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            fd = None
+            if time.monotonic() >= deadline:
+                # Do not hold the request hostage to a stuck worker; just make the call
+                logger.warning(f"Single-flight lock wait timed out for {kind} {key[:12]}")
+                waited = True
+                break
+            waited = True
+            await asyncio.sleep(settings.SINGLE_FLIGHT_LOCK_POLL_SECONDS)
+            continue
+        # The previous holder may have removed the file while we were opening it
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    try:
+        yield waited
+    finally:
+        if fd is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so they share one upstream request.
+
+    Callers with the same key while a call is in flight await that call's
+    result instead of starting their own. With cross_worker enabled, workers on
+    the node also take a per-key file lock; a worker that waited for the lock
+    re-checks the shared cache before calling upstream.
+    """
+
+    def __init__(self, kind: str, cross_worker: bool = False):
+        self.kind = kind
+        self.cross_worker = cross_worker and fcntl is not None
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]],
+                  recheck: Optional[Callable[[], Optional[Any]]] = None) -> Any:
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            # A task, so a leader that disconnects does not cancel the call for everyone else
+            task = asyncio.create_task(self._execute(key, call, recheck))
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+        else:
+            CALLS.labels(self.kind, "coalesced").inc()
+            logger.info(f"Joining in-flight {self.kind} call {key[:12]}")
+        result = await asyncio.shield(task)
+        # Every follower gets its own copy; callers may modify the result
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, finished: asyncio.Task) -> None:
+        if self._calls.get(key) is finished:
+            del self._calls[key]
+
+    async def _execute(self, key: str, call: Callable[[], Awaitable[Any]],
+                       recheck: Optional[Callable[[], Optional[Any]]]) -> Any:
+        if not (self.cross_worker and recheck):
+            CALLS.labels(self.kind, "leader").inc()
+            return await call()
+        async with _node_lock(self.kind, key) as waited:
+            if waited:
+                result = recheck()
+                if result is not None:
+                    CALLS.labels(self.kind, "cross_worker").inc()
+                    return result
+            CALLS.labels(self.kind, "leader").inc()
+            return await call()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
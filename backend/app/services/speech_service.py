@@ -1,17 +1,37 @@
 import os
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Union
 from google.cloud import speech
+from app.core import metrics
 from app.core.config import settings
+from app.services import transcript_cache
+from app.services.google_clients import get_speech_client
 
 logger = logging.getLogger(__name__)
 
+# Recognition settings; the transcript cache key is derived from the same values
+RECOGNITION_CONFIG = {
+    "encoding": "LINEAR16",
+    "sample_rate_hertz": 16000,
+    "language_code": "ru-RU",
+    "enable_automatic_punctuation": True,
+    "enable_word_time_offsets": True
+}
+
 class SpeechService:
     """Service for handling speech-to-text with Google Speech-to-Text API"""
     
     @staticmethod
-    async def transcribe_audio(audio_data: bytes, audio_format: str = "wav") -> Dict[str, Any]:
-        """Transcribe audio using Google Speech-to-Text API"""
+    async def transcribe_audio(audio_data: Union[bytes, memoryview], audio_format: str = "wav") -> Dict[str, Any]:
+        """Transcribe audio using Google Speech-to-Text API (or the transcript cache)"""
+        # Hashed from the view of the upload; cache hits never copy it
+        cache_key = transcript_cache.make_key(hashlib.sha256(audio_data).hexdigest(), RECOGNITION_CONFIG)
+        cached = transcript_cache.lookup(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             logger.info("Starting speech-to-text with Google Speech API")
             
@@ -29,41 +49,44 @@ class SpeechService:
                     logger.info("Attempting to use credentials from environment variable...")
                     # Try to continue without file - credentials might be set via environment
             
-            # Initialize Speech client
-            client = speech.SpeechClient()
+            # Shared Speech client
+            client = get_speech_client()
             
-            # Configure audio
-            audio = speech.RecognitionAudio(content=audio_data)
+            # Configure audio (the request needs bytes: the only copy of the upload made in memory)
+            audio = speech.RecognitionAudio(content=bytes(audio_data))
             
             # Configure recognition
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=16000,
-                language_code="ru-RU",
-                enable_automatic_punctuation=True,
-                enable_word_time_offsets=True
-            )
+            config = speech.RecognitionConfig(**RECOGNITION_CONFIG)
             
-            # Perform transcription
-            response = client.recognize(config=config, audio=audio)
+            # Perform transcription (blocking RPC, run in a thread)
+            with metrics.stage("speech"):
+                response = await asyncio.to_thread(client.recognize, config=config, audio=audio)
             
             # Extract transcript
             transcript = ""
             confidence = 0.0
+            words = []
             
             for result in response.results:
                 transcript += result.alternatives[0].transcript + " "
                 confidence = max(confidence, result.alternatives[0].confidence)
+                words.extend(
+                    {"word": word.word, "start": word.start_time.total_seconds(), "end": word.end_time.total_seconds()}
+                    for word in result.alternatives[0].words
+                )
             
             if transcript:
                 logger.info(f"Successfully transcribed audio: {len(transcript)} characters")
                 
-                return {
+                transcription = {
                     "success": True,
                     "text": transcript.strip(),
                     "confidence": confidence,
-                    "language": "ru-RU"
+                    "language": "ru-RU",
+                    "words": words
                 }
+                transcript_cache.store(cache_key, transcription)
+                return transcription
             else:
                 logger.warning("No speech detected in audio")
                 return {
@@ -86,5 +109,7 @@ class SpeechService:
             "success": True,
             "text": "Это пример транскрипции аудио файла. Здесь может быть любой текст, который был распознан из аудио записи.",
             "confidence": 0.85,
-            "language": "ru-RU"
+            "language": "ru-RU",
+            # Sample text, not the recording's: durable jobs must not analyze it
+            "fallback": True
         }
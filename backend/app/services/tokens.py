@@ -0,0 +1,8 @@
+import math
+
+# Cyrillic text averages about three characters per Gemini token
+CHARS_PER_TOKEN = 3
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting prompts (no API call)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
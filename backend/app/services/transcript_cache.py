@@ -0,0 +1,37 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+from app.core import metrics
+from app.core.config import settings
+from app.db.local_store import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Shared by all workers on the node; least recently used entries are evicted first
+_disk = SQLiteCache("transcript_cache", settings.TRANSCRIPT_CACHE_MAX_ENTRIES, settings.TRANSCRIPT_CACHE_TTL_SECONDS)
+
+def make_key(audio_digest: str, recognition_config: Dict[str, Any]) -> str:
+    """Content address of a transcript: the audio bytes and the recognition config"""
+    payload = json.dumps({"audio": audio_digest, "config": recognition_config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """A cached transcription (text, confidence, word timings), or None"""
+    if not settings.TRANSCRIPT_CACHE_ENABLED:
+        return None
+    result = _disk.get(key)
+    metrics.count_transcript_cache("hit" if result is not None else "miss")
+    if result is not None:
+        logger.info(f"Transcript cache hit: {key[:12]}")
+    return result
+
+def store(key: str, result: Dict[str, Any]) -> None:
+    """Store a transcription that found speech (fallbacks are not cached)"""
+    if not settings.TRANSCRIPT_CACHE_ENABLED or not result.get("success") or not result.get("text"):
+        return
+    _disk.set(key, result)
+
+def stats() -> Dict[str, Any]:
+    """Hit/miss counters of this worker"""
+    return {"enabled": settings.TRANSCRIPT_CACHE_ENABLED, **_disk.stats()}
@@ -0,0 +1,156 @@
+import codecs
+import logging
+import mmap
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+from fastapi import UploadFile
+from starlette.formparsers import MultiPartParser
+from app.core.upload_limits import max_file_bytes
+from app.services.ocr_service import OCRService
+from app.services.speech_service import SpeechService
+
+logger = logging.getLogger(__name__)
+
+# Content of an upload: a view of the spooled file rather than a copy of it
+BytesLike = Union[bytes, memoryview]
+
+# Enough of the file for the signature checks and for telling text from binary
+HEAD_BYTES = 4096
+
+# Starlette keeps multipart files up to this size in memory and spools larger ones to disk
+SPOOL_MAX_MEMORY_BYTES = MultiPartParser.max_file_size
+
+# ftyp brands of MPEG-4 audio (m4a, aac in mp4)
+AUDIO_MP4_BRANDS = (b"M4A ", b"M4B ", b"mp42", b"isom", b"dash")
+
+FILE_TYPE_LABELS = {"text": "текста", "image": "изображений", "audio": "аудио"}
+
+class UploadError(ValueError):
+    """The uploaded file cannot be analyzed (reported to the client as 400)"""
+    status_code = 400
+
+class UploadTooLarge(UploadError):
+    """The uploaded file exceeds the size limit of its type"""
+    status_code = 413
+
+class ExtractionFailed(RuntimeError):
+    """OCR or transcription failed or fell back to sample text; a retry may succeed"""
+
+def sniff_file_type(head: bytes) -> Optional[str]:
+    """'image' or 'audio' from the file signature, None if it is not one we know"""
+    if head.startswith((b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")):
+        return "image"
+    # BMP: "BM", file size, then four reserved zero bytes
+    if head.startswith(b"BM") and head[6:10] == b"\x00\x00\x00\x00":
+        return "image"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "audio"
+    if head.startswith((b"ID3", b"OggS")):
+        return "audio"
+    if head[4:8] == b"ftyp" and head[8:12] in AUDIO_MP4_BRANDS:
+        return "audio"
+    # MPEG audio / ADTS frame sync (mp3 without ID3 tag, raw aac)
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "audio"
+    return None
+
+def _looks_like_text(head: bytes) -> bool:
+    if not head or b"\x00" in head:
+        return False
+    try:
+        # Not final: the head may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def detect_file_type(filename: Optional[str], head: bytes) -> str:
+    """'text', 'image' or 'audio' for a supported upload, judged by its first bytes"""
+    file_type = sniff_file_type(head)
+    if file_type:
+        return file_type
+    if head.startswith(b"%PDF"):
+        raise UploadError("PDF файлы пока не поддерживаются. Пожалуйста, конвертируйте в изображение или текст.")
+    if _looks_like_text(head):
+        return "text"
+    file_extension = filename.split(".")[-1].lower() if filename else ""
+    raise UploadError(f"Неподдерживаемый тип файла: {file_extension}. Поддерживаются: изображения (jpg, png, gif, bmp), аудио (mp3, wav, m4a, ogg), текст (txt, md)")
+
+def check_size(file_type: str, size: int) -> None:
+    limit = max_file_bytes(file_type)
+    if size > limit:
+        raise UploadTooLarge(
+            f"Файл слишком большой ({size / (1024 * 1024):.1f} МБ). "
+            f"Максимальный размер для {FILE_TYPE_LABELS[file_type]}: {limit // (1024 * 1024)} МБ"
+        )
+
+async def read_head(file: UploadFile) -> bytes:
+    """First bytes of an upload; the file is rewound afterwards"""
+    await file.seek(0)
+    head = await file.read(HEAD_BYTES)
+    await file.seek(0)
+    return head
+
+@contextmanager
+def upload_buffer(file: BinaryIO, size: int) -> Iterator[memoryview]:
+    """Read-only view of a file's content.
+
+    Files spooled to disk are memory-mapped, so their content is paged in by
+    the kernel instead of being copied onto the worker's heap.
+    """
+    file.seek(0)
+    mapped = None
+    if size <= SPOOL_MAX_MEMORY_BYTES:
+        view = memoryview(file.read())
+    else:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        view.release()
+        if mapped is not None:
+            mapped.close()
+
+# Job progress stage of the text extraction step per file type
+EXTRACTION_STAGES = {"text": "reading", "image": "ocr", "audio": "transcription"}
+
+async def extract_text(file_type: str, content: BytesLike, strict: bool = False) -> str:
+    """Conversation text of an uploaded file (decoded, OCR'd or transcribed).
+
+    With `strict`, sample text from a failed OCR or transcription and empty
+    results raise ExtractionFailed instead of being returned.
+    """
+    if file_type == "text":
+        try:
+            text = codecs.decode(content, "utf-8")
+        except UnicodeDecodeError:
+            raise UploadError("Текстовый файл должен быть в кодировке UTF-8")
+        logger.info(f"Extracted text from file: {len(text)} characters")
+        return text
+
+    if file_type == "image":
+        logger.info(f"Processing image file: {len(content)} bytes")
+        ocr_result = await OCRService.extract_text_from_image(content)
+        text = OCRService.texts_from_results([ocr_result])[0]
+        logger.info(f"Extracted text from image: {len(text)} characters")
+
+        # Check if OCR failed or found no text
+        if strict and ocr_result.get("fallback"):
+            raise ExtractionFailed("Google Vision API недоступен")
+        if OCRService.is_failed(ocr_result):
+            error = ExtractionFailed if strict else UploadError
+            raise error(f"Ошибка OCR: {text.strip() or 'Не удалось извлечь текст из изображения'}. Убедитесь, что Google Vision API активирован в проекте.")
+        return text
+
+    logger.info(f"Processing audio file: {len(content)} bytes")
+    transcription = await SpeechService.transcribe_audio(content)
+    text = transcription["text"]
+    logger.info(f"Transcribed audio: {len(text)} characters")
+    if strict and transcription.get("fallback"):
+        raise ExtractionFailed("Google Speech API недоступен")
+    if strict and not text.strip():
+        raise ExtractionFailed("Не удалось распознать речь в аудио")
+    return text
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.db.local_store import connect_local_db
+from app.models.upload_job import UploadJob
+from app.services import history_service, upload_analysis
+from app.services.ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+def _uploads_dir() -> str:
+    path = os.path.join(settings.LOCAL_DATA_DIR, "uploads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class UploadJobQueue:
+    """Durable queue of file analyses in a node-local SQLite database.
+
+    Uploaded files are kept on local disk until their job finishes. A worker
+    claims a job with a lease; if the worker dies, the lease runs out and
+    another worker (or the restarted one) picks the job up again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_local_db(self.name)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_jobs ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, dedup_key TEXT NOT NULL, "
+                "file_name TEXT, file_type TEXT NOT NULL, file_path TEXT NOT NULL, params TEXT NOT NULL, "
+                "status TEXT NOT NULL, stage TEXT NOT NULL, result TEXT, error TEXT, history_id TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # One live job per user, file and parameters; failed jobs can be resubmitted
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_upload_jobs_dedup ON upload_jobs (dedup_key) "
+                "WHERE status != 'failed'"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_upload_jobs_status ON upload_jobs (status, created_at)")
+        return self._conn
+
+    def submit(self, user_id: str, dedup_key: str, file_name: Optional[str], file_type: str,
+               content: upload_analysis.BytesLike, params: Dict[str, Any]) -> Tuple[str, bool]:
+        """Queue a job unless the same one is already queued or done; returns (job id, deduplicated)"""
+        job_id = str(uuid.uuid4())
+        file_path = os.path.join(_uploads_dir(), job_id)
+        # Written before taking the write lock, which would otherwise be held for the whole upload
+        with open(file_path + ".part", "wb") as f:
+            f.write(content)
+        os.replace(file_path + ".part", file_path)
+
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                # IMMEDIATE takes the write lock, so concurrent submits from other workers wait here
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._purge(db, now)
+                    existing = db.execute(
+                        "SELECT id FROM upload_jobs WHERE dedup_key = ? AND status != 'failed'", (dedup_key,)
+                    ).fetchone()
+                    if existing:
+                        db.execute("COMMIT")
+                        self._remove_file(file_path)
+                        return existing[0], True
+
+                    db.execute(
+                        "INSERT INTO upload_jobs (id, user_id, dedup_key, file_name, file_type, file_path, params, "
+                        "status, stage, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', 'queued', ?, ?)",
+                        (job_id, user_id, dedup_key, file_name, file_type, file_path,
+                         json.dumps(params, ensure_ascii=False), now, now)
+                    )
+                    db.execute("COMMIT")
+                    return job_id, False
+                except Exception:
+                    db.execute("ROLLBACK")
+                    raise
+        except Exception:
+            self._remove_file(file_path)
+            raise
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job (or one whose worker's lease ran out)"""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs abandoned too often are given up instead of crashing workers forever
+                abandoned = db.execute(
+                    "SELECT id, file_path FROM upload_jobs WHERE status = 'processing' AND lease_until < ? AND attempts >= ?",
+                    (now, settings.UPLOAD_JOB_MAX_ATTEMPTS)
+                ).fetchall()
+                for job_id, file_path in abandoned:
+                    self._finish(db, job_id, file_path, "failed", error="Обработка файла не удалась после нескольких попыток")
+                row = db.execute(
+                    "SELECT id, user_id, file_name, file_type, file_path, params, attempts FROM upload_jobs "
+                    "WHERE status = 'queued' OR (status = 'processing' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                db.execute(
+                    "UPDATE upload_jobs SET status = 'processing', attempts = attempts + 1, "
+                    "lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + settings.UPLOAD_JOB_LEASE_SECONDS, now, row[0])
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        job_id, user_id, file_name, file_type, file_path, params, attempts = row
+        return {
+            "id": job_id,
+            "user_id": user_id,
+            "file_name": file_name,
+            "file_type": file_type,
+            "file_path": file_path,
+            "params": json.loads(params),
+            "attempt": attempts + 1
+        }
+
+    def set_stage(self, job_id: str, stage: str) -> None:
+        """Record progress; also renews the worker's lease"""
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "UPDATE upload_jobs SET stage = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                (stage, now + settings.UPLOAD_JOB_LEASE_SECONDS, now, job_id)
+            )
+
+    def complete(self, job_id: str, file_path: str, result: Dict[str, Any], history_id: str) -> None:
+        with self._lock:
+            self._finish(self._db(), job_id, file_path, "completed", stage="saved", result=result, history_id=history_id)
+
+    def fail(self, job_id: str, file_path: str, error: str) -> None:
+        with self._lock:
+            self._finish(self._db(), job_id, file_path, "failed", error=error)
+
+    def release(self, job_id: str, error: Optional[str] = None) -> None:
+        """Put a job back in the queue (retry after an error or on shutdown)"""
+        with self._lock:
+            self._db().execute(
+                "UPDATE upload_jobs SET status = 'queued', stage = 'queued', error = ?, lease_until = 0, updated_at = ? "
+                "WHERE id = ? AND status = 'processing'",
+                (error, time.time(), job_id)
+            )
+
+    def _finish(self, db, job_id: str, file_path: str, status: str, stage: Optional[str] = None,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                history_id: Optional[str] = None) -> None:
+        db.execute(
+            "UPDATE upload_jobs SET status = ?, stage = COALESCE(?, stage), result = ?, error = ?, history_id = ?, "
+            "lease_until = 0, updated_at = ? WHERE id = ?",
+            (status, stage, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, history_id, time.time(), job_id)
+        )
+        self._remove_file(file_path)
+
+    def get(self, job_id: str, user_id: str) -> Optional[UploadJob]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id, file_name, file_type, status, stage, result, error, history_id, attempts, "
+                "created_at, updated_at FROM upload_jobs WHERE id = ? AND user_id = ?",
+                (job_id, user_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return UploadJob(
+            id=row[0],
+            file_name=row[1],
+            file_type=row[2],
+            status=row[3],
+            stage=row[4],
+            result=json.loads(row[5]) if row[5] else None,
+            error=row[6],
+            history_id=row[7],
+            attempts=row[8],
+            created_at=datetime.fromtimestamp(row[9], timezone.utc),
+            updated_at=datetime.fromtimestamp(row[10], timezone.utc)
+        )
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._db().execute(
+                "SELECT COUNT(*) FROM upload_jobs WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+
+    def _purge(self, db, now: float) -> None:
+        cutoff = now - settings.UPLOAD_JOB_TTL_SECONDS
+        finished = db.execute(
+            "SELECT file_path FROM upload_jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (cutoff,)
+        ).fetchall()
+        for (file_path,) in finished:
+            self._remove_file(file_path)
+        db.execute("DELETE FROM upload_jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (cutoff,))
+
+    @staticmethod
+    def _remove_file(file_path: str) -> None:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove upload {file_path}: {e}")
+
+def dedup_key(user_id: str, content: upload_analysis.BytesLike, params: Dict[str, Any]) -> str:
+    """Content hash of an upload job: the same file with the same parameters is one job"""
+    digest = hashlib.sha256(content).hexdigest()
+    payload = json.dumps({"user_id": user_id, "content": digest, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_queue = UploadJobQueue("upload_jobs")
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+_current: Dict[asyncio.Task, str] = {}
+
+async def _process(job: Dict[str, Any]) -> None:
+    job_id, file_path, params = job["id"], job["file_path"], job["params"]
+    logger.info(f"Upload job {job_id}: {job['file_type']} file, attempt {job['attempt']}")
+    try:
+        await asyncio.to_thread(_queue.set_stage, job_id, upload_analysis.EXTRACTION_STAGES[job["file_type"]])
+        with open(file_path, "rb") as f:
+            with upload_analysis.upload_buffer(f, os.fstat(f.fileno()).st_size) as content:
+                text = await upload_analysis.extract_text(job["file_type"], content, strict=True)
+
+        await asyncio.to_thread(_queue.set_stage, job_id, "analysis")
+        analysis_result = await AIService.analyze_text(
+            text,
+            params.get("additional_prompt"),
+            params.get("preset_id"),
+            params.get("temperature"),
+            params.get("bypass_cache", False),
+            strict=True
+        )
+        result = analysis_result["result"]
+
+        # The job id doubles as the history id, so a retried save cannot create a duplicate
+        history_data = history_service.history_entry_from_result(
+            job["user_id"], f"Анализ файла {job['file_name']}", job["file_type"], job["file_name"], result
+        )
+        row = history_service.build_history_row(history_data, job_id, datetime.now(timezone.utc))
+        await asyncio.to_thread(history_service.insert_history_rows, [row])
+
+        await asyncio.to_thread(_queue.complete, job_id, file_path, result, job_id)
+        logger.info(f"Upload job {job_id} completed")
+    except upload_analysis.UploadError as e:
+        await asyncio.to_thread(_queue.fail, job_id, file_path, str(e))
+    except FileNotFoundError:
+        await asyncio.to_thread(_queue.fail, job_id, file_path, "Загруженный файл не найден")
+    except Exception as e:
+        logger.error(f"Upload job {job_id} attempt {job['attempt']} failed: {str(e)}")
+        if job["attempt"] >= settings.UPLOAD_JOB_MAX_ATTEMPTS:
+            await asyncio.to_thread(_queue.fail, job_id, file_path, f"Ошибка при обработке файла: {str(e)}")
+        else:
+            await asyncio.to_thread(_queue.release, job_id, str(e))
+
+async def _worker() -> None:
+    task = asyncio.current_task()
+    while True:
+        try:
+            job = await asyncio.to_thread(_queue.claim)
+        except Exception as e:
+            logger.error(f"Upload job queue unavailable: {e}")
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.UPLOAD_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+        _current[task] = job["id"]
+        try:
+            await _process(job)
+        finally:
+            _current.pop(task, None)
+
+def start() -> None:
+    """Start this worker's share of the upload job pool"""
+    global _wakeup
+    if _workers:
+        return
+    _wakeup = asyncio.Event()
+    for _ in range(settings.UPLOAD_JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+    logger.info(f"Started {settings.UPLOAD_JOB_WORKERS} upload job workers")
+
+async def stop() -> None:
+    """Stop the workers; jobs they were processing go back to the queue"""
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        job_id = _current.pop(task, None)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        if job_id:
+            await asyncio.to_thread(_queue.release, job_id, "Обработка прервана перезапуском сервера")
+    _workers.clear()
+
+def _submit(user_id: str, file_name: Optional[str], file_type: str, content: upload_analysis.BytesLike,
+            params: Dict[str, Any]) -> Tuple[str, bool]:
+    return _queue.submit(user_id, dedup_key(user_id, content, params), file_name, file_type, content, params)
+
+async def submit(user_id: str, file_name: Optional[str], file_type: str, content: upload_analysis.BytesLike, params: Dict[str, Any]) -> Tuple[str, bool]:
+    """Queue a file analysis; returns (job id, whether an identical job already existed)"""
+    # Hashing, writing the file and the SQLite transaction all block, so they run off the event loop
+    job_id, deduplicated = await asyncio.to_thread(_submit, user_id, file_name, file_type, content, params)
+    if _wakeup is not None and not deduplicated:
+        _wakeup.set()
+    return job_id, deduplicated
+
+async def get_job(job_id: str, user_id: str) -> Optional[UploadJob]:
+    return await asyncio.to_thread(_queue.get, job_id, user_id)
+
+async def queue_depth() -> int:
+    return await asyncio.to_thread(_queue.depth)
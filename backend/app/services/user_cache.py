@@ -0,0 +1,30 @@
+import logging
+import time
+from typing import Optional, Union
+from uuid import UUID
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Resolved users keyed by (token subject, token exp), shared by all endpoints in a worker
+_users = TTLCache(settings.AUTH_USER_CACHE_MAX_ENTRIES, settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+def get_cached_user(user_id: str, token_exp: Optional[int]) -> Optional[User]:
+    """Get the user resolved earlier for this token, if still fresh"""
+    return _users.get((user_id, token_exp))
+
+def cache_user(user_id: str, token_exp: Optional[int], user: User) -> None:
+    """Remember the user resolved for a token, never beyond the token's expiry"""
+    ttl = settings.AUTH_USER_CACHE_TTL_SECONDS
+    if token_exp:
+        ttl = min(ttl, token_exp - time.time())
+    if ttl > 0:
+        _users.set((user_id, token_exp), user, ttl_seconds=ttl)
+
+def invalidate_user(user_id: Union[str, UUID]) -> None:
+    """Drop cached entries of a user whose profile changed"""
+    removed = _users.delete_where(lambda key: key[0] == str(user_id))
+    if removed:
+        logger.info(f"Invalidated {removed} cached auth entries for user {user_id}")
@@ -0,0 +1,128 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple
+from vertexai.preview.generative_models import GenerationConfig, GenerativeModel
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Limits how many Gemini calls a single worker keeps in flight. Requests above
+# the limit wait here instead of piling up on the Vertex AI quota.
+_llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+_in_flight = 0
+
+# Process-wide model handles keyed by (model name, temperature). Each handle
+# owns its prediction client, so reusing it keeps the gRPC channel and auth
+# state alive between requests.
+_models: Dict[Tuple[str, Optional[float]], GenerativeModel] = {}
+
+# Structured output needs a newer SDK than the pinned one; use it when it is there
+_config_params = inspect.signature(GenerationConfig.__init__).parameters
+SUPPORTS_JSON_MIME_TYPE = "response_mime_type" in _config_params
+SUPPORTS_RESPONSE_SCHEMA = "response_schema" in _config_params
+_json_configs: Dict[Tuple[str, Optional[float]], GenerationConfig] = {}
+
+def get_model(temperature: Optional[float] = None, model_name: Optional[str] = None) -> GenerativeModel:
+    """Get a shared model handle for the given model/temperature pair"""
+    model_name = model_name or settings.VERTEX_AI_MODEL
+    key = (model_name, temperature)
+    model = _models.get(key)
+    if model is None:
+        logger.info(f"Creating Gemini model handle: {model_name}, temperature={temperature}")
+        generation_config = {"temperature": temperature} if temperature is not None else None
+        model = GenerativeModel(model_name, generation_config=generation_config)
+        _models[key] = model
+    return model
+
+def json_generation_config(schema_name: str, schema: Dict[str, Any], temperature: Optional[float] = None) -> Optional[GenerationConfig]:
+    """Generation config asking for JSON output against a response schema.
+
+    Returns None when the installed SDK cannot request JSON output; the model's
+    own config is used then and the prompt alone describes the format.
+    """
+    if not SUPPORTS_JSON_MIME_TYPE:
+        return None
+    key = (schema_name, temperature)
+    config = _json_configs.get(key)
+    if config is None:
+        options: Dict[str, Any] = {"temperature": temperature, "response_mime_type": "application/json"}
+        if SUPPORTS_RESPONSE_SCHEMA:
+            options["response_schema"] = schema
+        config = GenerationConfig(**options)
+        _json_configs[key] = config
+    return config
+
+async def warm_up(temperatures: Iterable[Optional[float]]) -> None:
+    """Create model handles and open their channels before the first request"""
+    for temperature in temperatures:
+        model = get_model(temperature)
+        try:
+            await asyncio.wait_for(model.count_tokens_async("ping"), timeout=settings.LLM_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Gemini warm-up failed for temperature={temperature}: {e}")
+            return
+    logger.info(f"Warmed up {len(_models)} Gemini model handles")
+
+def _response_text(response) -> str:
+    """Text of a response or chunk; blocked or empty candidates have none"""
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+def llm_calls_in_flight() -> int:
+    """Number of Gemini calls currently running in this worker"""
+    return _in_flight
+
+async def generate_content(model: GenerativeModel, prompt: str, generation_config: Optional[Dict[str, Any]] = None):
+    """Run a Gemini generation on the async client without blocking the event loop"""
+    global _in_flight
+    with metrics.stage("llm_queue"):
+        await _llm_semaphore.acquire()
+    try:
+        _in_flight += 1
+        logger.info(f"LLM calls in flight: {_in_flight}/{settings.LLM_MAX_CONCURRENCY}")
+        with metrics.stage("llm"):
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt, generation_config=generation_config),
+                timeout=settings.LLM_TIMEOUT_SECONDS
+            )
+        metrics.count_llm_io(len(prompt), len(_response_text(response)))
+        return response
+    finally:
+        _in_flight -= 1
+        _llm_semaphore.release()
+
+async def stream_content(model: GenerativeModel, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Stream text chunks of a Gemini generation; the concurrency slot is held until the stream ends"""
+    global _in_flight
+    with metrics.stage("llm_queue"):
+        await _llm_semaphore.acquire()
+    response_chars = 0
+    try:
+        _in_flight += 1
+        logger.info(f"LLM calls in flight: {_in_flight}/{settings.LLM_MAX_CONCURRENCY} (streaming)")
+        # The stage covers the whole stream, including time the client spends reading it
+        with metrics.stage("llm"):
+            stream = await asyncio.wait_for(
+                model.generate_content_async(prompt, generation_config=generation_config, stream=True),
+                timeout=settings.LLM_TIMEOUT_SECONDS
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=settings.LLM_TIMEOUT_SECONDS)
+                except StopAsyncIteration:
+                    break
+                text = _response_text(chunk)
+                if not text:
+                    # Chunks without text (e.g. the final finish-reason chunk)
+                    continue
+                response_chars += len(text)
+                yield text
+    finally:
+        metrics.count_llm_io(len(prompt), response_chars)
+        _in_flight -= 1
+        _llm_semaphore.release()
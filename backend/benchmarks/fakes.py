@@ -0,0 +1,299 @@
+"""Local stand-ins for Gemini, Vision, Speech and Supabase REST with a latency model.
+
+The fakes are patched into the app by run_load.py; nothing here talks to Google
+or Supabase, so load tests do not spend quota.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+from google.api_core import exceptions as google_exceptions
+from google.cloud import speech, vision
+
+_random = random.Random()
+
+def seed(value: int) -> None:
+    """Make latency and error sampling reproducible"""
+    _random.seed(value)
+
+class LatencyModel:
+    """Latency and error distribution of one fake dependency"""
+
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0, error_rate: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """Parse "mean_ms[:jitter_ms[:error_rate]]", e.g. "1500:400:0.02" """
+        parts = [float(part) for part in spec.split(":")]
+        return cls(*parts)
+
+    def sample(self) -> float:
+        """Delay in seconds (normal distribution, never negative)"""
+        return max(0.0, _random.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self) -> bool:
+        return _random.random() < self.error_rate
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"mean_ms": self.mean_ms, "jitter_ms": self.jitter_ms, "error_rate": self.error_rate}
+
+FAKE_ANALYSIS = {
+    "summary": {
+        "overview": "Дружеская переписка двух участников",
+        "participants": 2,
+        "messageCount": 12,
+        "duration": "10 минут",
+        "mainTopics": ["Планы", "Работа", "Выходные"]
+    },
+    "emotionTimeline": {
+        "emotions": [
+            {"time": "00:00", "emotion": "Интерес 🤔", "intensity": 60, "color": "#3b82f6"},
+            {"time": "00:05", "emotion": "Радость 😊", "intensity": 80, "color": "#10b981"}
+        ],
+        "dominantEmotion": "Радость 😊",
+        "emotionalShifts": 1
+    },
+    "aiJudgeScore": {
+        "overallScore": 82,
+        "breakdown": {"clarity": 85, "empathy": 80, "professionalism": 75, "resolution": 88},
+        "verdict": "Открытое теплое общение",
+        "recommendation": "Продолжайте задавать уточняющие вопросы"
+    },
+    "subtleties": [
+        {"type": "Поддержка", "message": "Собеседник подхватывает шутки", "confidence": 78, "context": "Середина разговора"}
+    ]
+}
+
+FAKE_CHAT_REPLY = "Судя по анализу, разговор прошел дружелюбно 😊"
+FAKE_TRANSCRIPT = "Привет, как дела? Все хорошо, спасибо, а у тебя?"
+FAKE_OCR_TEXT = "Анна: Привет! Как прошли выходные?\nБорис: Отлично, ездили за город 🙂"
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class _FakeStream:
+    """Async iterator over response chunks with the inter-chunk delay spread evenly"""
+
+    def __init__(self, text: str, delay: float, chunks: int = 8):
+        size = max(1, len(text) // chunks)
+        self._parts = [text[i:i + size] for i in range(0, len(text), size)]
+        self._delay = delay / max(1, len(self._parts))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._parts:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._delay)
+        return _FakeResponse(self._parts.pop(0))
+
+class FakeGenerativeModel:
+    """Drop-in for vertexai GenerativeModel"""
+
+    latency = LatencyModel(1500, 300)
+    token_latency = LatencyModel(50, 10)
+
+    def __init__(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    @staticmethod
+    def _reply_for(prompt: str) -> str:
+        if "JSON" in prompt:
+            return "```json\n" + json.dumps(FAKE_ANALYSIS, ensure_ascii=False) + "\n```"
+        return FAKE_CHAT_REPLY
+
+    async def generate_content_async(self, prompt: str, generation_config=None, stream: bool = False, **kwargs):
+        if self.latency.should_fail():
+            await asyncio.sleep(self.latency.sample() / 4)
+            raise google_exceptions.ServiceUnavailable("fake Gemini error")
+        if stream:
+            return _FakeStream(self._reply_for(prompt), self.latency.sample())
+        await asyncio.sleep(self.latency.sample())
+        return _FakeResponse(self._reply_for(prompt))
+
+    async def count_tokens_async(self, contents: Any, **kwargs):
+        await asyncio.sleep(self.token_latency.sample())
+        return None
+
+def _text_annotation_response(text: str) -> vision.AnnotateImageResponse:
+    return vision.AnnotateImageResponse(text_annotations=[vision.EntityAnnotation(description=text)])
+
+class FakeVisionClient:
+    """Drop-in for vision.ImageAnnotatorClient (synchronous, like the real one)"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def _call(self) -> None:
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise google_exceptions.ServiceUnavailable("fake Vision error")
+
+    def batch_annotate_images(self, requests: List[Any], **kwargs) -> vision.BatchAnnotateImagesResponse:
+        self._call()
+        return vision.BatchAnnotateImagesResponse(
+            responses=[_text_annotation_response(FAKE_OCR_TEXT) for _ in requests]
+        )
+
+    def text_detection(self, image: Any, **kwargs) -> vision.AnnotateImageResponse:
+        self._call()
+        return _text_annotation_response(FAKE_OCR_TEXT)
+
+class FakeSpeechClient:
+    """Drop-in for speech.SpeechClient (synchronous, like the real one)"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def recognize(self, config: Any = None, audio: Any = None, **kwargs) -> speech.RecognizeResponse:
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise google_exceptions.ServiceUnavailable("fake Speech error")
+        return speech.RecognizeResponse(results=[
+            speech.SpeechRecognitionResult(alternatives=[
+                speech.SpeechRecognitionAlternative(transcript=FAKE_TRANSCRIPT, confidence=0.93)
+            ])
+        ])
+
+class FakeSupabase:
+    """Minimal in-memory PostgREST server for the tables the API uses.
+
+    Supports eq filters, order=<column>.desc, limit and Prefer: count=exact;
+    that is enough for history reads and inserts.
+    """
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSupabase":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def seed_history(self, user_id: str, count: int) -> None:
+        """Pre-populate analysis_history so list endpoints have something to page through"""
+        rows = self.tables.setdefault("analysis_history", [])
+        for i in range(count):
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "title": f"Анализ #{i}",
+                "date": datetime.fromtimestamp(1700000000 + i * 60, timezone.utc).isoformat(),
+                "file_type": "text",
+                "file_name": None,
+                "analysis_results": FAKE_ANALYSIS,
+                "dominant_emotion": "Радость 😊",
+                "overall_score": 82,
+                "message_count": 12,
+                "participants": 2
+            })
+
+    def _select(self, table: str, params: List[tuple]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """All rows matching the filters, and the requested page of them"""
+        with self._lock:
+            rows = list(self.tables.get(table, []))
+        limit = None
+        for key, value in params:
+            if value.startswith("eq."):
+                rows = [row for row in rows if str(row.get(key)) == value[3:]]
+            elif key == "order":
+                for part in reversed(value.split(",")):
+                    column, _, direction = part.partition(".")
+                    rows.sort(key=lambda row: str(row.get(column)), reverse=direction.startswith("desc"))
+            elif key == "limit":
+                limit = int(value)
+        return rows, (rows[:limit] if limit is not None else rows)
+
+    def _insert(self, table: str, payload: Any) -> List[Dict[str, Any]]:
+        items = payload if isinstance(payload, list) else [payload]
+        inserted = []
+        for item in items:
+            row = {"id": str(uuid.uuid4()), "date": datetime.now(timezone.utc).isoformat(), **item}
+            inserted.append(row)
+        with self._lock:
+            self.tables.setdefault(table, []).extend(inserted)
+        return inserted
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method: str) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw_body = self.rfile.read(length) if length else b""
+                time.sleep(fake.latency.sample())
+                if fake.latency.should_fail():
+                    self._respond(503, {"message": "fake Supabase error"})
+                    return
+
+                url = urlparse(self.path)
+                if not url.path.startswith("/rest/v1/"):
+                    self._respond(200, {})
+                    return
+                table = url.path[len("/rest/v1/"):]
+                params = parse_qsl(url.query)
+
+                if method == "GET":
+                    matched, page = fake._select(table, params)
+                    headers = {}
+                    if "count=exact" in (self.headers.get("Prefer") or ""):
+                        end = max(len(page) - 1, 0)
+                        headers["Content-Range"] = f"0-{end}/{len(matched)}"
+                    self._respond(200, page, headers)
+                elif method == "POST":
+                    payload = json.loads(raw_body or b"{}")
+                    self._respond(201, fake._insert(table, payload))
+                else:
+                    self._respond(200, [])
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        return Handler
@@ -0,0 +1,336 @@
+"""Offline load test: boots the FastAPI app in-process against local fakes.
+
+Usage (from backend/):
+
+    python -m benchmarks.run_load --rps 20 --duration 30 --output benchmarks/results/baseline.json
+
+Requests are issued open-loop at the target rate, so a slow server shows up as
+growing latency rather than as a lower offered load. The report contains
+throughput, p50/p95/p99 latency per scenario and event-loop lag.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from benchmarks import fakes
+
+BENCH_USER_ID = "00000000-0000-4000-8000-000000000001"
+
+def _png_bytes(nonce: str = "") -> bytes:
+    """A valid 1x1 PNG, built by hand so the harness needs no imaging library.
+
+    A nonce goes into a text chunk, so the same picture hashes differently.
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    pixels = zlib.compress(b"\x00\xff\xff\xff")
+    text = chunk(b"tEXt", b"Comment\x00" + nonce.encode("ascii")) if nonce else b""
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + text + chunk(b"IDAT", pixels) + chunk(b"IEND", b"")
+
+def _wav_bytes(seconds: float = 1.0, sample_rate: int = 16000, nonce: str = "") -> bytes:
+    """Silent 16-bit mono PCM WAV; a nonce goes into a trailing chunk that players skip"""
+    data = b"\x00\x00" * int(seconds * sample_rate)
+    extra = b""
+    if nonce:
+        note = nonce.encode("ascii")
+        note += b"\x00" * (len(note) % 2)
+        extra = b"note" + struct.pack("<I", len(note)) + note
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(data) + len(extra), b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", len(data)
+    )
+    return header + data + extra
+
+def _conversation(messages: int, nonce: str) -> str:
+    lines = []
+    for i in range(messages):
+        speaker = "Анна" if i % 2 == 0 else "Борис"
+        lines.append(f"{speaker}: сообщение {i} про планы на выходные, работу и погоду ({nonce})")
+    return "\n".join(lines)
+
+def _percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(percent / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _latency_summary(values_ms: List[float]) -> Dict[str, Any]:
+    values = sorted(values_ms)
+    return {
+        "p50_ms": _round(_percentile(values, 50)),
+        "p95_ms": _round(_percentile(values, 95)),
+        "p99_ms": _round(_percentile(values, 99)),
+        "mean_ms": _round(sum(values) / len(values)) if values else None,
+        "max_ms": _round(values[-1]) if values else None
+    }
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test against local fakes")
+    parser.add_argument("--rps", type=float, default=10.0, help="target requests per second (all scenarios)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument(
+        "--mix", default="text=4,upload_image=2,upload_audio=1,upload_multiple=1,history=4,chat=2",
+        help="scenario weights, e.g. text=4,history=2"
+    )
+    parser.add_argument("--gemini", default="1500:300:0", help="Gemini latency mean_ms:jitter_ms:error_rate")
+    parser.add_argument("--vision", default="400:100:0", help="Vision latency mean_ms:jitter_ms:error_rate")
+    parser.add_argument("--speech", default="800:200:0", help="Speech latency mean_ms:jitter_ms:error_rate")
+    parser.add_argument("--supabase", default="30:10:0", help="Supabase REST latency mean_ms:jitter_ms:error_rate")
+    parser.add_argument("--messages", type=int, default=40, help="messages per analyzed conversation")
+    parser.add_argument("--history-rows", type=int, default=500, help="history rows seeded for the benchmark user")
+    parser.add_argument("--cache", action="store_true", help="repeat identical texts and files so the analysis, OCR and transcript caches are exercised")
+    parser.add_argument("--seed", type=int, default=1, help="seed for latency / error sampling")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO / WARNING logs")
+    parser.add_argument("--output", default="benchmarks/results/baseline.json", help="where to write the JSON report")
+    return parser.parse_args(argv)
+
+def _configure_environment(args: argparse.Namespace, supabase_url: str, data_dir: str) -> None:
+    """Point settings at the fakes; must run before the app is imported"""
+    os.environ.update({
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_ANON_KEY": "bench-anon-key",
+        "SUPABASE_SERVICE_ROLE_KEY": "bench-service-key",
+        "VERTEX_AI_PROJECT": "bench-project",
+        "GOOGLE_APPLICATION_CREDENTIALS": "",
+        "LOCAL_DATA_DIR": data_dir,
+        "LLM_WARMUP_ON_STARTUP": "false",
+        "ANALYSIS_CACHE_ENABLED": "true" if args.cache else "false",
+        "OCR_CACHE_ENABLED": "true" if args.cache else "false",
+        "TRANSCRIPT_CACHE_ENABLED": "true" if args.cache else "false"
+    })
+
+def _patch_app(args: argparse.Namespace):
+    """Import the app and swap every external client for a fake"""
+    from app.main import app
+    from app.api.deps import get_current_user
+    from app.models.user import User
+    from app.services import ai_service, google_clients, vertex_llm
+
+    fakes.FakeGenerativeModel.latency = fakes.LatencyModel.parse(args.gemini)
+    vertex_llm.GenerativeModel = fakes.FakeGenerativeModel
+    vertex_llm._models.clear()
+    ai_service.vertex_ai_initialized = True
+
+    vision_client = fakes.FakeVisionClient(fakes.LatencyModel.parse(args.vision))
+    speech_client = fakes.FakeSpeechClient(fakes.LatencyModel.parse(args.speech))
+    google_clients._vision._factory = lambda: (vision_client, None)
+    google_clients._speech._factory = lambda: (speech_client, None)
+
+    bench_user = User(id=BENCH_USER_ID, email="bench@example.com", name="Bench", settings={})
+    app.dependency_overrides[get_current_user] = lambda: bench_user
+    return app
+
+Scenario = Callable[[Any, int], Awaitable[Any]]
+
+def _scenarios(args: argparse.Namespace) -> Dict[str, Scenario]:
+    def nonce(i: int) -> str:
+        return "repeat" if args.cache else f"{i}-{uuid.uuid4().hex[:8]}"
+
+    # Without --cache every file is new, so OCR and transcription run for each request
+    def png(i: int) -> bytes:
+        return _png_bytes("" if args.cache else nonce(i))
+
+    def wav(i: int) -> bytes:
+        return _wav_bytes(nonce="" if args.cache else nonce(i))
+
+    def text_for(i: int) -> str:
+        return _conversation(args.messages, nonce(i))
+
+    async def text(client, i):
+        return await client.post("/api/v1/analysis/text", json={"text": text_for(i)})
+
+    async def upload_image(client, i):
+        return await client.post(
+            "/api/v1/analysis/upload",
+            files={"file": (f"screenshot_{i}.png", png(i), "image/png")}
+        )
+
+    async def upload_audio(client, i):
+        return await client.post(
+            "/api/v1/analysis/upload",
+            files={"file": (f"call_{i}.wav", wav(i), "audio/wav")}
+        )
+
+    async def upload_multiple(client, i):
+        files = [("files", (f"part_{n}.png", png(i), "image/png")) for n in range(3)]
+        data = {"file_order": ["0", "1", "2"]}
+        return await client.post("/api/v1/analysis/upload-multiple", files=files, data=data)
+
+    async def history(client, i):
+        return await client.get("/api/v1/history/", params={"limit": 20})
+
+    async def chat(client, i):
+        return await client.post(
+            "/api/v1/analysis/chat",
+            json={"message": f"Что ты думаешь о разговоре? ({i})", "conversation_id": f"bench-{i % 50}"}
+        )
+
+    return {
+        "text": text,
+        "upload_image": upload_image,
+        "upload_audio": upload_audio,
+        "upload_multiple": upload_multiple,
+        "history": history,
+        "chat": chat
+    }
+
+def _schedule(mix: str, scenarios: Dict[str, Scenario]) -> List[str]:
+    """Deterministic weighted round-robin order of scenario names"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in scenarios:
+            raise SystemExit(f"Unknown scenario '{name}'. Available: {', '.join(scenarios)}")
+        weights[name] = int(weight or 1)
+    order = []
+    for round_index in range(max(weights.values())):
+        order.extend(name for name, weight in weights.items() if round_index < weight)
+    return order
+
+async def _monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Measure how late the event loop wakes a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - started - interval) * 1000)
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    fakes.seed(args.seed)
+    supabase = fakes.FakeSupabase(fakes.LatencyModel.parse(args.supabase)).start()
+    supabase.seed_history(BENCH_USER_ID, args.history_rows)
+    data_dir = tempfile.mkdtemp(prefix="gossipai-bench-")
+    _configure_environment(args, supabase.url, data_dir)
+    app = _patch_app(args)
+    scenarios = _scenarios(args)
+    order = _schedule(args.mix, scenarios)
+
+    results: Dict[str, Dict[str, Any]] = {name: {"latencies": [], "status_codes": {}, "errors": 0} for name in set(order)}
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+
+    async def issue(client, name: str, i: int) -> None:
+        started = time.perf_counter()
+        try:
+            response = await scenarios[name](client, i)
+            status = str(response.status_code)
+            failed = response.status_code >= 400
+        except Exception as e:
+            status = type(e).__name__
+            failed = True
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record = results[name]
+        record["latencies"].append(elapsed_ms)
+        record["status_codes"][status] = record["status_codes"].get(status, 0) + 1
+        record["errors"] += int(failed)
+
+    await app.router.startup()
+    monitor = asyncio.create_task(_monitor_loop_lag(lag_samples, stop))
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+            loop = asyncio.get_running_loop()
+            interval = 1 / args.rps
+            started = loop.time()
+            tasks = []
+            i = 0
+            while loop.time() - started < args.duration:
+                tasks.append(asyncio.create_task(issue(client, order[i % len(order)], i)))
+                i += 1
+                await asyncio.sleep(max(0.0, started + i * interval - loop.time()))
+            issued_for = loop.time() - started
+            await asyncio.gather(*tasks)
+            wall_time = loop.time() - started
+    finally:
+        stop.set()
+        await monitor
+        await app.router.shutdown()
+        supabase.stop()
+
+    all_latencies = [value for record in results.values() for value in record["latencies"]]
+    total_errors = sum(record["errors"] for record in results.values())
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {
+            "target_rps": args.rps,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "messages_per_text": args.messages,
+            "history_rows": args.history_rows,
+            "cache": args.cache,
+            "seed": args.seed,
+            "fakes": {
+                "gemini": fakes.LatencyModel.parse(args.gemini).to_dict(),
+                "vision": fakes.LatencyModel.parse(args.vision).to_dict(),
+                "speech": fakes.LatencyModel.parse(args.speech).to_dict(),
+                "supabase": fakes.LatencyModel.parse(args.supabase).to_dict()
+            }
+        },
+        "overall": {
+            "requests": len(all_latencies),
+            "errors": total_errors,
+            "offered_rps": _round(len(all_latencies) / issued_for),
+            "throughput_rps": _round(len(all_latencies) / wall_time),
+            "wall_time_s": _round(wall_time),
+            **_latency_summary(all_latencies)
+        },
+        "scenarios": {
+            name: {
+                "requests": len(record["latencies"]),
+                "errors": record["errors"],
+                "status_codes": record["status_codes"],
+                **_latency_summary(record["latencies"])
+            }
+            for name, record in sorted(results.items())
+        },
+        "event_loop_lag": {
+            "samples": len(lag_samples),
+            **_latency_summary(lag_samples)
+        }
+    }
+
+def _print_report(report: Dict[str, Any]) -> None:
+    overall = report["overall"]
+    print(f"\n{overall['requests']} requests, {overall['errors']} errors, "
+          f"{overall['throughput_rps']} req/s over {overall['wall_time_s']} s")
+    print(f"{'scenario':<18}{'n':>6}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in list(report["scenarios"].items()) + [("ALL", overall)]:
+        print(f"{name:<18}{stats['requests']:>6}{stats['errors']:>6}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    lag = report["event_loop_lag"]
+    print(f"event-loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if not args.verbose:
+        # Per-request INFO logs would dominate the run time and the output
+        logging.disable(logging.WARNING)
+    report = asyncio.run(run(args))
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    _print_report(report)
+    print(f"report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
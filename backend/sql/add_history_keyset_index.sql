@@ -0,0 +1,6 @@
+-- Composite index backing keyset pagination of GET /history/
+-- (WHERE user_id = ? ORDER BY date DESC, id DESC, resuming after a (date, id) cursor).
+-- CONCURRENTLY avoids locking analysis_history for writes while the index builds;
+-- run this statement outside of a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_analysis_history_user_date_id
+    ON analysis_history (user_id, date DESC, id DESC);